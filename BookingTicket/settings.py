@@ -44,9 +44,11 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'users.middleware.SessionRefreshMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.AutoLogoutMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -130,11 +132,16 @@ SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 SESSION_COOKIE_SECURE = False  # Set True in production with HTTPS
 SESSION_COOKIE_HTTPONLY = True  # Prevent XSS attacks
 SESSION_COOKIE_SAMESITE = 'Lax'  # CSRF protection
-SESSION_SAVE_EVERY_REQUEST = True 
+# Session lưu trong cookie đã ký: không ghi MariaDB ở mỗi request.
+# Cookie chỉ được gia hạn tối đa mỗi SESSION_REFRESH_INTERVAL giây (SessionRefreshMiddleware).
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_INTERVAL = 60
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 AUTO_LOGOUT_DELAY = 300
+AUTO_LOGOUT_REFRESH_INTERVAL = 30  # chỉ ghi lại last_activity sau mỗi 30 giây
 
 STATIC_URL = 'static/'
 
@@ -157,8 +164,7 @@ EMAIL_HOST_PASSWORD = 'hpwa swyw zwcu bjbe'
 DEFAULT_FROM_EMAIL = f'BookingTicket System <{EMAIL_HOST_USER}>'
 
 AUTHENTICATION_BACKENDS = [
-    'users.backends.EmailBackend', # Backend tùy chỉnh của chúng ta
-    'django.contrib.auth.backends.ModelBackend', # Giữ lại backend mặc định
+    'users.backends.EmailBackend', # Backend tùy chỉnh: email hoặc username, một query + một lần băm
 ]
 
 #Email Timeout
@@ -167,3 +173,57 @@ EMAIL_TIMEOUT = 60
 # Email verification settings
 EMAIL_VERIFICATION_EXPIRE_HOURS = 1  # Token expires after 24 hours
 PASSWORD_RESET_EXPIRE_HOURS = 1
+
+# Seat hold settings
+SEAT_HOLD_EXPIRE_MINUTES = 15  # Vé CHO_THANH_TOAN tự hủy sau 15 phút
+SEAT_HOLD_SWEEP_BATCH_SIZE = 1000
+CHUYEN_MAX_DURATION_HOURS = 72  # một chuyến không chạy quá 72 giờ (giới hạn đoạn index khi kiểm tra trùng xe)
+SCHEDULE_BULK_BATCH_SIZE = 1000  # số chuyến mỗi câu INSERT khi tạo lịch chạy định kỳ
+TIMETABLE_IMPORT_BATCH_SIZE = 1000  # số dòng mỗi transaction khi nhập file tuyến / xe / chuyến
+
+# Thanh toán: callback của cổng được xếp hàng rồi worker process_payment_callbacks xác nhận
+PAYMENT_CALLBACK_SECRET = None  # khoá HMAC dùng chung với cổng thanh toán; None thì dùng SECRET_KEY
+PAYMENT_CALLBACK_BATCH_SIZE = 100
+PAYMENT_CALLBACK_MAX_ATTEMPTS = 8  # thử lại sau 2, 4, 8, ... giây (callback có thể tới trước giao dịch)
+PAYMENT_RECONCILE_BATCH_SIZE = 5000  # số dòng file quyết toán mỗi transaction (python manage.py reconcile_payments)
+
+# Dashboard đọc bảng thống kê ngày (worker: python manage.py refresh_daily_stats --interval 60)
+DASHBOARD_STATS_LOOKBACK_SECONDS = 300  # lùi mốc tổng hợp để không sót transaction commit muộn
+
+# Phân tích lấp đầy / đường cong đặt vé (booking.analytics, dùng numpy nếu có cài)
+ANALYTICS_HORIZON_DAYS = 30  # đường cong tính từ 30 ngày trước khởi hành
+ANALYTICS_CACHE_TIMEOUT = 86400  # giây, số liệu các ngày đã qua
+
+# Cache
+# Production nên trỏ 'default' tới Redis/Memcached dùng chung giữa các worker, ví dụ:
+# {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bookingticket',
+    }
+}
+BOOKING_CACHE_ALIAS = 'default'
+BOOKING_CACHE_TIMEOUT = 60       # giây, tầng cache dùng chung
+BOOKING_CACHE_LOCAL_TTL = 5      # giây, tầng LRU trong từng process
+BOOKING_CACHE_LOCAL_SIZE = 1024
+
+# Email outbox (worker: python manage.py send_queued_emails --interval 5)
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 600  # giây, email SENDING quá hạn này (worker chết) được gửi lại
+
+# True: link xác thực / reset dùng token ký HMAC (không ghi bảng EmailVerification / PasswordReset)
+STATELESS_TOKENS = False
+
+# Rate limit cho các view nhạy cảm (users.ratelimit), đơn vị: s / m / h / d
+RATELIMIT_ENABLED = True
+RATELIMIT_CACHE_ALIAS = 'default'
+RATELIMIT_IP_HEADER = None  # ví dụ 'HTTP_X_FORWARDED_FOR' khi chạy sau reverse proxy
+RATELIMIT_TRUSTED_PROXIES = 1  # số reverse proxy tin cậy nối thêm vào RATELIMIT_IP_HEADER
+RATELIMITS = {
+    'login': {'ip': '30/m', 'email': '5/m'},
+    'register': {'ip': '10/h'},
+    'resend_verification': {'ip': '10/h', 'email': '3/h'},
+    'password_reset': {'ip': '10/h', 'email': '3/h'},
+}
@@ -0,0 +1,82 @@
+"""
+Tiện ích chung cho các benchmark.
+
+Mỗi benchmark tạo một database test riêng (giống `manage.py test`) nên không
+đụng tới dữ liệu thật. Chạy từ thư mục gốc của project, ví dụ:
+
+    python -m benchmarks.search --trips 1000000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "BookingTicket.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+
+def make_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--keepdb", action="store_true", help="Giữ lại database test giữa các lần chạy.")
+    return parser
+
+
+@contextmanager
+def test_database(keepdb=False):
+    """Tạo database test, trả lại database gốc khi xong."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+@contextmanager
+def timer():
+    """`with timer() as t: ...` rồi đọc `t()` để lấy số giây đã chạy."""
+    start = time.perf_counter()
+    end = None
+
+    def elapsed():
+        return (end if end is not None else time.perf_counter()) - start
+
+    try:
+        yield elapsed
+    finally:
+        end = time.perf_counter()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    k = max(0, min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def report_latency(label, samples):
+    """In p50/p99/trung bình (ms) của danh sách thời gian tính bằng giây."""
+    ms = [s * 1000 for s in samples]
+    print(
+        f"{label}: n={len(ms)} p50={percentile(ms, 50):.3f}ms "
+        f"p99={percentile(ms, 99):.3f}ms mean={statistics.fmean(ms):.3f}ms"
+    )
+
+
+def report_rate(label, count, seconds, unit="ops"):
+    print(f"{label}: {count} {unit} trong {seconds:.3f}s ({count / seconds:,.0f} {unit}/s)")
@@ -0,0 +1,98 @@
+"""
+Đường cong đặt vé / tỉ lệ lấp đầy trên dữ liệu giả lập một năm (mặc định
+10 tuyến x 10 chuyến/ngày x 365 ngày, ~10 vé/chuyến đặt rải rác trong 45
+ngày trước khởi hành): đo booking_curves() khi chưa có cache (numpy và
+vòng lặp Python), khi đã có cache, và cách cũ duyệt từng chuyến lấy
+so_ve_con_lai (chỉ ra được tỉ lệ lấp đầy, không có đường cong).
+"""
+import random
+from itertools import islice
+
+from benchmarks._common import make_parser, report_rate, test_database, timer
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--routes", type=int, default=10)
+    parser.add_argument("--trips-per-day", type=int, default=10)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--tickets-per-trip", type=int, default=10)
+    args = parser.parse_args()
+
+    from datetime import timedelta
+    from unittest import mock
+
+    from django.conf import settings
+    from django.test.utils import override_settings
+    from django.utils import timezone
+
+    from booking import analytics
+    from booking.models import Chuyen, Tuyen, Ve, Xe
+    from users.models import KhachHang
+
+    # LocMem mặc định chỉ giữ 300 key, ít hơn số (tuyến, ngày) của một năm
+    caches = {alias: {**conf, "OPTIONS": {**conf.get("OPTIONS", {}), "MAX_ENTRIES": 100000}}
+              for alias, conf in settings.CACHES.items()}
+    with test_database(args.keepdb), override_settings(CACHES=caches):
+        tuyen = Tuyen.objects.bulk_create(
+            Tuyen(diem_di="Hà Nội", diem_den=f"Điểm {i}") for i in range(args.routes)
+        )
+        xe = Xe.objects.create(bien_so="29B-00001", loai_xe="Giường nằm", so_ghe=40)
+        khach = KhachHang.objects.create(ten="Khách", so_dien_thoai="0900000000", email="khach@example.com")
+        hom_nay = timezone.localdate()
+        tu_ngay = hom_nay - timedelta(days=args.days)
+        den_ngay = hom_nay - timedelta(days=1)
+        bat_dau = timezone.now() - timedelta(days=args.days)
+        rnd = random.Random(1)
+
+        chuyen = (
+            Chuyen(tuyen=t, xe=xe, tong_so_ve=40, gia_ve=150000,
+                   ngay_gio_khoi_hanh=bat_dau + timedelta(days=d, hours=h * 24 / args.trips_per_day),
+                   so_ve_da_ban=args.tickets_per_trip)
+            for d in range(args.days) for t in tuyen for h in range(args.trips_per_day)
+        )
+        # Giữ nguyên thoi_gian_dat giả lập (auto_now_add sẽ ghi đè khi bulk_create)
+        thoi_gian_dat = Ve._meta.get_field("thoi_gian_dat")
+        thoi_gian_dat.auto_now_add = False
+        try:
+            with timer() as t:
+                while lo := list(islice(chuyen, 5000)):
+                    lo = Chuyen.objects.bulk_create(lo)
+                    Ve.objects.bulk_create(
+                        Ve(chuyen=c, khach=khach, so_luong=1, trang_thai="DA_THANH_TOAN",
+                           thoi_gian_dat=c.ngay_gio_khoi_hanh - timedelta(hours=rnd.expovariate(1 / 240)))
+                        for c in lo for _ in range(args.tickets_per_trip)
+                    )
+        finally:
+            thoi_gian_dat.auto_now_add = True
+        so_chuyen = Chuyen.objects.count()
+        report_rate("Tạo dữ liệu", Ve.objects.count(), t(), "vé")
+
+        tuyen_ids = [t.pk for t in tuyen]
+        lan_chay = [("numpy", analytics.np)] if analytics.np is not None else []
+        lan_chay.append(("Python", None))
+        for ten, np in lan_chay:
+            analytics.analytics_cache.clear()
+            analytics.analytics_cache.shared.clear()
+            with mock.patch.object(analytics, "np", np), timer() as t:
+                ket_qua = analytics.booking_curves(tuyen_ids, tu_ngay, den_ngay)
+            report_rate(f"booking_curves chưa cache ({ten})", so_chuyen, t(), "chuyến")
+
+        with timer() as t:
+            analytics.booking_curves(tuyen_ids, tu_ngay, den_ngay)
+        print(f"booking_curves đã cache: {t() * 1000:.1f}ms")
+
+        with timer() as t:
+            lap_day = {}
+            for c in Chuyen.objects.filter(tuyen_id__in=tuyen_ids):
+                ban, ghe = lap_day.get(c.tuyen_id, (0, 0))
+                lap_day[c.tuyen_id] = (ban + c.tong_so_ve - c.so_ve_con_lai, ghe + c.tong_so_ve)
+        report_rate("Duyệt từng chuyến (so_ve_con_lai)", so_chuyen, t(), "chuyến")
+
+        mot_tuyen = ket_qua[tuyen_ids[0]]
+        print(f"Tuyến 1: lấp đầy {mot_tuyen['ty_le_lap_day']:.1%}, "
+              f"đã bán 7 ngày trước: {mot_tuyen['duong_cong'][7]:.1%}, 30 ngày trước: {mot_tuyen['duong_cong'][30]:.1%}")
+
+
+if __name__ == "__main__":
+    main()
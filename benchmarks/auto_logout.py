@@ -0,0 +1,47 @@
+"""Chi phí (micro giây) mỗi request của AutoLogoutMiddleware và số query / lần ghi session."""
+import time
+
+from benchmarks._common import make_parser
+
+from django.contrib.auth import SESSION_KEY  # noqa: E402 (sau django.setup())
+from django.contrib.sessions.backends.signed_cookies import SessionStore  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from users.middleware import AutoLogoutMiddleware  # noqa: E402
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--requests", type=int, default=100_000)
+    args = parser.parse_args()
+
+    middleware = AutoLogoutMiddleware(lambda request: HttpResponse())
+    factory = RequestFactory()
+    session = SessionStore()
+    session[SESSION_KEY] = "1"
+    session["last_activity"] = time.time()
+    requests = []
+    for _ in range(args.requests):
+        request = factory.get("/")
+        request.session = session
+        requests.append(request)
+
+    writes = 0
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        for request in requests:
+            session.modified = False
+            middleware(request)
+            writes += session.modified
+        elapsed = time.perf_counter() - start
+    print(
+        f"AutoLogoutMiddleware: {elapsed / args.requests * 1e6:.2f} µs/request, "
+        f"{len(queries.captured_queries)} query, {writes} lần đánh dấu ghi session / {args.requests} request"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Dashboard: tạo lịch chạy một năm (mặc định 100 chuyến/ngày x 365 ngày, mỗi
+chuyến 5 vé đã thanh toán), đo lần tổng hợp đầy đủ, lần tổng hợp tăng dần
+sau khi bán vé trên một ngày, và thời gian đọc dashboard so với báo cáo
+doanh thu quét thẳng ThanhToan.
+"""
+import time
+
+from benchmarks._common import make_parser, report_latency, report_rate, test_database, timer
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--trips-per-day", type=int, default=100)
+    parser.add_argument("--tickets-per-trip", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from datetime import timedelta
+    from itertools import islice
+
+    from django.test.utils import override_settings
+    from django.utils import timezone
+
+    from booking.models import Chuyen, ThanhToan, Tuyen, Ve, Xe
+    from booking.payments import confirm_payment, create_payment
+    from booking.reports import dashboard_stats, refresh_daily_stats, revenue_by_route
+    from booking.services import reserve_seats
+    from users.models import KhachHang
+
+    with test_database(args.keepdb):
+        tuyen = Tuyen.objects.bulk_create(Tuyen(diem_di="Hà Nội", diem_den=f"Điểm {i}") for i in range(20))
+        xe = Xe.objects.bulk_create(
+            Xe(bien_so=f"29B-{i:05d}", loai_xe="Giường nằm", so_ghe=40) for i in range(args.trips_per_day)
+        )
+        khach = KhachHang.objects.create(ten="Khách", so_dien_thoai="0900000000", email="khach@example.com")
+        bat_dau = timezone.now() + timedelta(hours=1)
+        with timer() as t:
+            chuyen = (
+                Chuyen(tuyen=tuyen[i % len(tuyen)], xe=xe[i % len(xe)], tong_so_ve=40, gia_ve=150000,
+                       ngay_gio_khoi_hanh=bat_dau + timedelta(days=i // args.trips_per_day),
+                       so_ve_da_ban=args.tickets_per_trip)
+                for i in range(args.days * args.trips_per_day)
+            )
+            while lo := list(islice(chuyen, 5000)):
+                # bulk_create bỏ qua Ve.save() nên bộ đếm được đặt sẵn ở trên
+                lo = Chuyen.objects.bulk_create(lo)
+                ves = Ve.objects.bulk_create(
+                    Ve(chuyen=c, khach=khach, so_luong=1, trang_thai="DA_THANH_TOAN")
+                    for c in lo for _ in range(args.tickets_per_trip)
+                )
+                ThanhToan.objects.bulk_create(
+                    ThanhToan(ve=ve, phuong_thuc="Thẻ", ma_giao_dich=f"GD{ve.pk}", trang_thai="THANH_CONG", so_tien=150000)
+                    for ve in ves
+                )
+        so_ve = Ve.objects.count()
+        report_rate("Tạo dữ liệu", so_ve, t(), "vé")
+
+        with timer() as t:
+            so_ngay = refresh_daily_stats(full=True)
+        print(f"Tổng hợp đầy đủ {so_ngay} ngày: {t():.2f}s")
+
+        # Bán thêm vé trên chuyến của một ngày rồi tổng hợp tăng dần
+        for i, c in enumerate(Chuyen.objects.order_by("ngay_gio_khoi_hanh")[args.trips_per_day * 10:][:10]):
+            create_payment(reserve_seats(c, khach, 1), "Thẻ", f"MOI{i}")
+            confirm_payment(f"MOI{i}")
+        # Dữ liệu vừa tạo đều nằm trong khoảng lùi mốc mặc định, nên tắt để đo đúng phần tăng dần
+        with override_settings(DASHBOARD_STATS_LOOKBACK_SECONDS=0), timer() as t:
+            so_ngay = refresh_daily_stats()
+        print(f"Tổng hợp tăng dần {so_ngay} ngày: {t() * 1000:.1f}ms")
+
+        hom_nay = timezone.localdate()
+        for label, fn in [
+            ("dashboard_stats (30 ngày)", lambda: dashboard_stats(hom_nay, hom_nay + timedelta(days=29))),
+            ("revenue_by_route (quét ThanhToan)", lambda: revenue_by_route()),
+        ]:
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                fn()
+                samples.append(time.perf_counter() - start)
+            report_latency(label, samples)
+
+
+if __name__ == "__main__":
+    main()
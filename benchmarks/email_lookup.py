@@ -0,0 +1,51 @@
+"""So sánh tra cứu tài khoản theo email: cột email (không index) và email_normalized (unique index)."""
+import random
+
+from benchmarks._common import make_parser, report_latency, test_database, timer
+
+
+def seed(so_tai_khoan, batch_size=10_000):
+    from users.models import Account
+
+    batch = []
+    for i in range(so_tai_khoan):
+        email = f"User{i}@Example.com"
+        batch.append(Account(
+            username=f"user{i}", email=email, email_normalized=email.lower(), password="!",
+        ))
+        if len(batch) >= batch_size:
+            Account.objects.bulk_create(batch)
+            batch = []
+    Account.objects.bulk_create(batch)
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--accounts", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    from users.models import Account
+
+    with test_database(args.keepdb):
+        with timer() as t:
+            seed(args.accounts)
+        print(f"Seed {args.accounts} tài khoản trong {t():.1f}s")
+
+        rng = random.Random(42)
+        emails = [f"user{rng.randrange(args.accounts)}@example.com" for _ in range(args.queries)]
+
+        cu, moi = [], []
+        for email in emails:
+            with timer() as t:
+                Account.objects.filter(email__iexact=email).first()
+            cu.append(t())
+            with timer() as t:
+                Account.objects.filter(email_normalized=Account.normalize_email_key(email)).first()
+            moi.append(t())
+        report_latency("email__iexact (quét bảng)", cu)
+        report_latency("email_normalized (unique index)", moi)
+
+
+if __name__ == "__main__":
+    main()
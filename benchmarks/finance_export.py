@@ -0,0 +1,64 @@
+"""
+Xuất CSV vé / thanh toán cho kế toán: tạo N vé + thanh toán (mặc định 1 triệu)
+rồi xuất toàn bộ, đo số dòng/giây và RSS cao nhất của process.
+"""
+import os
+import resource
+from itertools import islice
+
+from benchmarks._common import make_parser, report_rate, test_database, timer
+
+
+def peak_rss_mb():
+    # Linux trả về KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from booking.exports import iter_export
+    from booking.models import Chuyen, ThanhToan, Tuyen, Ve, Xe
+    from users.models import KhachHang
+
+    with test_database(args.keepdb):
+        tuyen = Tuyen.objects.create(diem_di="Hà Nội", diem_den="Hải Phòng")
+        xe = Xe.objects.create(bien_so="29B-00001", loai_xe="Giường nằm", so_ghe=40)
+        chuyen = Chuyen.objects.create(
+            tuyen=tuyen, xe=xe, ngay_gio_khoi_hanh=timezone.now() + timedelta(days=1),
+            tong_so_ve=40, gia_ve=150000,
+        )
+        khach = KhachHang.objects.create(ten="Khách", so_dien_thoai="0900000000", email="khach@example.com")
+
+        # Ghi thẳng bằng bulk_create (bỏ qua bộ đếm vé) theo lô để không giữ cả bảng trong bộ nhớ
+        ves = (Ve(chuyen=chuyen, khach=khach, so_luong=1, trang_thai="DA_THANH_TOAN") for _ in range(args.rows))
+        with timer() as t:
+            while lo := list(islice(ves, 10_000)):
+                lo = Ve.objects.bulk_create(lo)
+                ThanhToan.objects.bulk_create(
+                    ThanhToan(ve=ve, phuong_thuc="Thẻ", ma_giao_dich=f"GD{ve.pk}", trang_thai="THANH_CONG", so_tien=150000)
+                    for ve in lo
+                )
+        report_rate("Tạo dữ liệu", args.rows, t(), "vé")
+
+        hom_nay = timezone.localdate()
+        for kind in ("ve", "thanh_toan"):
+            truoc = peak_rss_mb()
+            so_dong = -1  # bỏ header
+            with open(os.devnull, "w", encoding="utf-8") as output, timer() as t:
+                for line in iter_export(kind, hom_nay, hom_nay, batch_size=args.batch_size, bom=False):
+                    output.write(line)
+                    so_dong += 1
+            report_rate(f"Xuất {kind}", so_dong, t(), "dòng")
+            print(f"RSS cao nhất: {peak_rss_mb():.1f} MB (trước khi xuất {truoc:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
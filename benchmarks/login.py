@@ -0,0 +1,63 @@
+"""
+CPU cho mỗi lần authenticate(): cấu hình cũ (EmailBackend cũ + ModelBackend)
+so với EmailBackend hợp nhất hiện tại, cho ba trường hợp đúng / sai mật khẩu /
+không có tài khoản.
+"""
+import time
+
+from benchmarks._common import make_parser, test_database
+
+from django.contrib.auth.backends import ModelBackend  # noqa: E402 (sau django.setup())
+
+
+class LegacyEmailBackend(ModelBackend):
+    """Bản sao EmailBackend trước khi hợp nhất, chỉ dùng để so sánh."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        from django.contrib.auth import get_user_model
+
+        UserModel = get_user_model()
+        try:
+            user = UserModel.objects.get(email=username)
+        except UserModel.DoesNotExist:
+            return None
+        if user.check_password(password):
+            return user
+        return None
+
+
+CAU_HINH = {
+    "cũ (2 backend)": ["benchmarks.login.LegacyEmailBackend", "django.contrib.auth.backends.ModelBackend"],
+    "mới (EmailBackend)": ["users.backends.EmailBackend"],
+}
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--attempts", type=int, default=20)
+    args = parser.parse_args()
+
+    from django.contrib.auth import authenticate
+    from django.test import override_settings
+
+    from users.models import Account
+
+    with test_database(args.keepdb):
+        Account.objects.create_user(username="an@example.com", email="an@example.com", password="matkhau123")
+        truong_hop = {
+            "đúng mật khẩu": ("an@example.com", "matkhau123"),
+            "sai mật khẩu": ("an@example.com", "sai"),
+            "không có tài khoản": ("khongco@example.com", "sai"),
+        }
+        for ten_cau_hinh, backends in CAU_HINH.items():
+            with override_settings(AUTHENTICATION_BACKENDS=backends):
+                for ten, (email, password) in truong_hop.items():
+                    start = time.process_time()
+                    for _ in range(args.attempts):
+                        authenticate(username=email, password=password)
+                    cpu = (time.process_time() - start) / args.attempts * 1000
+                    print(f"{ten_cau_hinh:20} {ten:20} {cpu:8.2f} ms CPU/lần")
+
+
+if __name__ == "__main__":
+    main()
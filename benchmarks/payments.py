@@ -0,0 +1,76 @@
+"""
+Xác nhận thanh toán: đặt N vé trên nhiều chuyến, tạo giao dịch rồi đo
+(1) confirm_payment gọi trực tiếp (độ trễ từng lần) và (2) cổng giả lập gửi
+mỗi callback 2 lần qua hàng đợi, worker process_callbacks xác nhận (số xác
+nhận / giây, tính cả callback trùng bị bỏ qua).
+"""
+from benchmarks._common import make_parser, report_latency, report_rate, test_database, timer
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--tickets", type=int, default=5000)
+    parser.add_argument("--trips", type=int, default=100)
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    import time
+    from datetime import timedelta
+    from itertools import cycle
+
+    from django.utils import timezone
+
+    from booking.gateway import FakeGateway
+    from booking.models import Chuyen, ThanhToan, Tuyen, Ve, Xe
+    from booking.payments import confirm_payment, create_payment, process_callbacks
+    from booking.services import reserve_seats
+    from users.models import KhachHang
+
+    with test_database(args.keepdb):
+        tuyen = Tuyen.objects.create(diem_di="Hà Nội", diem_den="Đà Nẵng")
+        xe = Xe.objects.create(bien_so="29B-00001", loai_xe="Giường nằm", so_ghe=45)
+        khoi_hanh = timezone.now() + timedelta(days=1)
+        Chuyen.objects.bulk_create(
+            Chuyen(tuyen=tuyen, xe=xe, ngay_gio_khoi_hanh=khoi_hanh + timedelta(days=i), gia_ve=350000,
+                   tong_so_ve=args.tickets // args.trips + 1)
+            for i in range(args.trips)
+        )
+        khach = KhachHang.objects.create(ten="Khách", so_dien_thoai="0900000000", email="khach@example.com")
+        chuyen = cycle(Chuyen.objects.all())
+        ve_ids = [reserve_seats(next(chuyen), khach, 1).pk for _ in range(args.tickets)]
+        nua = len(ve_ids) // 2
+
+        # 1. Gọi trực tiếp
+        for i, pk in enumerate(ve_ids[:nua]):
+            create_payment(pk, "Thẻ", f"GD{i}")
+        samples = []
+        with timer() as t:
+            for i in range(nua):
+                start = time.perf_counter()
+                confirm_payment(f"GD{i}")
+                samples.append(time.perf_counter() - start)
+        report_rate("confirm_payment", nua, t(), "giao dịch")
+        report_latency("confirm_payment", samples)
+
+        # 2. Callback qua hàng đợi, mỗi callback gửi 2 lần
+        gateway = FakeGateway(ty_le_loi=args.fail_rate, so_lan_gui=2, seed=1)
+        for i, pk in enumerate(ve_ids[nua:], start=nua):
+            gateway.charge(create_payment(pk, "Thẻ", f"GD{i}"))
+        so_callback = 2 * (len(ve_ids) - nua)
+        with timer() as t:
+            xong = 0
+            while True:
+                done, failed = process_callbacks(batch_size=500)
+                xong += done
+                if not done and not failed:
+                    break
+        report_rate("process_callbacks (2 callback / giao dịch)", xong, t(), "callback")
+
+        assert xong == so_callback
+        assert Ve.objects.filter(trang_thai="DA_THANH_TOAN").count() == ThanhToan.objects.filter(trang_thai="THANH_CONG").count()
+        print(f"Thành công {ThanhToan.objects.filter(trang_thai='THANH_CONG').count()}, "
+              f"thất bại {ThanhToan.objects.filter(trang_thai='THAT_BAI').count()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Đối soát file quyết toán: tạo N thanh toán CHO_XU_LY (mặc định 1 triệu) rồi
+đối soát một file CSV N dòng (phần lớn thành công, một ít thất bại, một ít
+mã không tồn tại hoặc sai số tiền), đo số dòng/giây và RSS cao nhất.
+"""
+import os
+import random
+import resource
+import tempfile
+from itertools import islice
+
+from benchmarks._common import make_parser, report_rate, test_database, timer
+
+
+def peak_rss_mb():
+    # Linux trả về KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--tickets-per-trip", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+
+    from datetime import timedelta
+
+    from django.db.models import Count
+    from django.utils import timezone
+
+    from booking.models import Chuyen, ThanhToan, Tuyen, Ve, Xe
+    from booking.reconciliation import reconcile_file
+    from users.models import KhachHang
+
+    with test_database(args.keepdb):
+        tuyen = Tuyen.objects.create(diem_di="Hà Nội", diem_den="Hải Phòng")
+        xe = Xe.objects.create(bien_so="29B-00001", loai_xe="Giường nằm", so_ghe=40)
+        so_chuyen = -(-args.rows // args.tickets_per_trip)
+        khoi_hanh = timezone.now() + timedelta(days=1)
+        chuyen = Chuyen.objects.bulk_create(
+            Chuyen(tuyen=tuyen, xe=xe, ngay_gio_khoi_hanh=khoi_hanh + timedelta(days=i),
+                   tong_so_ve=args.tickets_per_trip, gia_ve=150000)
+            for i in range(so_chuyen)
+        )
+        khach = KhachHang.objects.create(ten="Khách", so_dien_thoai="0900000000", email="khach@example.com")
+
+        # bulk_create bỏ qua bộ đếm vé nên đặt lại so_ve_dang_giu sau khi tạo
+        ves = (Ve(chuyen=chuyen[i // args.tickets_per_trip], khach=khach, so_luong=1) for i in range(args.rows))
+        with timer() as t:
+            while lo := list(islice(ves, 10_000)):
+                lo = Ve.objects.bulk_create(lo)
+                ThanhToan.objects.bulk_create(
+                    ThanhToan(ve=ve, phuong_thuc="Thẻ", ma_giao_dich=f"GD{ve.pk}", so_tien=150000) for ve in lo
+                )
+            for chuyen_id, so in Ve.objects.values_list("chuyen_id").annotate(so=Count("id")):
+                Chuyen.objects.filter(pk=chuyen_id).update(so_ve_dang_giu=so)
+        report_rate("Tạo dữ liệu", args.rows, t(), "thanh toán")
+
+        rnd = random.Random(1)
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8") as f:
+            f.write("ma_giao_dich,trang_thai,so_tien\n")
+            for pk in ThanhToan.objects.values_list("ve_id", flat=True).iterator(chunk_size=10_000):
+                r = rnd.random()
+                if r < 0.005:
+                    f.write(f"KHONG{pk},THANH_CONG,150000\n")
+                elif r < 0.01:
+                    f.write(f"GD{pk},THANH_CONG,1\n")
+                else:
+                    f.write(f"GD{pk},{'THAT_BAI' if r < 0.05 else 'THANH_CONG'},150000\n")
+        try:
+            truoc = peak_rss_mb()
+            with open(f.name, encoding="utf-8", newline="") as stream, timer() as t:
+                result = reconcile_file(stream, batch_size=args.batch_size)
+            report_rate("Đối soát", result.rows, t(), "dòng")
+            print(f"Xác nhận {result.confirmed}, thất bại {result.failed}, lệch {dict(result.mismatch_count)}")
+            print(f"RSS cao nhất: {peak_rss_mb():.1f} MB (trước khi đối soát {truoc:.1f} MB)")
+        finally:
+            os.unlink(f.name)
+
+        assert Ve.objects.filter(trang_thai="DA_THANH_TOAN").count() == result.confirmed
+        assert not Chuyen.objects.filter(so_ve_dang_giu__lt=0).exists()
+
+
+if __name__ == "__main__":
+    main()
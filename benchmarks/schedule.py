@@ -0,0 +1,55 @@
+"""
+Tạo lịch chạy định kỳ hàng loạt: mỗi xe một lịch chạy hằng ngày, tổng số
+chuyến = số xe x số ngày (mặc định 100 x 1000 = 100k chuyến), sau đó rà
+soát trùng xe trên toàn bộ lịch.
+"""
+from benchmarks._common import make_parser, report_rate, test_database, timer
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--vehicles", type=int, default=100)
+    parser.add_argument("--days", type=int, default=1000)
+    args = parser.parse_args()
+
+    from datetime import time, timedelta
+    from decimal import Decimal
+
+    from django.utils import timezone
+
+    from booking.models import Chuyen, Tuyen, Xe
+    from booking.services import audit_vehicle_overlaps, generate_schedule
+
+    with test_database(args.keepdb):
+        tuyen = Tuyen.objects.create(diem_di="Hà Nội", diem_den="Đà Nẵng")
+        Xe.objects.bulk_create(
+            Xe(bien_so=f"29B-{i:05d}", loai_xe="Giường nằm", so_ghe=40) for i in range(args.vehicles)
+        )
+        tu_ngay = timezone.localdate() + timedelta(days=1)
+        den_ngay = tu_ngay + timedelta(days=args.days - 1)
+
+        tong = 0
+        with timer() as t:
+            for xe in Xe.objects.all():
+                tong += generate_schedule(
+                    tuyen, xe, time(6, 0), range(7), tu_ngay, den_ngay, Decimal("350000"),
+                    thoi_gian_chay=timedelta(hours=14),
+                )
+        report_rate("Tạo lịch chạy", tong, t(), "chuyến")
+
+        # Chạy lại cùng lịch: toàn bộ bị chặn bởi kiểm tra trùng xe
+        xe = Xe.objects.first()
+        with timer() as t:
+            try:
+                generate_schedule(tuyen, xe, time(6, 0), range(7), tu_ngay, den_ngay, 350000)
+            except Exception as e:
+                print(f"Phát hiện trùng lịch sau {t() * 1000:.1f}ms: {str(e)[:80]}...")
+        assert Chuyen.objects.count() == tong
+
+        with timer() as t:
+            so_cap = sum(1 for _ in audit_vehicle_overlaps())
+        report_rate(f"Rà soát trùng xe ({so_cap} cặp)", tong, t(), "chuyến")
+
+
+if __name__ == "__main__":
+    main()
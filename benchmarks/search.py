@@ -0,0 +1,78 @@
+"""Đo độ trễ search_trips trên một lịch chạy lớn (p50/p99) và in query plan."""
+import random
+from datetime import timedelta
+
+from benchmarks._common import make_parser, report_latency, test_database, timer
+
+
+def seed(so_tuyen, so_chuyen, batch_size=5000):
+    from django.utils import timezone
+
+    from booking.models import Chuyen, Tuyen, Xe
+
+    tuyens = Tuyen.objects.bulk_create(
+        [Tuyen(diem_di=f"Bến {i}", diem_den=f"Bến {i + 1}") for i in range(so_tuyen)]
+    )
+    xe = Xe.objects.create(bien_so="BENCH-001", loai_xe="Giường nằm", so_ghe=45)
+    bat_dau = timezone.now() + timedelta(hours=1)
+    batch = []
+    for i in range(so_chuyen):
+        batch.append(Chuyen(
+            tuyen=tuyens[i % so_tuyen], xe=xe,
+            ngay_gio_khoi_hanh=bat_dau + timedelta(minutes=15 * (i // so_tuyen)),
+            tong_so_ve=40, gia_ve=100000 + (i % 50) * 1000,
+            so_ve_da_ban=i % 41,
+        ))
+        if len(batch) >= batch_size:
+            Chuyen.objects.bulk_create(batch)
+            batch = []
+    Chuyen.objects.bulk_create(batch)
+    return tuyens
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--routes", type=int, default=200)
+    parser.add_argument("--trips", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    from django.utils import timezone
+
+    from booking.services import search_trips
+
+    with test_database(args.keepdb):
+        with timer() as t:
+            tuyens = seed(args.routes, args.trips)
+        print(f"Seed {args.trips} chuyến / {args.routes} tuyến trong {t():.1f}s")
+
+        rng = random.Random(42)
+        hom_nay = timezone.localdate()
+        so_ngay = max(1, args.trips // args.routes // 96)
+        trang_dau, trang_sau = [], []
+        for _ in range(args.queries):
+            tuyen = rng.choice(tuyens)
+            tu_ngay = hom_nay + timedelta(days=rng.randrange(so_ngay))
+            params = dict(tu_ngay=tu_ngay, den_ngay=tu_ngay + timedelta(days=2), so_ve=2, gia_den=140000)
+            with timer() as t:
+                _, moc = search_trips(tuyen.diem_di, tuyen.diem_den, **params)
+            trang_dau.append(t())
+            if moc:
+                with timer() as t:
+                    search_trips(tuyen.diem_di, tuyen.diem_den, sau=moc, **params)
+                trang_sau.append(t())
+        report_latency("search_trips trang đầu", trang_dau)
+        report_latency("search_trips trang sau (keyset)", trang_sau)
+
+        from booking.models import Chuyen
+        tuyen = tuyens[0]
+        qs = Chuyen.objects.filter(
+            tuyen__diem_di=tuyen.diem_di, tuyen__diem_den=tuyen.diem_den,
+            ngay_gio_khoi_hanh__gte=timezone.now(),
+        ).con_it_nhat(2).order_by("ngay_gio_khoi_hanh", "pk")[:21]
+        print("Query plan:")
+        print(qs.explain())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Thông lượng đăng ký: RegistrationForm (kiểm tra trùng) + register_account
+(một transaction), tuần tự hoặc nhiều luồng.
+"""
+import threading
+
+from benchmarks._common import make_parser, report_latency, report_rate, test_database, timer
+
+
+def dang_ky(i):
+    from django.db import IntegrityError
+
+    from users.forms import RegistrationForm
+    from users.services import register_account
+
+    data = {
+        "ten": f"Khách {i}", "cccd": f"{i:012d}", "so_dien_thoai": f"09{i:08d}",
+        "email": f"khach{i}@example.com", "password": "matkhau123", "password2": "matkhau123",
+    }
+    with timer() as t:
+        form = RegistrationForm(data=data)
+        if form.is_valid():
+            try:
+                register_account(form.cleaned_data)
+            except IntegrityError:
+                pass
+    return t()
+
+
+def chay_luong(ids, samples):
+    from django.db import connection
+
+    try:
+        samples.extend(dang_ky(i) for i in ids)
+    finally:
+        connection.close()
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--signups", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument(
+        "--real-hash", action="store_true",
+        help="Dùng hasher mật khẩu thật (mặc định dùng MD5 để đo phần database).",
+    )
+    args = parser.parse_args()
+
+    from django.db import connection
+    from django.test import override_settings
+    from django.test.utils import CaptureQueriesContext
+
+    hashers = {} if args.real_hash else {"PASSWORD_HASHERS": ["django.contrib.auth.hashers.MD5PasswordHasher"]}
+    with test_database(args.keepdb), override_settings(**hashers):
+        with CaptureQueriesContext(connection) as queries:
+            dang_ky(-1)
+        print(f"{len(queries)} query cho mỗi lần đăng ký")
+
+        samples = []
+        with timer() as t:
+            if args.threads > 1:
+                threads = [
+                    threading.Thread(target=chay_luong, args=(range(k, args.signups, args.threads), samples))
+                    for k in range(args.threads)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            else:
+                samples = [dang_ky(i) for i in range(args.signups)]
+        report_rate(f"Đăng ký ({args.threads} luồng)", args.signups, t(), "lượt")
+        report_latency("Độ trễ mỗi lượt", samples)
+
+
+if __name__ == "__main__":
+    main()
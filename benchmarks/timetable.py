@@ -0,0 +1,54 @@
+"""
+Nhập / xuất lịch chạy: ghi một file CSV N chuyến (mặc định 50k) ra file tạm,
+nhập bằng import_file (upsert theo lô), nhập lại lần hai (toàn bộ là cập
+nhật theo id) rồi xuất ngược ra CSV.
+"""
+import csv
+import os
+import tempfile
+
+from benchmarks._common import make_parser, report_rate, test_database, timer
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--trips", type=int, default=50_000)
+    parser.add_argument("--vehicles", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from booking.models import Tuyen, Xe
+    from booking.timetable import COLUMNS, import_file, iter_export
+
+    with test_database(args.keepdb), tempfile.TemporaryDirectory() as tmp:
+        Tuyen.objects.create(diem_di="Hà Nội", diem_den="Sài Gòn")
+        Xe.objects.bulk_create(Xe(bien_so=f"29B-{i:05d}", loai_xe="Giường nằm", so_ghe=40) for i in range(args.vehicles))
+
+        path = os.path.join(tmp, "chuyen.csv")
+        bat_dau = timezone.now() + timedelta(days=1)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS["chuyen"])
+            for i in range(args.trips):
+                khoi_hanh = bat_dau + timedelta(days=i // args.vehicles)
+                writer.writerow(["", "Hà Nội", "Sài Gòn", f"29B-{i % args.vehicles:05d}", khoi_hanh.isoformat(),
+                                 (khoi_hanh + timedelta(hours=20)).isoformat(), 40, 900000])
+
+        for label in ("Nhập mới", "Nhập lại (cập nhật)"):
+            with open(path, encoding="utf-8", newline="") as f, timer() as t:
+                result = import_file("chuyen", f, "csv", batch_size=args.batch_size)
+            assert result.error_count == 0, result.errors[:3]
+            report_rate(label, result.imported, t(), "dòng")
+            if label == "Nhập mới":
+                # Lần hai: file đã xuất có cột id
+                with open(path, "w", encoding="utf-8", newline="") as f, timer() as t:
+                    f.writelines(iter_export("chuyen"))
+                report_rate("Xuất CSV", result.imported, t(), "dòng")
+
+
+if __name__ == "__main__":
+    main()
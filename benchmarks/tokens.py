@@ -0,0 +1,68 @@
+"""So sánh kiểm tra token: UUID lưu trong bảng EmailVerification và token ký không trạng thái."""
+import random
+
+from benchmarks._common import make_parser, report_latency, test_database, timer
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--tokens-per-account", type=int, default=5, help="Số lần gửi lại (số dòng token) mỗi tài khoản.")
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.utils import timezone
+
+    from users.models import Account, EmailVerification
+    from users.tokens import email_verification_token
+
+    with test_database(args.keepdb):
+        Account.objects.bulk_create([
+            Account(username=f"user{i}", email=f"user{i}@example.com", password="!", is_active=False)
+            for i in range(args.accounts)
+        ], batch_size=5000)
+        accounts = list(Account.objects.all())
+        het_han = timezone.now() + timezone.timedelta(hours=1)
+        EmailVerification.objects.bulk_create([
+            EmailVerification(account=account, expires_at=het_han)
+            for account in accounts for _ in range(args.tokens_per_account)
+        ], batch_size=5000)
+
+        rng = random.Random(42)
+        uuid_tokens = list(EmailVerification.objects.values_list("token", flat=True))
+        mau_uuid = [rng.choice(uuid_tokens) for _ in range(args.queries)]
+        mau_ky = [email_verification_token.make_token(rng.choice(accounts)) for _ in range(args.queries)]
+
+        db, ky = [], []
+        with CaptureQueriesContext(connection) as q_db:
+            for token in mau_uuid:
+                with timer() as t:
+                    verification = EmailVerification.objects.select_related("account").get(token=token)
+                    verification.is_used or verification.is_expired()
+                db.append(t())
+        with CaptureQueriesContext(connection) as q_ky:
+            for token in mau_ky:
+                with timer() as t:
+                    email_verification_token.check_token(token)
+                ky.append(t())
+        report_latency(f"Kiểm tra UUID trong DB ({len(q_db) / args.queries:.0f} query/lần)", db)
+        report_latency(f"Kiểm tra token ký ({len(q_ky) / args.queries:.0f} query/lần)", ky)
+
+        # Phát hành token (mỗi lần đăng ký / gửi lại)
+        tao_db, tao_ky = [], []
+        for account in accounts[:args.queries]:
+            with timer() as t:
+                EmailVerification.objects.filter(account=account, is_used=False).update(is_used=True)
+                EmailVerification.objects.create(account=account)
+            tao_db.append(t())
+            with timer() as t:
+                email_verification_token.make_token(account)
+            tao_ky.append(t())
+        report_latency("Phát hành UUID (UPDATE + INSERT)", tao_db)
+        report_latency("Phát hành token ký (không ghi DB)", tao_ky)
+
+
+if __name__ == "__main__":
+    main()
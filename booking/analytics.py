@@ -0,0 +1,198 @@
+"""
+Phân tích tỉ lệ lấp đầy và đường cong đặt vé theo tuyến.
+
+Đường cong đặt vé cho biết bao nhiêu phần ghế đã bán khi còn d ngày trước
+giờ khởi hành (d = 0..horizon, vé đặt sớm hơn horizon ngày tính vào mốc
+horizon). Vé và chuyến được đọc một lượt bằng values_list cho mọi tuyến /
+ngày cần tính, sau đó gom nhóm trên mảng cho tất cả chuyến cùng lúc: dùng
+numpy nếu có cài (`pip install numpy`), nếu không thì vòng lặp Python cho
+cùng kết quả.
+
+Số liệu của từng (tuyến, ngày khởi hành) đã qua được cache
+(ANALYTICS_CACHE_TIMEOUT) vì chuyến đã chạy không còn bán thêm vé; hôm nay
+và các ngày tới luôn được tính lại. Cache này tách khỏi `trip_cache` (prefix
+và bộ đếm hit/miss riêng) để không làm lệch thống kê cache tìm chuyến.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import TieredCache
+from .models import Chuyen, Ve
+
+try:
+    import numpy as np
+except ImportError:  # numpy là tuỳ chọn
+    np = None
+
+NGAY_GIAY = 86400
+
+analytics_cache = TieredCache(
+    alias=getattr(settings, "BOOKING_CACHE_ALIAS", "default"),
+    local_size=getattr(settings, "BOOKING_CACHE_LOCAL_SIZE", 1024),
+    local_ttl=getattr(settings, "BOOKING_CACHE_LOCAL_TTL", 5),
+    timeout=getattr(settings, "ANALYTICS_CACHE_TIMEOUT", NGAY_GIAY),
+    prefix="booking:phan_tich",
+)
+
+
+def _horizon(horizon):
+    return horizon if horizon is not None else getattr(settings, "ANALYTICS_HORIZON_DAYS", 30)
+
+
+def _dau_ngay(ngay):
+    return timezone.make_aware(datetime.combine(ngay, time.min))
+
+
+def _doc_du_lieu(tuyen_ids, tu_ngay, den_ngay):
+    """(chuyến, vé): chuyến là (tuyen_id, khởi hành, tổng số vé), vé là (chỉ số chuyến, số lượng, thời gian đặt)."""
+    khoang = Q(ngay_gio_khoi_hanh__gte=_dau_ngay(tu_ngay), ngay_gio_khoi_hanh__lt=_dau_ngay(den_ngay + timedelta(days=1)))
+    chuyen, chi_so = [], {}
+    for pk, tuyen_id, khoi_hanh, tong_so_ve in (
+        Chuyen.objects.filter(khoang, tuyen_id__in=tuyen_ids)
+        .values_list("pk", "tuyen_id", "ngay_gio_khoi_hanh", "tong_so_ve").order_by()
+    ):
+        chi_so[pk] = len(chuyen)
+        chuyen.append((tuyen_id, khoi_hanh, tong_so_ve))
+    ve = [
+        (chi_so[chuyen_id], so_luong, thoi_gian_dat)
+        for chuyen_id, so_luong, thoi_gian_dat in Ve.objects.filter(
+            chuyen__in=Chuyen.objects.filter(khoang, tuyen_id__in=tuyen_ids), trang_thai="DA_THANH_TOAN",
+        ).values_list("chuyen_id", "so_luong", "thoi_gian_dat").order_by()
+    ]
+    return chuyen, ve
+
+
+def _gom_numpy(nhom, so_nhom, cap, ve, khoi_hanh, horizon):
+    ve_chuyen = np.fromiter((i for i, _, _ in ve), dtype=np.int64, count=len(ve))
+    so_luong = np.fromiter((n for _, n, _ in ve), dtype=np.int64, count=len(ve))
+    dat = np.fromiter((t.timestamp() for _, _, t in ve), dtype=np.float64, count=len(ve))
+    khoi_hanh = np.asarray(khoi_hanh, dtype=np.float64)
+    nhom = np.asarray(nhom, dtype=np.int64)
+
+    truoc = np.clip((khoi_hanh[ve_chuyen] - dat) // NGAY_GIAY, 0, horizon).astype(np.int64)
+    theo_ngay = np.bincount(
+        nhom[ve_chuyen] * (horizon + 1) + truoc, weights=so_luong, minlength=so_nhom * (horizon + 1),
+    ).reshape(so_nhom, horizon + 1)
+    # da_ban[:, d] = số vé đặt từ d ngày trước trở về trước = tổng cộng dồn từ phía horizon
+    da_ban = theo_ngay[:, ::-1].cumsum(axis=1)[:, ::-1].astype(np.int64)
+    ban_chuyen = np.bincount(ve_chuyen, weights=so_luong, minlength=len(cap))
+    return da_ban.tolist(), (ban_chuyen / np.asarray(cap, dtype=np.float64)).tolist()
+
+
+def _gom_python(nhom, so_nhom, cap, ve, khoi_hanh, horizon):
+    theo_ngay = [[0] * (horizon + 1) for _ in range(so_nhom)]
+    ban_chuyen = [0] * len(cap)
+    for i, so_luong, dat in ve:
+        truoc = min(max(int((khoi_hanh[i] - dat.timestamp()) // NGAY_GIAY), 0), horizon)
+        theo_ngay[nhom[i]][truoc] += so_luong
+        ban_chuyen[i] += so_luong
+    da_ban = []
+    for dong in theo_ngay:
+        cong_don, tong = [0] * (horizon + 1), 0
+        for d in range(horizon, -1, -1):
+            tong += dong[d]
+            cong_don[d] = tong
+        da_ban.append(cong_don)
+    return da_ban, [ban / so_ghe for ban, so_ghe in zip(ban_chuyen, cap)]
+
+
+def _tinh(tuyen_ids, tu_ngay, den_ngay, horizon):
+    """Số liệu {(tuyen_id, ngày): {...}} của mọi tuyến / ngày trong khoảng (ngày không có chuyến cũng có mặt)."""
+    chuyen, ve = _doc_du_lieu(tuyen_ids, tu_ngay, den_ngay)
+    khoa_nhom, nhom = {}, []
+    for tuyen_id, khoi_hanh, _ in chuyen:
+        nhom.append(khoa_nhom.setdefault((tuyen_id, timezone.localdate(khoi_hanh)), len(khoa_nhom)))
+    cap = [max(tong_so_ve, 1) for _, _, tong_so_ve in chuyen]
+    khoi_hanh = [kh.timestamp() for _, kh, _ in chuyen]
+    gom = _gom_numpy if np is not None and ve else _gom_python
+    da_ban, lap_day = gom(nhom, len(khoa_nhom), cap, ve, khoi_hanh, horizon)
+
+    so_ngay = (den_ngay - tu_ngay).days + 1
+    ket_qua = {
+        (tuyen_id, tu_ngay + timedelta(days=i)): {"so_chuyen": 0, "so_ghe": 0, "da_ban": [0] * (horizon + 1), "lap_day": []}
+        for tuyen_id in tuyen_ids for i in range(so_ngay)
+    }
+    for khoa, j in khoa_nhom.items():
+        ket_qua[khoa]["da_ban"] = da_ban[j]
+    thu_tu = list(khoa_nhom)
+    for (_, _, tong_so_ve), j, ty_le in zip(chuyen, nhom, lap_day):
+        muc = ket_qua[thu_tu[j]]
+        muc["so_chuyen"] += 1
+        muc["so_ghe"] += tong_so_ve
+        muc["lap_day"].append(ty_le)
+    return ket_qua
+
+
+def _cache_key(tuyen_id, ngay, horizon):
+    return analytics_cache.make_key(tuyen_id, ngay.isoformat(), horizon)
+
+
+def route_day_stats(tuyen_ids, tu_ngay, den_ngay, horizon=None):
+    """
+    Số liệu thô {(tuyen_id, ngày): {so_chuyen, so_ghe, da_ban, lap_day}} cho
+    các ngày khởi hành trong [tu_ngay, den_ngay]. `da_ban[d]` là số vé đã bán
+    khi còn d ngày, `lap_day` là tỉ lệ lấp đầy của từng chuyến.
+
+    Các ngày đã qua lấy từ cache; phần còn thiếu được tính chung trong một
+    lượt đọc (hai câu SELECT) cho mọi tuyến.
+    """
+    horizon = _horizon(horizon)
+    hom_nay = timezone.localdate()
+    so_ngay = (den_ngay - tu_ngay).days + 1
+    tat_ca = [(tuyen_id, tu_ngay + timedelta(days=i)) for tuyen_id in tuyen_ids for i in range(so_ngay)]
+    keys = {khoa: _cache_key(*khoa, horizon) for khoa in tat_ca if khoa[1] < hom_nay}
+    cached = analytics_cache.get_many(list(keys.values()))
+    ket_qua = {khoa: cached[key] for khoa, key in keys.items() if key in cached}
+
+    thieu = [khoa for khoa in tat_ca if khoa not in ket_qua]
+    if thieu:
+        tinh = _tinh(
+            sorted({tuyen_id for tuyen_id, _ in thieu}),
+            min(ngay for _, ngay in thieu), max(ngay for _, ngay in thieu), horizon,
+        )
+        ket_qua.update((khoa, tinh[khoa]) for khoa in thieu)
+        analytics_cache.set_many({keys[khoa]: tinh[khoa] for khoa in thieu if khoa in keys})
+    return ket_qua
+
+
+def _phan_vi(gia_tri, pct):
+    if not gia_tri:
+        return 0.0
+    gia_tri = sorted(gia_tri)
+    return gia_tri[min(len(gia_tri) - 1, int(pct / 100 * len(gia_tri)))]
+
+
+def booking_curves(tuyen_ids, tu_ngay, den_ngay, horizon=None):
+    """
+    Tổng hợp theo tuyến cho các ngày khởi hành trong [tu_ngay, den_ngay]:
+    {tuyen_id: {so_chuyen, so_ghe, so_ve_da_ban, ty_le_lap_day, lap_day_p50,
+    lap_day_p90, duong_cong}}, trong đó `duong_cong[d]` là tỉ lệ ghế đã bán
+    khi còn d ngày trước khởi hành (tính trên tổng số ghế của cả khoảng).
+    """
+    horizon = _horizon(horizon)
+    theo_tuyen = {
+        tuyen_id: {"so_chuyen": 0, "so_ghe": 0, "da_ban": [0] * (horizon + 1), "lap_day": []} for tuyen_id in tuyen_ids
+    }
+    for (tuyen_id, _), muc in route_day_stats(tuyen_ids, tu_ngay, den_ngay, horizon).items():
+        tong = theo_tuyen[tuyen_id]
+        tong["so_chuyen"] += muc["so_chuyen"]
+        tong["so_ghe"] += muc["so_ghe"]
+        tong["da_ban"] = [a + b for a, b in zip(tong["da_ban"], muc["da_ban"])]
+        tong["lap_day"].extend(muc["lap_day"])
+
+    ket_qua = {}
+    for tuyen_id, tong in theo_tuyen.items():
+        so_ghe = tong["so_ghe"]
+        ket_qua[tuyen_id] = {
+            "so_chuyen": tong["so_chuyen"],
+            "so_ghe": so_ghe,
+            "so_ve_da_ban": tong["da_ban"][0],
+            "ty_le_lap_day": tong["da_ban"][0] / so_ghe if so_ghe else 0.0,
+            "lap_day_p50": _phan_vi(tong["lap_day"], 50),
+            "lap_day_p90": _phan_vi(tong["lap_day"], 90),
+            "duong_cong": [ban / so_ghe if so_ghe else 0.0 for ban in tong["da_ban"]],
+        }
+    return ket_qua
@@ -0,0 +1,251 @@
+"""
+Cache hai tầng cho kết quả tìm chuyến và số vé còn lại.
+
+Tầng 1 là LRU trong process (rất nhanh, TTL ngắn), tầng 2 là cache dùng chung
+của Django (`BOOKING_CACHE_ALIAS`, Redis/Memcached ở production, LocMem khi
+test). Kết quả tìm kiếm được gắn với "phiên bản" của tuyến: khi một Chuyen, Ve
+hoặc ThanhToan thay đổi, signal tăng phiên bản của tuyến đó nên mọi key cũ tự
+động bị bỏ qua mà không phải xoá từng key.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+_MISSING = object()
+
+
+class LRUCache:
+    """LRU có TTL, an toàn giữa các thread."""
+
+    def __init__(self, max_size=1024, ttl=5):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TieredCache:
+    """LRU trong process đứng trước cache dùng chung, có đếm hit/miss."""
+
+    STATS_KEYS = ("local_hit", "shared_hit", "miss")
+    STATS_FLUSH_EVERY = 100
+
+    def __init__(self, alias="default", local_size=1024, local_ttl=5, timeout=60, prefix="booking"):
+        self.alias = alias
+        self.local = LRUCache(local_size, local_ttl)
+        self.timeout = timeout
+        self.prefix = prefix
+        self._counts = dict.fromkeys(self.STATS_KEYS, 0)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def make_key(self, *parts):
+        return ":".join([self.prefix, *map(str, parts)])
+
+    def get_or_set(self, key, loader, timeout=None):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count("local_hit")
+            return value
+        value = self.shared.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count("shared_hit")
+        else:
+            self._count("miss")
+            value = loader()
+            self.shared.set(key, value, self.timeout if timeout is None else timeout)
+        self.local.set(key, value)
+        return value
+
+    def get_many(self, keys):
+        """Đọc nhiều key một lượt (một round-trip tới cache dùng chung cho các key không có trong LRU)."""
+        found = {}
+        for key in keys:
+            value = self.local.get(key, _MISSING)
+            if value is not _MISSING:
+                self._count("local_hit")
+                found[key] = value
+        missing = [key for key in keys if key not in found]
+        if missing:
+            shared = self.shared.get_many(missing)
+            for key in missing:
+                if key in shared:
+                    self._count("shared_hit")
+                    self.local.set(key, shared[key])
+                    found[key] = shared[key]
+                else:
+                    self._count("miss")
+        return found
+
+    def set_many(self, mapping, timeout=None):
+        self.shared.set_many(mapping, self.timeout if timeout is None else timeout)
+        for key, value in mapping.items():
+            self.local.set(key, value)
+
+    def delete(self, key):
+        self.local.delete(key)
+        self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.delete_many([self.make_key("stats", name) for name in self.STATS_KEYS])
+        with self._lock:
+            self._counts = dict.fromkeys(self.STATS_KEYS, 0)
+            self._pending = 0
+
+    def version(self, *parts):
+        """Phiên bản hiện tại của một nhóm key (đọc qua tầng LRU)."""
+        key = self.make_key(*parts, "v")
+        value = self.local.get(key)
+        if value is None:
+            value = self.shared.get(key)
+            if value is None:
+                # Khởi tạo theo thời gian để không trùng phiên bản cũ nếu key bị evict
+                self.shared.add(key, time.time_ns(), None)
+                value = self.shared.get(key)
+            self.local.set(key, value)
+        return value
+
+    def bump_version(self, *parts):
+        key = self.make_key(*parts, "v")
+        try:
+            self.shared.incr(key)
+        except ValueError:
+            self.shared.set(key, time.time_ns(), None)
+        self.local.delete(key)
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+            self._pending += 1
+            if self._pending < self.STATS_FLUSH_EVERY:
+                return
+            counts, self._counts = self._counts, dict.fromkeys(self.STATS_KEYS, 0)
+            self._pending = 0
+        self._flush(counts)
+
+    def _flush(self, counts):
+        for name, value in counts.items():
+            if not value:
+                continue
+            key = self.make_key("stats", name)
+            try:
+                self.shared.incr(key, value)
+            except ValueError:
+                if not self.shared.add(key, value, None):
+                    self.shared.incr(key, value)
+
+    def stats(self):
+        """Tổng hit/miss của mọi process (đã flush) cộng phần chưa flush của process này."""
+        with self._lock:
+            local = dict(self._counts)
+        shared = self.shared.get_many([self.make_key("stats", name) for name in self.STATS_KEYS])
+        result = {name: local[name] + shared.get(self.make_key("stats", name), 0) for name in self.STATS_KEYS}
+        total = sum(result.values())
+        result["hit_ratio"] = (result["local_hit"] + result["shared_hit"]) / total if total else 0.0
+        return result
+
+
+trip_cache = TieredCache(
+    alias=getattr(settings, "BOOKING_CACHE_ALIAS", "default"),
+    local_size=getattr(settings, "BOOKING_CACHE_LOCAL_SIZE", 1024),
+    local_ttl=getattr(settings, "BOOKING_CACHE_LOCAL_TTL", 5),
+    timeout=getattr(settings, "BOOKING_CACHE_TIMEOUT", 60),
+)
+
+
+def _route_key(diem_di, diem_den):
+    digest = hashlib.sha1(f"{diem_di}\x00{diem_den}".encode()).hexdigest()
+    return trip_cache.make_key("tuyen", digest)
+
+
+def _route_id(diem_di, diem_den):
+    from .models import Tuyen
+
+    return trip_cache.get_or_set(
+        _route_key(diem_di, diem_den),
+        lambda: Tuyen.objects.filter(diem_di=diem_di, diem_den=diem_den).values_list("pk", flat=True).first(),
+    )
+
+
+def cached_search_trips(diem_di, diem_den, tu_ngay=None, den_ngay=None, so_ve=1,
+                        gia_tu=None, gia_den=None, sau=None, limit=20):
+    """search_trips() qua cache, key theo tuyến + khoảng ngày + bộ lọc."""
+    from .services import decode_cursor, search_trips
+
+    tuyen_id = _route_id(diem_di, diem_den)
+    if tuyen_id is None:
+        return [], None
+    # Mốc do client gửi: giải mã trước khi đưa vào key. Mốc hỏng được search_trips
+    # coi như trang đầu nên dùng chung key trang đầu, không sinh key rác tuỳ ý.
+    moc = decode_cursor(sau) if sau else None
+    if moc is None:
+        sau = None
+    key = trip_cache.make_key(
+        "search", tuyen_id, trip_cache.version("tuyen", tuyen_id),
+        tu_ngay or "", den_ngay or "", so_ve or 1, gia_tu or "", gia_den or "",
+        f"{moc[0].isoformat()}-{moc[1]}" if moc else "", limit,
+    )
+    return trip_cache.get_or_set(key, lambda: search_trips(
+        diem_di, diem_den, tu_ngay=tu_ngay, den_ngay=den_ngay, so_ve=so_ve,
+        gia_tu=gia_tu, gia_den=gia_den, sau=sau, limit=limit,
+    ))
+
+
+def cached_so_ve_con_lai(chuyen_id):
+    from .models import Chuyen
+
+    return trip_cache.get_or_set(
+        trip_cache.make_key("chuyen", chuyen_id, "con_lai"),
+        lambda: Chuyen.objects.kem_so_ve_con_lai().filter(pk=chuyen_id).values_list("ve_con_lai", flat=True).first(),
+    )
+
+
+def invalidate_trip(chuyen_id, tuyen_id):
+    """Gọi khi chuyến (hoặc vé / thanh toán của chuyến) thay đổi."""
+    trip_cache.delete(trip_cache.make_key("chuyen", chuyen_id, "con_lai"))
+    trip_cache.bump_version("tuyen", tuyen_id)
+
+
+def invalidate_route(tuyen_id):
+    """Gọi khi thêm / sửa hàng loạt chuyến của một tuyến mà không qua signal."""
+    trip_cache.bump_version("tuyen", tuyen_id)
+
+
+def invalidate_route_lookup(diem_di, diem_den):
+    trip_cache.delete(_route_key(diem_di, diem_den))
@@ -0,0 +1,8 @@
+"""Tiện ích CSV dùng chung cho nhập / xuất dữ liệu dạng stream."""
+
+
+class Echo:
+    """Bộ đệm giả cho csv.writer: trả lại luôn dòng vừa ghi (dùng với StreamingHttpResponse)."""
+
+    def write(self, value):
+        return value
@@ -0,0 +1,63 @@
+from django import forms
+
+from .models import Tuyen, Xe
+
+
+class ChuyenSearchForm(forms.Form):
+    diem_di = forms.CharField(max_length=100, label="Điểm đi")
+    diem_den = forms.CharField(max_length=100, label="Điểm đến")
+    tu_ngay = forms.DateField(label="Từ ngày", required=False)
+    den_ngay = forms.DateField(label="Đến ngày", required=False)
+    so_ve = forms.IntegerField(min_value=1, initial=1, required=False, label="Số vé")
+    gia_tu = forms.DecimalField(min_value=0, max_digits=10, decimal_places=2, required=False, label="Giá từ")
+    gia_den = forms.DecimalField(min_value=0, max_digits=10, decimal_places=2, required=False, label="Giá đến")
+
+    def clean(self):
+        cd = super().clean()
+        if cd.get('tu_ngay') and cd.get('den_ngay') and cd['den_ngay'] < cd['tu_ngay']:
+            raise forms.ValidationError("Ngày kết thúc phải sau ngày bắt đầu.")
+        if cd.get('gia_tu') is not None and cd.get('gia_den') is not None and cd['gia_den'] < cd['gia_tu']:
+            raise forms.ValidationError("Khoảng giá không hợp lệ.")
+        return cd
+
+
+class LichChayForm(forms.Form):
+    NGAY_TRONG_TUAN_CHOICES = [
+        (0, "Thứ Hai"), (1, "Thứ Ba"), (2, "Thứ Tư"), (3, "Thứ Năm"),
+        (4, "Thứ Sáu"), (5, "Thứ Bảy"), (6, "Chủ Nhật"),
+    ]
+
+    tuyen = forms.ModelChoiceField(queryset=Tuyen.objects.all(), label="Tuyến")
+    xe = forms.ModelChoiceField(queryset=Xe.objects.all(), label="Xe")
+    gio_khoi_hanh = forms.TimeField(label="Giờ khởi hành")
+    thoi_gian_chay = forms.IntegerField(min_value=1, required=False, label="Thời gian chạy (phút)")
+    ngay_trong_tuan = forms.TypedMultipleChoiceField(
+        choices=NGAY_TRONG_TUAN_CHOICES, coerce=int, widget=forms.CheckboxSelectMultiple, label="Ngày trong tuần"
+    )
+    tu_ngay = forms.DateField(label="Từ ngày")
+    den_ngay = forms.DateField(label="Đến ngày")
+    gia_ve = forms.DecimalField(min_value=0, max_digits=10, decimal_places=2, label="Giá vé")
+    tong_so_ve = forms.IntegerField(min_value=1, required=False, label="Tổng số vé (mặc định bằng số ghế)")
+
+    def clean(self):
+        cd = super().clean()
+        if cd.get('tu_ngay') and cd.get('den_ngay') and cd['den_ngay'] < cd['tu_ngay']:
+            raise forms.ValidationError("Ngày kết thúc phải sau ngày bắt đầu.")
+        return cd
+
+
+class NhapDuLieuForm(forms.Form):
+    loai = forms.ChoiceField(choices=[("tuyen", "Tuyến"), ("xe", "Xe"), ("chuyen", "Chuyến")], label="Loại dữ liệu")
+    dinh_dang = forms.ChoiceField(choices=[("csv", "CSV"), ("jsonl", "JSONL")], label="Định dạng")
+    tep = forms.FileField(label="Tệp")
+
+
+class KhoangNgayForm(forms.Form):
+    tu_ngay = forms.DateField(label="Từ ngày")
+    den_ngay = forms.DateField(label="Đến ngày")
+
+    def clean(self):
+        cd = super().clean()
+        if cd.get('tu_ngay') and cd.get('den_ngay') and cd['den_ngay'] < cd['tu_ngay']:
+            raise forms.ValidationError("Ngày kết thúc phải sau ngày bắt đầu.")
+        return cd
@@ -0,0 +1,27 @@
+"""
+Cổng thanh toán giả lập, dùng cho test và benchmark thay cho cổng thật.
+
+Cổng thật nhận yêu cầu trừ tiền rồi gọi lại (callback) view
+`payment_callback` một lúc sau; FakeGateway làm đúng việc đó nhưng ghi thẳng
+callback vào hàng đợi, có thể cấu hình tỉ lệ giao dịch thất bại và số lần
+gửi lặp lại callback (cổng thật thường gửi lại khi không nhận được 2xx).
+"""
+import random
+
+from .payments import enqueue_callback
+
+
+class FakeGateway:
+    def __init__(self, ty_le_loi=0.0, so_lan_gui=1, seed=None):
+        self.ty_le_loi = ty_le_loi
+        self.so_lan_gui = so_lan_gui
+        self._random = random.Random(seed)
+        self.giao_dich = {}
+
+    def charge(self, thanh_toan):
+        """Trừ tiền cho ThanhToan, trả về True nếu thành công."""
+        thanh_cong = self._random.random() >= self.ty_le_loi
+        self.giao_dich[thanh_toan.ma_giao_dich] = (thanh_toan.so_tien, thanh_cong)
+        for _ in range(self.so_lan_gui):
+            enqueue_callback(thanh_toan.ma_giao_dich, thanh_cong)
+        return thanh_cong
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from booking.models import Chuyen, Xe
+from booking.services import audit_vehicle_overlaps
+
+
+class Command(BaseCommand):
+    help = "Rà soát lịch của toàn bộ xe, liệt kê các cặp chuyến bị xếp trùng xe."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Rà cả các chuyến đã chạy (mặc định chỉ từ hiện tại).")
+        parser.add_argument("--limit", type=int, default=100, help="Số cặp trùng tối đa được in chi tiết.")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        tu = None if options["all"] else timezone.now()
+        cap_trung = []
+        so_cap = 0
+        for cap in audit_vehicle_overlaps(tu=tu, chunk_size=options["chunk_size"]):
+            so_cap += 1
+            if len(cap_trung) < options["limit"]:
+                cap_trung.append(cap)
+
+        if cap_trung:
+            bien_so = dict(Xe.objects.filter(pk__in={xe_id for xe_id, _, _ in cap_trung}).values_list("pk", "bien_so"))
+            khoi_hanh = dict(
+                Chuyen.objects.filter(pk__in={pk for _, a, b in cap_trung for pk in (a, b)})
+                .values_list("pk", "ngay_gio_khoi_hanh")
+            )
+            for xe_id, a, b in cap_trung:
+                self.stdout.write(
+                    f"Xe {bien_so[xe_id]}: chuyến #{a} ({timezone.localtime(khoi_hanh[a]):%d/%m/%Y %H:%M}) "
+                    f"trùng chuyến #{b} ({timezone.localtime(khoi_hanh[b]):%d/%m/%Y %H:%M})"
+                )
+        self.stdout.write(f"Tổng cộng {so_cap} cặp chuyến trùng xe.")
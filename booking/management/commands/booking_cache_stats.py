@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from booking.cache import trip_cache
+
+
+class Command(BaseCommand):
+    help = "In số lần hit/miss và tỉ lệ hit của cache tìm chuyến."
+
+    def handle(self, *args, **options):
+        stats = trip_cache.stats()
+        self.stdout.write(
+            f"local_hit={stats['local_hit']} shared_hit={stats['shared_hit']} "
+            f"miss={stats['miss']} hit_ratio={stats['hit_ratio']:.1%}"
+        )
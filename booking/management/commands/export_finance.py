@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.exports import EXPORTS, iter_export
+
+
+def _ngay(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Ngày không hợp lệ: {value} (định dạng YYYY-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = "Xuất CSV vé hoặc thanh toán trong một khoảng ngày cho kế toán."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(EXPORTS))
+        parser.add_argument("--from", dest="tu_ngay", type=_ngay, required=True)
+        parser.add_argument("--to", dest="den_ngay", type=_ngay, required=True)
+        parser.add_argument("--output", required=True, help="Đường dẫn file CSV.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with open(options["output"], "w", encoding="utf-8", newline="") as output:
+            output.writelines(
+                iter_export(options["kind"], options["tu_ngay"], options["den_ngay"], batch_size=options["batch_size"])
+            )
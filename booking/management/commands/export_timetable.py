@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from booking.timetable import COLUMNS, FORMATS, iter_export
+
+
+class Command(BaseCommand):
+    help = "Xuất tuyến / xe / chuyến ra CSV hoặc JSONL (đọc database theo từng chunk)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(COLUMNS))
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument("--output", default=None, help="Đường dẫn file, mặc định ghi ra stdout.")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        lines = iter_export(options["kind"], options["format"], chunk_size=options["chunk_size"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
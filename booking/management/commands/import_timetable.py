@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.services import audit_vehicle_overlaps
+from booking.timetable import COLUMNS, FORMATS, import_file
+
+
+class Command(BaseCommand):
+    help = "Nhập tuyến / xe / chuyến từ file CSV hoặc JSONL (upsert theo lô)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(COLUMNS))
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=FORMATS, default=None, help="Mặc định đoán theo đuôi file.")
+        parser.add_argument("--batch-size", type=int, default=None, help="Số dòng trong mỗi transaction.")
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or ("jsonl" if options["path"].endswith((".jsonl", ".ndjson")) else "csv")
+        try:
+            with open(options["path"], encoding="utf-8-sig", newline="") as stream:
+                result = import_file(options["kind"], stream, fmt, batch_size=options["batch_size"])
+        except OSError as e:
+            raise CommandError(e)
+
+        for line, message in result.errors:
+            self.stderr.write(f"Dòng {line}: {message}")
+        self.stdout.write(f"Đã nhập {result.imported}/{result.rows} dòng, {result.error_count} dòng lỗi.")
+        if result.xe_ids:
+            so_cap = sum(1 for _ in audit_vehicle_overlaps(xe_ids=result.xe_ids))
+            if so_cap:
+                self.stdout.write(self.style.WARNING(
+                    f"Có {so_cap} cặp chuyến trùng xe, xem: python manage.py audit_vehicle_schedule --all"
+                ))
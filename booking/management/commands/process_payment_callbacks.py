@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from booking.payments import process_callbacks
+
+
+class Command(BaseCommand):
+    help = "Xác nhận các giao dịch từ hàng đợi callback của cổng thanh toán."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Số callback lấy ra mỗi lượt.")
+        parser.add_argument(
+            "--interval", type=int, default=0,
+            help="Chạy như worker: kiểm tra hàng đợi sau mỗi N giây. Mặc định xử lý hết rồi dừng.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            total_done = total_failed = 0
+            while True:
+                done, failed = process_callbacks(batch_size=options["batch_size"])
+                total_done += done
+                total_failed += failed
+                if not done and not failed:
+                    break
+            if total_done or total_failed or not options["interval"]:
+                self.stdout.write(f"Đã xác nhận {total_done} giao dịch, {total_failed} lỗi (sẽ thử lại).")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,44 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.reconciliation import reconcile_file
+
+
+class Command(BaseCommand):
+    help = "Đối soát thanh toán với file quyết toán CSV (ma_giao_dich,trang_thai,so_tien) của cổng thanh toán."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=None, help="Số dòng trong mỗi transaction.")
+        parser.add_argument("--dry-run", action="store_true", help="Chỉ báo cáo, không chốt giao dịch.")
+        parser.add_argument("--report", default=None, help="Ghi toàn bộ dòng lệch ra file CSV này.")
+
+    def handle(self, *args, **options):
+        report_file = None
+        try:
+            report = None
+            if options["report"]:
+                report_file = open(options["report"], "w", encoding="utf-8", newline="")
+                report = csv.writer(report_file)
+                report.writerow(["dong", "ma_giao_dich", "loai", "chi_tiet"])
+            with open(options["path"], encoding="utf-8-sig", newline="") as stream:
+                result = reconcile_file(
+                    stream, batch_size=options["batch_size"], dry_run=options["dry_run"], report=report,
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+        finally:
+            if report_file is not None:
+                report_file.close()
+
+        if not options["report"]:
+            for line, ma, loai, chi_tiet in result.mismatches:
+                self.stderr.write(f"Dòng {line}: {ma} {loai} {chi_tiet}".rstrip())
+        self.stdout.write(
+            f"Đã đối soát {result.rows} dòng: {result.matched} khớp, "
+            f"{result.confirmed} xác nhận thành công, {result.failed} thất bại."
+        )
+        if result.mismatch_count:
+            tong = ", ".join(f"{loai}: {so}" for loai, so in sorted(result.mismatch_count.items()))
+            self.stdout.write(self.style.WARNING(f"Dòng lệch - {tong}"))
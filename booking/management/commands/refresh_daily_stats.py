@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from booking.reports import refresh_daily_stats
+
+
+class Command(BaseCommand):
+    help = "Tổng hợp lại bảng thống kê ngày của dashboard cho các ngày có thay đổi."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Tính lại toàn bộ ThongKeNgay.")
+        parser.add_argument(
+            "--interval", type=int, default=0,
+            help="Chạy như worker: tổng hợp sau mỗi N giây. Mặc định chạy một lần rồi dừng.",
+        )
+
+    def handle(self, *args, **options):
+        full = options["full"]
+        while True:
+            so_ngay = refresh_daily_stats(full=full)
+            if so_ngay or not options["interval"]:
+                self.stdout.write(f"Đã tổng hợp lại {so_ngay} ngày.")
+            if not options["interval"]:
+                break
+            full = False
+            time.sleep(options["interval"])
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from booking.services import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Hủy các vé CHO_THANH_TOAN đã hết hạn giữ chỗ và trả chỗ về cho chuyến."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Số vé xử lý trong mỗi transaction.")
+        parser.add_argument(
+            "--interval", type=int, default=0,
+            help="Chạy lặp lại sau mỗi N giây (worker định kỳ). Mặc định chạy một lần.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            da_huy = release_expired_holds(batch_size=options["batch_size"])
+            self.stdout.write(f"Đã hủy {da_huy} vé hết hạn giữ chỗ.")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:49
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def tinh_bo_dem_so_ve(apps, schema_editor):
+    Chuyen = apps.get_model('booking', 'Chuyen')
+    Ve = apps.get_model('booking', 'Ve')
+    cap_nhat = {}
+    for trang_thai, truong in (('DA_THANH_TOAN', 'so_ve_da_ban'), ('CHO_THANH_TOAN', 'so_ve_dang_giu')):
+        tong = (
+            Ve.objects.filter(chuyen=OuterRef('pk'), trang_thai=trang_thai)
+            .values('chuyen')
+            .annotate(tong=Sum('so_luong'))
+            .values('tong')
+        )
+        cap_nhat[truong] = Coalesce(Subquery(tong), 0)
+    Chuyen.objects.update(**cap_nhat)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chuyen',
+            name='so_ve_da_ban',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='chuyen',
+            name='so_ve_dang_giu',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(tinh_bo_dem_so_ve, migrations.RunPython.noop),
+    ]
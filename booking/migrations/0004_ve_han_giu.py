@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:50
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def dat_han_giu_cho_ve_cu(apps, schema_editor):
+    Ve = apps.get_model('booking', 'Ve')
+    expire_minutes = getattr(settings, 'SEAT_HOLD_EXPIRE_MINUTES', 15)
+    Ve.objects.filter(trang_thai='CHO_THANH_TOAN', han_giu__isnull=True).update(
+        han_giu=F('thoi_gian_dat') + timedelta(minutes=expire_minutes)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0003_chuyen_bo_dem_so_ve'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ve',
+            name='han_giu',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ve',
+            index=models.Index(fields=['trang_thai', 'han_giu'], name='ve_trang_thai_han_giu_idx'),
+        ),
+        migrations.RunPython(dat_han_giu_cho_ve_cu, migrations.RunPython.noop),
+    ]
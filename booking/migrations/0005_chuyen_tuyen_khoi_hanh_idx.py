@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0004_ve_han_giu'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chuyen',
+            index=models.Index(fields=['tuyen', 'ngay_gio_khoi_hanh', 'id'], name='chuyen_tuyen_khoi_hanh_idx'),
+        ),
+    ]
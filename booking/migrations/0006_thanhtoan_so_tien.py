@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:10
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def tinh_so_tien(apps, schema_editor):
+    ThanhToan = apps.get_model('booking', 'ThanhToan')
+    Ve = apps.get_model('booking', 'Ve')
+    so_tien = Ve.objects.filter(pk=OuterRef('ve_id')).annotate(
+        tong=F('so_luong') * F('chuyen__gia_ve')
+    ).values('tong')
+    ThanhToan.objects.update(so_tien=Subquery(so_tien))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0005_chuyen_tuyen_khoi_hanh_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thanhtoan',
+            name='so_tien',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.RunPython(tinh_so_tien, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='thanhtoan',
+            name='so_tien',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='thanhtoan',
+            index=models.Index(fields=['trang_thai', 'ngay_gio'], name='thanhtoan_trang_thai_ngay_idx'),
+        ),
+    ]
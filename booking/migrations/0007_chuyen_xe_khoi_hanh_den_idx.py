@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0006_thanhtoan_so_tien'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chuyen',
+            index=models.Index(fields=['xe', 'ngay_gio_khoi_hanh', 'ngay_gio_den'], name='chuyen_xe_khoi_hanh_den_idx'),
+        ),
+    ]
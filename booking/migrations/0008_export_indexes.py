@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0007_chuyen_xe_khoi_hanh_den_idx'),
+        ('users', '0004_token_indexes_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='thanhtoan',
+            index=models.Index(fields=['ngay_gio', 'id'], name='thanhtoan_ngay_gio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ve',
+            index=models.Index(fields=['thoi_gian_dat', 'id'], name='ve_thoi_gian_dat_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:19
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def xep_ghe_cho_ve_cu(apps, schema_editor):
+    """Xếp ghế liên tiếp (theo thứ tự đặt) cho vé còn hiệu lực của các chuyến chưa chạy."""
+    Chuyen = apps.get_model('booking', 'Chuyen')
+    Ve = apps.get_model('booking', 'Ve')
+    chuyen_ids = (
+        Ve.objects.filter(trang_thai__in=['CHO_THANH_TOAN', 'DA_THANH_TOAN'], chuyen__ngay_gio_khoi_hanh__gte=timezone.now())
+        .values_list('chuyen_id', flat=True).distinct().order_by('chuyen_id')
+    )
+    for chuyen_id in list(chuyen_ids):
+        ves = list(
+            Ve.objects.filter(chuyen_id=chuyen_id, trang_thai__in=['CHO_THANH_TOAN', 'DA_THANH_TOAN'])
+            .order_by('thoi_gian_dat', 'pk').only('pk', 'so_luong')
+        )
+        ghe_tiep = 1
+        for ve in ves:
+            ve.ghe = ','.join(str(ghe) for ghe in range(ghe_tiep, ghe_tiep + ve.so_luong))
+            ghe_tiep += ve.so_luong
+        Ve.objects.bulk_update(ves, ['ghe'])
+        bits = (1 << (ghe_tiep - 1)) - 1
+        Chuyen.objects.filter(pk=chuyen_id).update(so_do_ghe=bits.to_bytes((ghe_tiep + 6) // 8, 'little'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0008_export_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chuyen',
+            name='so_do_ghe',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='ve',
+            name='ghe',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='xe',
+            name='so_ghe_moi_hang',
+            field=models.PositiveSmallIntegerField(default=4),
+        ),
+        migrations.RunPython(xep_ghe_cho_ve_cu, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0009_so_do_ghe'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='thanhtoan',
+            name='trang_thai',
+            field=models.CharField(choices=[('THANH_CONG', 'Thành công'), ('THAT_BAI', 'Thất bại'), ('CHO_XU_LY', 'Chờ xử lý'), ('CAN_HOAN_TIEN', 'Cần hoàn tiền')], default='CHO_XU_LY', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='XacNhanThanhToan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ma_giao_dich', models.CharField(max_length=100)),
+                ('thanh_cong', models.BooleanField()),
+                ('trang_thai', models.CharField(choices=[('CHO_XU_LY', 'Chờ xử lý'), ('DA_XU_LY', 'Đã xử lý'), ('LOI', 'Lỗi')], default='CHO_XU_LY', max_length=20)),
+                ('so_lan_thu', models.PositiveSmallIntegerField(default=0)),
+                ('loi', models.TextField(blank=True)),
+                ('ngay_tao', models.DateTimeField(auto_now_add=True)),
+                ('xu_ly_sau', models.DateTimeField(default=django.utils.timezone.now)),
+                ('xu_ly_luc', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Xác nhận thanh toán',
+                'verbose_name_plural': 'Xác nhận thanh toán',
+                'indexes': [models.Index(fields=['trang_thai', 'xu_ly_sau'], name='xacnhan_trang_thai_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0010_thanh_toan_xac_nhan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThongKeNgay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ngay', models.DateField()),
+                ('so_chuyen', models.PositiveIntegerField(default=0)),
+                ('so_ghe', models.PositiveIntegerField(default=0)),
+                ('so_ve_da_ban', models.PositiveIntegerField(default=0)),
+                ('doanh_thu', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cap_nhat_luc', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Thống kê ngày',
+                'verbose_name_plural': 'Thống kê ngày',
+            },
+        ),
+        migrations.AddField(
+            model_name='chuyen',
+            name='cap_nhat_luc',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='chuyen',
+            index=models.Index(fields=['cap_nhat_luc'], name='chuyen_cap_nhat_luc_idx'),
+        ),
+        migrations.AddField(
+            model_name='thongkengay',
+            name='tuyen',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='booking.tuyen'),
+        ),
+        migrations.AddField(
+            model_name='thongkengay',
+            name='xe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='booking.xe'),
+        ),
+        migrations.AddConstraint(
+            model_name='thongkengay',
+            constraint=models.UniqueConstraint(fields=('ngay', 'tuyen', 'xe'), name='thongke_ngay_tuyen_xe_uniq'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0011_thong_ke_ngay'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NgayCanTongHop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ngay', models.DateField()),
+                ('tao_luc', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Ngày cần tổng hợp',
+                'verbose_name_plural': 'Ngày cần tổng hợp',
+            },
+        ),
+    ]
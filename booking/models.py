@@ -1,7 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.conf import settings
+from django.db.models import F, Subquery, OuterRef, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from users.models import KhachHang  # import từ app users
+from .seats import SoDoGhe, parse_ghe
 
 class Tuyen(models.Model):
     diem_di = models.CharField(max_length=100)
@@ -27,6 +31,12 @@ class Xe(models.Model):
     bien_so = models.CharField(max_length=20, unique=True)
     loai_xe = models.CharField(max_length=50)
     so_ghe = models.PositiveIntegerField()
+    # Bố trí ghế: số ghế mỗi hàng, dùng để xếp nhóm khách ngồi cạnh nhau
+    so_ghe_moi_hang = models.PositiveSmallIntegerField(default=4)
+
+    class Meta:
+        verbose_name = "Xe"
+        verbose_name_plural = "Xe"
 
     def clean(self):
         if self.so_ghe <= 0:
@@ -36,6 +46,58 @@ class Xe(models.Model):
         return f"{self.loai_xe} - {self.bien_so}"
 
 
+def chong_lan(bat_dau_1, ket_thuc_1, bat_dau_2, ket_thuc_2):
+    """Hai khoảng chạy của cùng một xe có trùng nhau không (chuyến chưa có giờ đến coi như một thời điểm)."""
+    # Chuyến nối đuôi (đến lúc 10:00, chạy tiếp lúc 10:00) không tính là trùng
+    return bat_dau_1 == bat_dau_2 or (bat_dau_1 < ket_thuc_2 and bat_dau_2 < ket_thuc_1)
+
+
+def thoi_gian_chay_toi_da():
+    return timezone.timedelta(hours=getattr(settings, 'CHUYEN_MAX_DURATION_HOURS', 72))
+
+
+class ChuyenQuerySet(models.QuerySet):
+    def cua_xe_trong_khoang(self, xe_id, bat_dau, ket_thuc):
+        """
+        Các chuyến của xe có thể chồng lên khoảng [bat_dau, ket_thuc], kèm
+        `ket_thuc` (giờ đến, hoặc giờ khởi hành nếu chưa có).
+
+        Vì một chuyến không chạy quá CHUYEN_MAX_DURATION_HOURS nên chỉ cần quét
+        đoạn index (xe, ngay_gio_khoi_hanh) từ bat_dau - thời gian tối đa.
+        """
+        return (
+            self.filter(
+                xe_id=xe_id,
+                ngay_gio_khoi_hanh__gte=bat_dau - thoi_gian_chay_toi_da(),
+                ngay_gio_khoi_hanh__lte=ket_thuc,
+            )
+            .annotate(ket_thuc=Coalesce("ngay_gio_den", "ngay_gio_khoi_hanh"))
+            .filter(ket_thuc__gte=bat_dau)
+        )
+
+
+    def kem_so_ve_con_lai(self):
+        """Tính số vé còn lại ngay trong câu SQL (dùng để lọc / sắp xếp)."""
+        return self.annotate(ve_con_lai=F("tong_so_ve") - F("so_ve_da_ban") - F("so_ve_dang_giu"))
+
+    def con_it_nhat(self, so_luong):
+        """Chỉ lấy các chuyến còn ít nhất `so_luong` vé."""
+        return self.kem_so_ve_con_lai().filter(ve_con_lai__gte=so_luong)
+
+    def dong_bo_so_ve(self):
+        """Tính lại bộ đếm vé từ bảng Ve (dùng khi dữ liệu bị lệch)."""
+        cap_nhat = {}
+        for trang_thai, truong in Ve.TRUONG_BO_DEM.items():
+            tong = (
+                Ve.objects.filter(chuyen=OuterRef("pk"), trang_thai=trang_thai)
+                .values("chuyen")
+                .annotate(tong=Sum("so_luong"))
+                .values("tong")
+            )
+            cap_nhat[truong] = Coalesce(Subquery(tong), 0)
+        return self.update(**cap_nhat)
+
+
 class Chuyen(models.Model):
     tuyen = models.ForeignKey(Tuyen, on_delete=models.CASCADE, related_name="chuyens")
     xe = models.ForeignKey(Xe, on_delete=models.CASCADE, related_name="chuyens")
@@ -43,6 +105,51 @@ class Chuyen(models.Model):
     ngay_gio_den = models.DateTimeField(blank=True, null=True)
     tong_so_ve = models.PositiveIntegerField()
     gia_ve = models.DecimalField(max_digits=10, decimal_places=2)
+    # Bộ đếm được Ve.save() cập nhật trong cùng transaction, không sửa tay.
+    so_ve_da_ban = models.PositiveIntegerField(default=0, editable=False)
+    so_ve_dang_giu = models.PositiveIntegerField(default=0, editable=False)
+    # Bitmap ghế đã giữ / đã bán (booking.seats.SoDoGhe), ghi trong transaction đặt vé
+    so_do_ghe = models.BinaryField(default=b"", editable=False)
+    # Lần cuối chuyến hoặc số vé đã bán / doanh thu của chuyến thay đổi:
+    # booking.reports.refresh_daily_stats chỉ tổng hợp lại các ngày có chuyến đổi sau lần chạy trước
+    cap_nhat_luc = models.DateTimeField(auto_now=True)
+
+    # Ghi bằng UPDATE trong transaction đặt vé; save() của instance (form admin...)
+    # không ghi lại giá trị đọc từ trước, tránh xoá mất vé / ghế vừa giữ / bán
+    TRUONG_DAT_VE = ("so_ve_da_ban", "so_ve_dang_giu", "so_do_ghe")
+
+    objects = ChuyenQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Chuyến xe"
+        verbose_name_plural = "Chuyến xe"
+        indexes = [
+            # Tìm kiếm theo tuyến + khoảng giờ khởi hành, sắp xếp keyset (ngay_gio_khoi_hanh, id)
+            models.Index(fields=["tuyen", "ngay_gio_khoi_hanh", "id"], name="chuyen_tuyen_khoi_hanh_idx"),
+            # Kiểm tra / rà soát xe trùng lịch theo khoảng (khởi hành, đến) của từng xe
+            models.Index(fields=["xe", "ngay_gio_khoi_hanh", "ngay_gio_den"], name="chuyen_xe_khoi_hanh_den_idx"),
+            # Tìm các chuyến thay đổi từ lần tổng hợp thống kê trước
+            models.Index(fields=["cap_nhat_luc"], name="chuyen_cap_nhat_luc_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._khoi_hanh_goc = instance.__dict__.get("ngay_gio_khoi_hanh")
+        return instance
+
+    def save(self, *args, **kwargs):
+        goc = getattr(self, "_khoi_hanh_goc", None)
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields if not f.primary_key and f.name not in self.TRUONG_DAT_VE
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Đổi ngày khởi hành: ngày cũ không còn chuyến này để đánh dấu qua cap_nhat_luc
+            if goc is not None and timezone.localdate(goc) != timezone.localdate(self.ngay_gio_khoi_hanh):
+                NgayCanTongHop.danh_dau([goc])
+        self._khoi_hanh_goc = self.ngay_gio_khoi_hanh
 
     def clean(self):
         now = timezone.now()
@@ -54,13 +161,36 @@ class Chuyen(models.Model):
             raise ValidationError("Tổng số vé phải lớn hơn 0.")
         if self.gia_ve <= 0:
             raise ValidationError("Giá vé phải lớn hơn 0.")
+        if self.ngay_gio_den and self.ngay_gio_den - self.ngay_gio_khoi_hanh > thoi_gian_chay_toi_da():
+            raise ValidationError(f"Thời gian chạy không được quá {thoi_gian_chay_toi_da()}.")
         if self.xe and self.tong_so_ve > self.xe.so_ghe:
             raise ValidationError(f"Tổng số vé ({self.tong_so_ve}) vượt quá số ghế của xe ({self.xe.so_ghe}).")
+        if self.pk:
+            # Đọc lại bộ đếm: instance có thể được nạp trước khi có vé mới
+            da_dung = (
+                Chuyen.objects.filter(pk=self.pk)
+                .annotate(da_dung=F("so_ve_da_ban") + F("so_ve_dang_giu"))
+                .values_list("da_dung", flat=True).first()
+            ) or 0
+            if self.tong_so_ve < da_dung:
+                raise ValidationError(f"Tổng số vé nhỏ hơn số vé đã bán / đang giữ ({da_dung}).")
+        if self.xe_id:
+            self.kiem_tra_trung_lich()
+
+    def kiem_tra_trung_lich(self):
+        """Báo lỗi nếu xe đã có chuyến khác chồng lên khoảng chạy của chuyến này."""
+        ket_thuc = self.ngay_gio_den or self.ngay_gio_khoi_hanh
+        for chuyen in Chuyen.objects.cua_xe_trong_khoang(self.xe_id, self.ngay_gio_khoi_hanh, ket_thuc).exclude(pk=self.pk):
+            if chong_lan(self.ngay_gio_khoi_hanh, ket_thuc, chuyen.ngay_gio_khoi_hanh, chuyen.ket_thuc):
+                raise ValidationError(
+                    f"Xe đã được xếp cho chuyến khác khởi hành lúc "
+                    f"{timezone.localtime(chuyen.ngay_gio_khoi_hanh).strftime('%d/%m/%Y %H:%M')}."
+                )
 
     @property
     def so_ve_con_lai(self):
-        da_dat = sum(ve.so_luong for ve in self.ves.filter(trang_thai="DA_THANH_TOAN"))
-        return self.tong_so_ve - da_dat
+        # Vé đang giữ chỗ (chưa hết hạn) cũng chiếm chỗ
+        return self.tong_so_ve - self.so_ve_da_ban - self.so_ve_dang_giu
 
     def __str__(self):
         return f"Chuyến {self.tuyen} - {self.ngay_gio_khoi_hanh.strftime('%d/%m/%Y %H:%M')}"
@@ -78,6 +208,46 @@ class Ve(models.Model):
     so_luong = models.PositiveIntegerField()
     trang_thai = models.CharField(max_length=20, choices=TRANG_THAI_CHOICES, default="CHO_THANH_TOAN")
     thoi_gian_dat = models.DateTimeField(auto_now_add=True)
+    han_giu = models.DateTimeField(blank=True, null=True)
+    # Số ghế đã xếp, ví dụ "5,6,7" (trống với vé đặt không qua reserve_seats)
+    ghe = models.CharField(max_length=255, blank=True, default="", editable=False)
+
+    # Trạng thái vé -> bộ đếm tương ứng trên Chuyen
+    TRUONG_BO_DEM = {
+        "DA_THANH_TOAN": "so_ve_da_ban",
+        "CHO_THANH_TOAN": "so_ve_dang_giu",
+    }
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._ghi_nho_trang_thai()
+        return instance
+
+    def _ghi_nho_trang_thai(self):
+        self._trang_thai_goc = (self.chuyen_id, self.trang_thai, self.so_luong)
+
+    @classmethod
+    def cap_nhat_bo_dem(cls, chuyen_id, trang_thai, so_luong):
+        """Cộng `so_luong` (có thể âm) vào bộ đếm của chuyến theo trạng thái."""
+        truong = cls.TRUONG_BO_DEM.get(trang_thai)
+        if truong and so_luong:
+            cap_nhat = {truong: F(truong) + so_luong}
+            if truong == "so_ve_da_ban":
+                cap_nhat["cap_nhat_luc"] = timezone.now()
+            Chuyen.objects.filter(pk=chuyen_id).update(**cap_nhat)
+
+    @classmethod
+    def tra_ghe(cls, chuyen_id, danh_sach_ghe):
+        """Bỏ đánh dấu các ghế trên sơ đồ ghế của chuyến (khoá dòng Chuyen)."""
+        if not danh_sach_ghe:
+            return
+        row = Chuyen.objects.select_for_update().filter(pk=chuyen_id).values_list("so_do_ghe", "tong_so_ve").first()
+        if row is None:  # chuyến đang bị xoá dây chuyền
+            return
+        so_do = SoDoGhe.tu_bytes(*row)
+        so_do.tra(danh_sach_ghe)
+        Chuyen.objects.filter(pk=chuyen_id).update(so_do_ghe=so_do.to_bytes())
 
     def clean(self):
         if self.so_luong <= 0:
@@ -85,12 +255,36 @@ class Ve(models.Model):
         if self.so_luong > self.chuyen.so_ve_con_lai:
             raise ValidationError("Số lượng vé vượt quá số vé còn lại của chuyến.")
 
+    def save(self, *args, **kwargs):
+        goc = getattr(self, "_trang_thai_goc", None)
+        moi = (self.chuyen_id, self.trang_thai, self.so_luong)
+        if goc is None and self.trang_thai == "CHO_THANH_TOAN" and not self.han_giu:
+            expire_minutes = getattr(settings, 'SEAT_HOLD_EXPIRE_MINUTES', 15)
+            self.han_giu = timezone.now() + timezone.timedelta(minutes=expire_minutes)
+        with transaction.atomic():
+            # Cập nhật Chuyen trước khi ghi Ve để khoá dòng chuyến theo cùng thứ tự
+            if goc != moi:
+                if goc is not None:
+                    self.cap_nhat_bo_dem(goc[0], goc[1], -goc[2])
+                self.cap_nhat_bo_dem(*moi)
+                # Vé bị hủy thì trả ghế lại cho chuyến
+                if goc is not None and goc[1] in self.TRUONG_BO_DEM and moi[1] not in self.TRUONG_BO_DEM:
+                    self.tra_ghe(goc[0], parse_ghe(self.ghe))
+            super().save(*args, **kwargs)
+        self._ghi_nho_trang_thai()
+
     def __str__(self):
         return f"Vé {self.id} - {self.khach.ten}"
 
     class Meta:
         verbose_name = "Vé"
         verbose_name_plural = "Vé"
+        indexes = [
+            # Quét khoảng các vé giữ chỗ đã hết hạn
+            models.Index(fields=["trang_thai", "han_giu"], name="ve_trang_thai_han_giu_idx"),
+            # Xuất CSV theo khoảng thời gian đặt (keyset thoi_gian_dat, id)
+            models.Index(fields=["thoi_gian_dat", "id"], name="ve_thoi_gian_dat_idx"),
+        ]
 
 
 # -------------------------
@@ -101,6 +295,8 @@ class ThanhToan(models.Model):
         ("THANH_CONG", "Thành công"),
         ("THAT_BAI", "Thất bại"),
         ("CHO_XU_LY", "Chờ xử lý"),
+        # Tiền đã trừ nhưng vé đã bị hủy và chuyến hết chỗ (booking.payments.confirm_payment)
+        ("CAN_HOAN_TIEN", "Cần hoàn tiền"),
     ]
 
     ve = models.OneToOneField(Ve, on_delete=models.CASCADE, related_name="thanh_toan")
@@ -108,10 +304,13 @@ class ThanhToan(models.Model):
     trang_thai = models.CharField(max_length=20, choices=TRANG_THAI_CHOICES, default="CHO_XU_LY")
     ngay_gio = models.DateTimeField(auto_now_add=True)
     ma_giao_dich = models.CharField(max_length=100, unique=True)
+    # Số tiền chốt tại thời điểm thanh toán, để báo cáo doanh thu SUM/GROUP BY trong DB
+    so_tien = models.DecimalField(max_digits=12, decimal_places=2, editable=False)
 
-    @property
-    def so_tien(self):
-        return self.ve.so_luong * self.ve.chuyen.gia_ve
+    def save(self, *args, **kwargs):
+        if self.so_tien is None:
+            self.so_tien = self.ve.so_luong * self.ve.chuyen.gia_ve
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Thanh toán {self.ma_giao_dich} - {self.trang_thai}"
@@ -119,3 +318,91 @@ class ThanhToan(models.Model):
     class Meta:
         verbose_name = "Thanh toán"
         verbose_name_plural = "Thanh toán"
+        indexes = [
+            # Báo cáo doanh thu theo khoảng ngày
+            models.Index(fields=["trang_thai", "ngay_gio"], name="thanhtoan_trang_thai_ngay_idx"),
+            # Xuất CSV theo khoảng thời gian (keyset ngay_gio, id)
+            models.Index(fields=["ngay_gio", "id"], name="thanhtoan_ngay_gio_idx"),
+        ]
+
+
+class XacNhanThanhToan(models.Model):
+    """Hàng đợi callback từ cổng thanh toán, worker process_payment_callbacks xử lý (booking.payments)."""
+
+    TRANG_THAI_CHOICES = [
+        ("CHO_XU_LY", "Chờ xử lý"),
+        ("DA_XU_LY", "Đã xử lý"),
+        ("LOI", "Lỗi"),
+    ]
+
+    ma_giao_dich = models.CharField(max_length=100)
+    thanh_cong = models.BooleanField()
+    trang_thai = models.CharField(max_length=20, choices=TRANG_THAI_CHOICES, default="CHO_XU_LY")
+    so_lan_thu = models.PositiveSmallIntegerField(default=0)
+    loi = models.TextField(blank=True)
+    ngay_tao = models.DateTimeField(auto_now_add=True)
+    xu_ly_sau = models.DateTimeField(default=timezone.now)
+    xu_ly_luc = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Xác nhận thanh toán"
+        verbose_name_plural = "Xác nhận thanh toán"
+        indexes = [
+            models.Index(fields=["trang_thai", "xu_ly_sau"], name="xacnhan_trang_thai_idx"),
+        ]
+
+    def __str__(self):
+        return f"Xác nhận {self.ma_giao_dich} ({self.trang_thai})"
+
+
+# -------------------------
+# 7. Thống kê theo ngày (dashboard)
+# -------------------------
+class ThongKeNgay(models.Model):
+    """
+    Số liệu tổng hợp theo (ngày khởi hành, tuyến, xe) cho trang dashboard,
+    booking.reports.refresh_daily_stats ghi lại theo từng ngày, không sửa tay.
+    """
+
+    ngay = models.DateField()
+    tuyen = models.ForeignKey(Tuyen, on_delete=models.CASCADE, related_name="+")
+    xe = models.ForeignKey(Xe, on_delete=models.CASCADE, related_name="+")
+    so_chuyen = models.PositiveIntegerField(default=0)
+    so_ghe = models.PositiveIntegerField(default=0)
+    so_ve_da_ban = models.PositiveIntegerField(default=0)
+    doanh_thu = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cap_nhat_luc = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Thống kê ngày"
+        verbose_name_plural = "Thống kê ngày"
+        constraints = [
+            models.UniqueConstraint(fields=["ngay", "tuyen", "xe"], name="thongke_ngay_tuyen_xe_uniq"),
+        ]
+
+    def __str__(self):
+        return f"Thống kê {self.ngay} - {self.tuyen_id}/{self.xe_id}"
+
+
+class NgayCanTongHop(models.Model):
+    """
+    Ngày khởi hành cần tổng hợp lại mà Chuyen.cap_nhat_luc không đánh dấu
+    được: chuyến bị dời sang ngày khác hoặc bị xoá. refresh_daily_stats đọc
+    rồi xoá các dòng đã xử lý.
+    """
+
+    ngay = models.DateField()
+    tao_luc = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Ngày cần tổng hợp"
+        verbose_name_plural = "Ngày cần tổng hợp"
+
+    @classmethod
+    def danh_dau(cls, thoi_diem):
+        """Đánh dấu các ngày (địa phương) của những thời điểm khởi hành đã cho."""
+        ngay = {timezone.localdate(t) for t in thoi_diem}
+        cls.objects.bulk_create([cls(ngay=n) for n in sorted(ngay)])
+
+    def __str__(self):
+        return f"Cần tổng hợp {self.ngay}"
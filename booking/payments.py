@@ -0,0 +1,186 @@
+"""
+Luồng thanh toán: tạo giao dịch, nhận callback của cổng thanh toán qua hàng
+đợi rồi xác nhận.
+
+Mọi thao tác đều idempotent theo `ma_giao_dich`: client bấm lại nút thanh
+toán hay cổng thanh toán gửi lại callback thì vẫn chỉ có một ThanhToan và vé
+chỉ được chuyển sang DA_THANH_TOAN một lần.
+
+Thứ tự khoá giống Ve.save() và release_expired_holds(): Chuyen -> Ve ->
+ThanhToan, nên worker xác nhận không deadlock với người đặt vé hay worker
+hủy vé hết hạn.
+"""
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import Chuyen, ThanhToan, Ve, XacNhanThanhToan
+from .seats import SoDoGhe, format_ghe, parse_ghe
+
+
+def create_payment(ve, phuong_thuc, ma_giao_dich):
+    """
+    Tạo (hoặc trả lại) ThanhToan CHO_XU_LY cho vé với mã giao dịch của cổng.
+
+    Gọi lại với cùng mã trả về đúng bản ghi cũ. Vé chỉ có một ThanhToan
+    (OneToOne) nên khi giao dịch trước THAT_BAI, bản ghi đó được dùng lại cho
+    mã giao dịch mới.
+    """
+    ve_id = ve.pk if isinstance(ve, Ve) else ve
+    try:
+        with transaction.atomic():
+            thanh_toan = ThanhToan.objects.filter(ma_giao_dich=ma_giao_dich).first()
+            if thanh_toan is not None:
+                if thanh_toan.ve_id != ve_id:
+                    raise ValidationError("Mã giao dịch đã được dùng cho vé khác.")
+                return thanh_toan
+
+            ve = Ve.objects.select_related("chuyen").get(pk=ve_id)
+            if ve.trang_thai != "CHO_THANH_TOAN":
+                raise ValidationError("Vé không ở trạng thái chờ thanh toán.")
+            thanh_toan = ThanhToan.objects.filter(ve=ve).first()
+            if thanh_toan is None:
+                return ThanhToan.objects.create(ve=ve, phuong_thuc=phuong_thuc, ma_giao_dich=ma_giao_dich)
+            if thanh_toan.trang_thai != "THAT_BAI":
+                raise ValidationError(f"Vé đã có giao dịch {thanh_toan.ma_giao_dich} đang xử lý.")
+            thanh_toan.ma_giao_dich = ma_giao_dich
+            thanh_toan.phuong_thuc = phuong_thuc
+            thanh_toan.trang_thai = "CHO_XU_LY"
+            thanh_toan.so_tien = ve.so_luong * ve.chuyen.gia_ve
+            thanh_toan.save(update_fields=["ma_giao_dich", "phuong_thuc", "trang_thai", "so_tien"])
+            return thanh_toan
+    except IntegrityError:
+        # Một request trùng chạy song song vừa tạo trước; đọc lại ngoài transaction đã hỏng
+        thanh_toan = ThanhToan.objects.filter(ma_giao_dich=ma_giao_dich, ve_id=ve_id).first()
+        if thanh_toan is None:
+            raise ValidationError("Vé đã có giao dịch khác đang xử lý.")
+        return thanh_toan
+
+
+def _giu_lai_cho(chuyen, ve):
+    """Vé đã bị hủy vì hết hạn giữ chỗ: giữ lại chỗ (và ghế) nếu chuyến còn đủ."""
+    if chuyen.ngay_gio_khoi_hanh <= timezone.now() or ve.so_luong > chuyen.so_ve_con_lai:
+        return False
+    so_do = SoDoGhe.cua_chuyen(chuyen)
+    ghe = parse_ghe(ve.ghe)
+    if not ghe or max(ghe) > so_do.so_ghe or any(so_do.da_dat(g) for g in ghe):
+        ghe = so_do.tim_cho(ve.so_luong)
+        if ghe is None:
+            return False
+    so_do.giu(ghe)
+    Chuyen.objects.filter(pk=chuyen.pk).update(so_do_ghe=so_do.to_bytes())
+    ve.ghe = format_ghe(ghe)
+    return True
+
+
+def confirm_payment(ma_giao_dich, thanh_cong=True):
+    """
+    Áp kết quả giao dịch từ cổng thanh toán, trả về ThanhToan.
+
+    Thành công: Ve -> DA_THANH_TOAN và ThanhToan -> THANH_CONG trong cùng
+    một transaction. Nếu worker hủy vé hết hạn đã kịp hủy vé, chỗ được giữ lại
+    khi chuyến còn đủ; nếu không, giao dịch chuyển sang CAN_HOAN_TIEN.
+    Callback lặp lại cho giao dịch đã xử lý không làm gì thêm.
+    """
+    row = (
+        ThanhToan.objects.filter(ma_giao_dich=ma_giao_dich)
+        .values_list("pk", "ve_id", "ve__chuyen_id").first()
+    )
+    if row is None:
+        raise ValidationError(f"Không tìm thấy giao dịch {ma_giao_dich}.")
+    thanh_toan_id, ve_id, chuyen_id = row
+
+    with transaction.atomic():
+        chuyen = Chuyen.objects.select_for_update().select_related("xe").get(pk=chuyen_id)
+        ve = Ve.objects.select_for_update().get(pk=ve_id)
+        thanh_toan = ThanhToan.objects.select_for_update().get(pk=thanh_toan_id)
+        if thanh_toan.trang_thai != "CHO_XU_LY" or thanh_toan.ma_giao_dich != ma_giao_dich:
+            return thanh_toan
+
+        if not thanh_cong:
+            thanh_toan.trang_thai = "THAT_BAI"
+        elif ve.trang_thai == "CHO_THANH_TOAN" or (ve.trang_thai == "DA_HUY" and _giu_lai_cho(chuyen, ve)):
+            ve.trang_thai = "DA_THANH_TOAN"
+            ve.save()
+            thanh_toan.trang_thai = "THANH_CONG"
+        elif ve.trang_thai == "DA_THANH_TOAN":
+            thanh_toan.trang_thai = "THANH_CONG"
+        else:
+            thanh_toan.trang_thai = "CAN_HOAN_TIEN"
+        thanh_toan.save(update_fields=["trang_thai"])
+        if thanh_toan.trang_thai == "THANH_CONG":
+            # Doanh thu của chuyến đổi: đánh dấu để refresh_daily_stats tổng hợp lại ngày đó
+            # (dòng Chuyen đã được khoá ở trên nên không đảo thứ tự khoá)
+            Chuyen.objects.filter(pk=chuyen.pk).update(cap_nhat_luc=timezone.now())
+        return thanh_toan
+
+
+# -------------------------
+# Callback từ cổng thanh toán
+# -------------------------
+def _secret():
+    return (getattr(settings, "PAYMENT_CALLBACK_SECRET", None) or settings.SECRET_KEY).encode()
+
+
+def callback_signature(ma_giao_dich, thanh_cong):
+    """Chữ ký HMAC-SHA256 của callback (cổng thanh toán ký bằng khoá dùng chung)."""
+    message = f"{ma_giao_dich}:{'1' if thanh_cong else '0'}".encode()
+    return hmac.new(_secret(), message, hashlib.sha256).hexdigest()
+
+
+def verify_signature(ma_giao_dich, thanh_cong, chu_ky):
+    return hmac.compare_digest(callback_signature(ma_giao_dich, thanh_cong), chu_ky or "")
+
+
+def enqueue_callback(ma_giao_dich, thanh_cong):
+    """Ghi callback vào hàng đợi; view trả lời cổng thanh toán ngay, worker xác nhận sau."""
+    return XacNhanThanhToan.objects.create(ma_giao_dich=ma_giao_dich, thanh_cong=thanh_cong)
+
+
+def process_callbacks(batch_size=None, max_attempts=None, now=None):
+    """
+    Xử lý một lô callback đến hạn, trả về (số xử lý xong, số lỗi).
+
+    Mỗi callback là một transaction riêng (khoá dòng hàng đợi bằng SKIP LOCKED
+    nếu database hỗ trợ) để nhiều worker chạy song song và một giao dịch lỗi
+    không giữ khoá chuyến của cả lô. Lỗi (ví dụ callback tới trước khi
+    ThanhToan được tạo) được thử lại với thời gian chờ tăng dần.
+    """
+    batch_size = batch_size or getattr(settings, "PAYMENT_CALLBACK_BATCH_SIZE", 100)
+    max_attempts = max_attempts or getattr(settings, "PAYMENT_CALLBACK_MAX_ATTEMPTS", 8)
+    now = now or timezone.now()
+
+    ids = list(
+        XacNhanThanhToan.objects.filter(trang_thai="CHO_XU_LY", xu_ly_sau__lte=now)
+        .order_by("xu_ly_sau", "id").values_list("pk", flat=True)[:batch_size]
+    )
+    xong = loi = 0
+    for pk in ids:
+        with transaction.atomic():
+            qs = XacNhanThanhToan.objects.filter(pk=pk, trang_thai="CHO_XU_LY")
+            if connection.features.has_select_for_update_skip_locked:
+                qs = qs.select_for_update(skip_locked=True)
+            item = qs.first()
+            if item is None:  # worker khác đang / đã xử lý
+                continue
+            item.so_lan_thu += 1
+            try:
+                with transaction.atomic():
+                    confirm_payment(item.ma_giao_dich, item.thanh_cong)
+            except Exception as e:
+                loi += 1
+                item.loi = "; ".join(e.messages) if isinstance(e, ValidationError) else str(e)
+                if item.so_lan_thu >= max_attempts:
+                    item.trang_thai = "LOI"
+                else:
+                    item.xu_ly_sau = now + timezone.timedelta(seconds=2 ** item.so_lan_thu)
+            else:
+                xong += 1
+                item.trang_thai = "DA_XU_LY"
+                item.xu_ly_luc = timezone.now()
+            item.save(update_fields=["trang_thai", "so_lan_thu", "loi", "xu_ly_sau", "xu_ly_luc"])
+    return xong, loi
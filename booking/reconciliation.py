@@ -0,0 +1,198 @@
+"""
+Đối soát ThanhToan với file quyết toán (settlement) của cổng thanh toán.
+
+File CSV có các cột `ma_giao_dich,trang_thai,so_tien`, trang_thai của cổng
+là THANH_CONG hoặc THAT_BAI. File được đọc dạng stream theo lô: mỗi lô tra
+ThanhToan bằng một câu `ma_giao_dich IN (...)` (dùng unique index), giao
+dịch còn CHO_XU_LY được chốt trạng thái bằng vài câu UPDATE cho cả lô, còn
+các dòng lệch (không có trong hệ thống, sai số tiền, trạng thái khác cổng)
+được ghi vào báo cáo chứ không sửa.
+
+Mỗi lô là một transaction, khoá theo thứ tự Chuyen -> Ve -> ThanhToan giống
+booking.payments.confirm_payment nên chạy song song với worker callback được.
+"""
+import csv
+from collections import Counter
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .cache import invalidate_trip
+from .models import Chuyen, ThanhToan, Ve
+from .payments import confirm_payment
+
+COLUMNS = ["ma_giao_dich", "trang_thai", "so_tien"]
+TRANG_THAI_CONG = ("THANH_CONG", "THAT_BAI")
+MAX_MISMATCHES = 100
+
+# Các loại lệch trong báo cáo
+KHONG_CO = "KHONG_CO"              # cổng có giao dịch, hệ thống không có
+SAI_SO_TIEN = "SAI_SO_TIEN"
+LECH_TRANG_THAI = "LECH_TRANG_THAI"  # hệ thống đã chốt khác với cổng
+CAN_HOAN_TIEN = "CAN_HOAN_TIEN"    # cổng đã trừ tiền nhưng vé đã hủy và chuyến hết chỗ
+DONG_LOI = "DONG_LOI"
+
+
+@dataclass
+class ReconcileResult:
+    rows: int = 0
+    matched: int = 0
+    confirmed: int = 0
+    failed: int = 0
+    mismatch_count: Counter = field(default_factory=Counter)
+    mismatches: list = field(default_factory=list)
+    # csv.writer nhận toàn bộ dòng lệch; `mismatches` chỉ giữ vài dòng đầu
+    report: object = None
+
+    def add_mismatch(self, line, ma_giao_dich, loai, chi_tiet=""):
+        self.mismatch_count[loai] += 1
+        if self.report is not None:
+            self.report.writerow([line, ma_giao_dich, loai, chi_tiet])
+        if len(self.mismatches) < MAX_MISMATCHES:
+            self.mismatches.append((line, ma_giao_dich, loai, chi_tiet))
+
+
+def _doc_dong(stream, result):
+    """Đọc (số dòng, mã, thành công?, số tiền) từ file quyết toán, dòng hỏng ghi vào báo cáo."""
+    # csv.reader + chỉ số cột nhanh hơn DictReader đáng kể với file hàng triệu dòng
+    reader = csv.reader(stream)
+    header = [col.strip() for col in next(reader, [])]
+    thieu = [col for col in COLUMNS if col not in header]
+    if thieu:
+        raise ValueError(f"File quyết toán thiếu cột: {', '.join(thieu)}.")
+    i_ma, i_trang_thai, i_so_tien = (header.index(col) for col in COLUMNS)
+    so_cot = len(header)
+    for row in reader:
+        if not row:
+            continue
+        result.rows += 1
+        if len(row) < so_cot:
+            result.add_mismatch(reader.line_num, row[i_ma] if i_ma < len(row) else "", DONG_LOI, ",".join(row))
+            continue
+        ma = row[i_ma].strip()
+        trang_thai = row[i_trang_thai].strip().upper()
+        try:
+            so_tien = Decimal(row[i_so_tien])
+        except InvalidOperation:
+            so_tien = None
+        if not ma or trang_thai not in TRANG_THAI_CONG or so_tien is None:
+            result.add_mismatch(reader.line_num, ma, DONG_LOI, ",".join(row))
+            continue
+        yield reader.line_num, ma, trang_thai == "THANH_CONG", so_tien
+
+
+def _doi_soat_lo(lo, result, dry_run):
+    """Đối soát một lô {ma_giao_dich: (dòng, thành công?, số tiền)}."""
+    with transaction.atomic():
+        can_chot = {}
+        for pk, ma, trang_thai, so_tien, ve_id, chuyen_id in ThanhToan.objects.filter(
+            ma_giao_dich__in=list(lo)
+        ).values_list("pk", "ma_giao_dich", "trang_thai", "so_tien", "ve_id", "ve__chuyen_id"):
+            if ma not in lo:  # collation không phân biệt hoa thường: coi như không khớp
+                continue
+            line, thanh_cong, so_tien_cong = lo.pop(ma)
+            if so_tien != so_tien_cong:
+                result.add_mismatch(line, ma, SAI_SO_TIEN, f"{so_tien} != {so_tien_cong}")
+            elif trang_thai == "CHO_XU_LY":
+                can_chot[pk] = (line, thanh_cong, ve_id, chuyen_id)
+            elif (trang_thai in ("THANH_CONG", "CAN_HOAN_TIEN")) == thanh_cong:
+                result.matched += 1
+            else:
+                result.add_mismatch(line, ma, LECH_TRANG_THAI, trang_thai)
+        for ma, (line, _, _) in lo.items():
+            result.add_mismatch(line, ma, KHONG_CO)
+        if not can_chot or dry_run:
+            return
+
+        # Khoá theo khoá chính (số nguyên) thay vì lặp lại IN trên mã giao dịch
+        chuyen_tuyen = dict(
+            Chuyen.objects.select_for_update()
+            .filter(pk__in=sorted({chuyen_id for *_, chuyen_id in can_chot.values()})).order_by("pk")
+            .values_list("pk", "tuyen_id")
+        )
+        # Khoá Ve cùng ThanhToan qua JOIN rồi đọc lại: worker callback có thể
+        # vừa chốt giao dịch. Mọi luồng đều khoá Chuyen trước nên không deadlock.
+        ve_khoa = (
+            Ve.objects.select_for_update()
+            .filter(pk__in=[ve_id for _, _, ve_id, _ in can_chot.values()], thanh_toan__trang_thai="CHO_XU_LY")
+            .values_list("pk", "trang_thai", "so_luong", "chuyen_id", "thanh_toan__pk", "thanh_toan__ma_giao_dich")
+        )
+
+        that_bai, thanh_cong, ve_ban, can_xac_nhan = [], [], [], []
+        ban_them = Counter()
+        # Chuyến có doanh thu đổi (kể cả vé đã thanh toán sẵn): cập nhật cap_nhat_luc
+        chuyen_doi = set()
+        for ve_id, trang_thai_ve, so_luong, chuyen_id, pk, ma in ve_khoa:
+            if not can_chot[pk][1]:
+                that_bai.append(pk)
+                continue
+            if trang_thai_ve == "CHO_THANH_TOAN":
+                ve_ban.append(ve_id)
+                ban_them[chuyen_id] += so_luong
+                chuyen_doi.add(chuyen_id)
+                thanh_cong.append(pk)
+            elif trang_thai_ve == "DA_THANH_TOAN":
+                chuyen_doi.add(chuyen_id)
+                thanh_cong.append(pk)
+            else:
+                # Vé đã bị hủy vì hết hạn: để confirm_payment giữ lại chỗ nếu còn
+                can_xac_nhan.append((pk, ma))
+
+        if that_bai:
+            ThanhToan.objects.filter(pk__in=that_bai).update(trang_thai="THAT_BAI")
+        if ve_ban:
+            Ve.objects.filter(pk__in=ve_ban).update(trang_thai="DA_THANH_TOAN")
+        if ban_them:
+            Chuyen.objects.filter(pk__in=ban_them).update(
+                so_ve_dang_giu=F("so_ve_dang_giu") - Case(
+                    *[When(pk=chuyen_id, then=Value(so_luong)) for chuyen_id, so_luong in ban_them.items()],
+                    default=Value(0),
+                ),
+                so_ve_da_ban=F("so_ve_da_ban") + Case(
+                    *[When(pk=chuyen_id, then=Value(so_luong)) for chuyen_id, so_luong in ban_them.items()],
+                    default=Value(0),
+                ),
+            )
+            # UPDATE hàng loạt không phát signal nên phải tự làm mới cache
+            for chuyen_id in ban_them:
+                transaction.on_commit(lambda c=chuyen_id, t=chuyen_tuyen[chuyen_id]: invalidate_trip(c, t))
+        if chuyen_doi:
+            Chuyen.objects.filter(pk__in=chuyen_doi).update(cap_nhat_luc=timezone.now())
+        if thanh_cong:
+            ThanhToan.objects.filter(pk__in=thanh_cong).update(trang_thai="THANH_CONG")
+        result.failed += len(that_bai)
+        result.confirmed += len(thanh_cong)
+
+        for pk, ma in can_xac_nhan:
+            if confirm_payment(ma).trang_thai == "THANH_CONG":
+                result.confirmed += 1
+            else:
+                result.add_mismatch(can_chot[pk][0], ma, CAN_HOAN_TIEN)
+
+
+def reconcile_file(stream, batch_size=None, dry_run=False, report=None):
+    """
+    Đối soát file quyết toán (stream text CSV), trả về ReconcileResult.
+
+    `dry_run` chỉ báo cáo, không chốt giao dịch. `report` là csv.writer
+    (tuỳ chọn) nhận mọi dòng lệch: (dòng, mã giao dịch, loại, chi tiết).
+    """
+    batch_size = batch_size or getattr(settings, "PAYMENT_RECONCILE_BATCH_SIZE", 5000)
+    result = ReconcileResult(report=report)
+    dong = _doc_dong(stream, result)
+    while True:
+        lo = {}
+        for line, ma, thanh_cong, so_tien in islice(dong, batch_size):
+            if ma in lo:
+                result.add_mismatch(line, ma, DONG_LOI, "Trùng mã giao dịch trong file.")
+                continue
+            lo[ma] = (line, thanh_cong, so_tien)
+        if not lo:
+            break
+        _doi_soat_lo(lo, result, dry_run)
+    return result
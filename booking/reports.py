@@ -0,0 +1,181 @@
+"""
+Báo cáo doanh thu tính trong database.
+
+Mỗi hàm là một câu SELECT ... GROUP BY trên ThanhToan.so_tien (đã chốt lúc
+thanh toán), không tải từng đối tượng ThanhToan lên Python.
+
+Dashboard đọc từ bảng ThongKeNgay (một dòng cho mỗi ngày khởi hành / tuyến /
+xe) do refresh_daily_stats() ghi, thay vì quét Ve và ThanhToan mỗi lần mở trang.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Chuyen, NgayCanTongHop, ThanhToan, ThongKeNgay, XacNhanThanhToan
+
+
+def _thanh_toan_thanh_cong(tu=None, den=None):
+    qs = ThanhToan.objects.filter(trang_thai="THANH_CONG")
+    if tu is not None:
+        qs = qs.filter(ngay_gio__gte=tu)
+    if den is not None:
+        qs = qs.filter(ngay_gio__lt=den)
+    return qs
+
+
+def _gom_nhom(qs, *fields):
+    return list(
+        qs.values(*fields)
+        .annotate(doanh_thu=Sum("so_tien"), so_giao_dich=Count("id"), so_ve=Sum("ve__so_luong"))
+        .order_by(*fields)
+    )
+
+
+def revenue_by_route(tu=None, den=None):
+    """Doanh thu theo tuyến trong khoảng [tu, den)."""
+    return _gom_nhom(
+        _thanh_toan_thanh_cong(tu, den),
+        "ve__chuyen__tuyen_id", "ve__chuyen__tuyen__diem_di", "ve__chuyen__tuyen__diem_den",
+    )
+
+
+def revenue_by_day(tu=None, den=None):
+    """Doanh thu theo ngày thanh toán trong khoảng [tu, den)."""
+    return _gom_nhom(_thanh_toan_thanh_cong(tu, den).annotate(ngay=TruncDate("ngay_gio")), "ngay")
+
+
+def revenue_by_vehicle(tu=None, den=None):
+    """Doanh thu theo xe trong khoảng [tu, den)."""
+    return _gom_nhom(_thanh_toan_thanh_cong(tu, den), "ve__chuyen__xe_id", "ve__chuyen__xe__bien_so")
+
+
+def total_revenue(tu=None, den=None):
+    return _thanh_toan_thanh_cong(tu, den).aggregate(doanh_thu=Sum("so_tien"))["doanh_thu"] or 0
+
+
+# -------------------------
+# Thống kê theo ngày cho dashboard
+# -------------------------
+def _loc_theo_ngay(field, danh_sach_ngay):
+    """Q lọc `field` (datetime) thuộc các ngày địa phương đã cho, gộp các ngày liền nhau thành một khoảng."""
+    def dau_ngay(ngay):
+        return timezone.make_aware(datetime.combine(ngay, time.min))
+
+    q = Q()
+    danh_sach_ngay = sorted(danh_sach_ngay)
+    i = 0
+    while i < len(danh_sach_ngay):
+        j = i
+        while j + 1 < len(danh_sach_ngay) and danh_sach_ngay[j + 1] == danh_sach_ngay[j] + timedelta(days=1):
+            j += 1
+        q |= Q(**{
+            f"{field}__gte": dau_ngay(danh_sach_ngay[i]),
+            f"{field}__lt": dau_ngay(danh_sach_ngay[j] + timedelta(days=1)),
+        })
+        i = j + 1
+    return q
+
+
+def _tong_hop_ngay(danh_sach_ngay, cap_nhat_luc):
+    """Tính lại các dòng ThongKeNgay của những ngày khởi hành đã cho (hai câu GROUP BY)."""
+    dong = {}
+    for r in (
+        Chuyen.objects.filter(_loc_theo_ngay("ngay_gio_khoi_hanh", danh_sach_ngay))
+        .annotate(ngay=TruncDate("ngay_gio_khoi_hanh"))
+        .values("ngay", "tuyen_id", "xe_id")
+        .annotate(so_chuyen=Count("id"), so_ghe=Sum("tong_so_ve"), so_ve_da_ban=Sum("so_ve_da_ban"))
+        .order_by()
+    ):
+        dong[r["ngay"], r["tuyen_id"], r["xe_id"]] = ThongKeNgay(cap_nhat_luc=cap_nhat_luc, **r)
+    for r in (
+        ThanhToan.objects.filter(trang_thai="THANH_CONG")
+        .filter(_loc_theo_ngay("ve__chuyen__ngay_gio_khoi_hanh", danh_sach_ngay))
+        .annotate(ngay=TruncDate("ve__chuyen__ngay_gio_khoi_hanh"))
+        .values_list("ngay", "ve__chuyen__tuyen_id", "ve__chuyen__xe_id")
+        .annotate(doanh_thu=Sum("so_tien"))
+        .order_by()
+    ):
+        *khoa, doanh_thu = r
+        if tuple(khoa) in dong:
+            dong[tuple(khoa)].doanh_thu = doanh_thu
+
+    ThongKeNgay.objects.filter(ngay__in=danh_sach_ngay).delete()
+    ThongKeNgay.objects.bulk_create(dong.values())
+
+
+def refresh_daily_stats(full=False, batch_days=31):
+    """
+    Cập nhật bảng ThongKeNgay, trả về số ngày đã tổng hợp lại.
+
+    Chỉ những ngày khởi hành có chuyến đổi (Chuyen.cap_nhat_luc: sửa chuyến,
+    bán / hủy vé đã bán, đổi trạng thái thanh toán) từ lần chạy trước mới
+    được tính lại, mỗi `batch_days` ngày một transaction. Lùi mốc thêm
+    DASHBOARD_STATS_LOOKBACK_SECONDS để không sót transaction commit muộn.
+    Ngày cũ của chuyến bị dời ngày hoặc bị xoá được lấy từ NgayCanTongHop.
+    `full` tính lại toàn bộ.
+    """
+    bat_dau = timezone.now()
+    chuyen = Chuyen.objects.all()
+    moc = None if full else ThongKeNgay.objects.aggregate(moc=Max("cap_nhat_luc"))["moc"]
+    if moc is not None:
+        lui = getattr(settings, "DASHBOARD_STATS_LOOKBACK_SECONDS", 300)
+        chuyen = chuyen.filter(cap_nhat_luc__gte=moc - timedelta(seconds=lui))
+    danh_dau = list(NgayCanTongHop.objects.values_list("pk", "ngay"))
+    danh_sach_ngay = set(
+        chuyen.annotate(ngay=TruncDate("ngay_gio_khoi_hanh")).values_list("ngay", flat=True).distinct().order_by()
+    )
+    if full:
+        ThongKeNgay.objects.exclude(ngay__in=danh_sach_ngay).delete()
+    else:
+        danh_sach_ngay.update(ngay for _, ngay in danh_dau)
+    danh_sach_ngay = sorted(danh_sach_ngay)
+    for i in range(0, len(danh_sach_ngay), batch_days):
+        with transaction.atomic():
+            _tong_hop_ngay(danh_sach_ngay[i:i + batch_days], bat_dau)
+    # Chỉ xoá các dấu đã đọc: dấu ghi thêm trong lúc chạy được xử lý lần sau
+    NgayCanTongHop.objects.filter(pk__in=[pk for pk, _ in danh_dau]).delete()
+    return len(danh_sach_ngay)
+
+
+def _ty_le_lap_day(row):
+    row["ty_le_lap_day"] = round(100 * row["so_ve_da_ban"] / row["so_ghe"], 1) if row["so_ghe"] else 0
+    return row
+
+
+def dashboard_stats(tu_ngay, den_ngay):
+    """
+    Số liệu dashboard cho các ngày khởi hành trong [tu_ngay, den_ngay]:
+    theo ngày, theo tuyến, theo xe (đọc ThongKeNgay) và thanh toán đang chờ.
+    """
+    qs = ThongKeNgay.objects.filter(ngay__gte=tu_ngay, ngay__lte=den_ngay)
+    tong_cot = dict(
+        so_chuyen=Sum("so_chuyen"), so_ghe=Sum("so_ghe"), so_ve_da_ban=Sum("so_ve_da_ban"), doanh_thu=Sum("doanh_thu"),
+    )
+    theo_ngay = [_ty_le_lap_day(r) for r in qs.values("ngay").annotate(**tong_cot).order_by("ngay")]
+    tong = {cot: sum(r[cot] for r in theo_ngay) for cot in tong_cot}
+    theo_tuyen = [
+        _ty_le_lap_day(r) for r in qs.values("tuyen_id", "tuyen__diem_di", "tuyen__diem_den")
+        .annotate(**tong_cot).order_by("-doanh_thu", "tuyen_id")
+    ]
+    theo_xe = [
+        _ty_le_lap_day(r) for r in qs.values("xe_id", "xe__bien_so").annotate(**tong_cot).order_by("-doanh_thu", "xe_id")
+    ]
+    thanh_toan = {
+        r["trang_thai"]: r for r in ThanhToan.objects.filter(trang_thai__in=["CHO_XU_LY", "CAN_HOAN_TIEN"])
+        .values("trang_thai").annotate(so=Count("id"), so_tien=Sum("so_tien")).order_by()
+    }
+    return {
+        "tong": _ty_le_lap_day(tong),
+        "theo_ngay": theo_ngay,
+        "theo_tuyen": theo_tuyen,
+        "theo_xe": theo_xe,
+        "cho_xu_ly": thanh_toan.get("CHO_XU_LY", {"so": 0, "so_tien": 0}),
+        "can_hoan_tien": thanh_toan.get("CAN_HOAN_TIEN", {"so": 0, "so_tien": 0}),
+        "callback_cho": XacNhanThanhToan.objects.filter(trang_thai="CHO_XU_LY").count(),
+        "cap_nhat_luc": ThongKeNgay.objects.aggregate(moc=Max("cap_nhat_luc"))["moc"],
+    }
+
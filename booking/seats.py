@@ -0,0 +1,93 @@
+"""
+Sơ đồ ghế của một chuyến dạng bitmap.
+
+Bit thứ i (tính từ bit thấp) bật nghĩa là ghế số i + 1 đã có người giữ / mua.
+Bitmap được lưu ngay trên dòng Chuyen (`so_do_ghe`, tối đa vài chục byte) nên
+kiểm tra một ghế là O(1) và việc đặt ghế chỉ cần đọc / ghi lại một cột trong
+cùng transaction đang khoá dòng Chuyen (xem services.reserve_seats), không có
+bảng một dòng cho mỗi ghế.
+
+Ghế được đánh số liên tục theo hàng: xe có `so_ghe_moi_hang` = 4 thì hàng đầu
+là ghế 1-4, hàng thứ hai là 5-8, ...
+"""
+
+
+class SoDoGhe:
+    def __init__(self, so_ghe, so_ghe_moi_hang=4, bits=0):
+        self.so_ghe = so_ghe
+        self.so_ghe_moi_hang = max(1, so_ghe_moi_hang or 1)
+        self.bits = bits
+
+    @classmethod
+    def tu_bytes(cls, data, so_ghe, so_ghe_moi_hang=4):
+        return cls(so_ghe, so_ghe_moi_hang, int.from_bytes(bytes(data or b""), "little"))
+
+    @classmethod
+    def cua_chuyen(cls, chuyen):
+        return cls.tu_bytes(chuyen.so_do_ghe, chuyen.tong_so_ve, chuyen.xe.so_ghe_moi_hang)
+
+    def to_bytes(self):
+        # Giữ nguyên các ghế đã đặt kể cả khi tong_so_ve bị giảm sau đó
+        return self.bits.to_bytes((max(self.so_ghe, self.bits.bit_length()) + 7) // 8, "little")
+
+    def da_dat(self, ghe):
+        return bool(self.bits >> (ghe - 1) & 1)
+
+    @property
+    def so_ghe_trong(self):
+        tat_ca = (1 << self.so_ghe) - 1
+        return bin(tat_ca & ~self.bits).count("1")
+
+    @staticmethod
+    def _mask(danh_sach_ghe):
+        mask = 0
+        for ghe in danh_sach_ghe:
+            mask |= 1 << (ghe - 1)
+        return mask
+
+    def giu(self, danh_sach_ghe):
+        """Đánh dấu các ghế đã đặt; báo lỗi nếu ghế không tồn tại hoặc đã có người."""
+        for ghe in danh_sach_ghe:
+            if not 1 <= ghe <= self.so_ghe:
+                raise ValueError(f"Ghế {ghe} không tồn tại.")
+        mask = self._mask(danh_sach_ghe)
+        if self.bits & mask or len(set(danh_sach_ghe)) != len(danh_sach_ghe):
+            trung = [ghe for ghe in danh_sach_ghe if self.da_dat(ghe)]
+            raise ValueError(f"Ghế {', '.join(map(str, trung or danh_sach_ghe))} đã có người đặt.")
+        self.bits |= mask
+
+    def tra(self, danh_sach_ghe):
+        self.bits &= ~self._mask(danh_sach_ghe)
+
+    def _trong(self, bat_dau, so_luong):
+        mask = ((1 << so_luong) - 1) << (bat_dau - 1)
+        return not self.bits & mask
+
+    def tim_cho(self, so_luong):
+        """
+        Chọn `so_luong` ghế cho một vé, ưu tiên ngồi cạnh nhau:
+        1. một dãy liền nhau nằm gọn trong một hàng,
+        2. một dãy số ghế liền nhau (tràn sang hàng sau),
+        3. các ghế trống có số nhỏ nhất.
+        Trả về None nếu không đủ ghế trống.
+        """
+        if so_luong <= 0 or so_luong > self.so_ghe_trong:
+            return None
+        cot = self.so_ghe_moi_hang
+        if so_luong <= cot:
+            for bat_dau in range(1, self.so_ghe - so_luong + 2):
+                if (bat_dau - 1) % cot + so_luong <= cot and self._trong(bat_dau, so_luong):
+                    return list(range(bat_dau, bat_dau + so_luong))
+        for bat_dau in range(1, self.so_ghe - so_luong + 2):
+            if self._trong(bat_dau, so_luong):
+                return list(range(bat_dau, bat_dau + so_luong))
+        return [ghe for ghe in range(1, self.so_ghe + 1) if not self.da_dat(ghe)][:so_luong]
+
+
+def parse_ghe(value):
+    """'3,4,5' -> [3, 4, 5]"""
+    return [int(ghe) for ghe in value.split(",") if ghe] if value else []
+
+
+def format_ghe(danh_sach_ghe):
+    return ",".join(map(str, danh_sach_ghe))
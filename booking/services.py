@@ -0,0 +1,300 @@
+import heapq
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import BinaryField, Case, F, Q, Value, When
+from django.utils import timezone
+
+from .cache import invalidate_route, invalidate_trip
+from .models import Chuyen, Ve, Xe, chong_lan, thoi_gian_chay_toi_da
+from .seats import SoDoGhe, format_ghe, parse_ghe
+
+
+def reserve_seats(chuyen, khach, so_luong, ghe=None):
+    """
+    Giữ `so_luong` chỗ trên chuyến cho khách, trả về Ve ở trạng thái CHO_THANH_TOAN.
+
+    Dòng Chuyen được khoá (SELECT ... FOR UPDATE) nên bước kiểm tra số chỗ
+    và bước tăng bộ đếm nằm trong cùng một transaction: hai người mua cùng
+    lúc không thể cùng vượt qua kiểm tra rồi bán quá số vé.
+
+    Ghế được xếp trên sơ đồ ghế (bitmap) của chuyến trong cùng transaction:
+    theo danh sách `ghe` khách chọn, hoặc tự chọn một dãy ghế liền nhau.
+    """
+    if so_luong <= 0:
+        raise ValidationError("Số lượng vé phải lớn hơn 0.")
+    if ghe is not None and len(ghe) != so_luong:
+        raise ValidationError("Số ghế chọn phải bằng số lượng vé.")
+
+    chuyen_id = chuyen.pk if isinstance(chuyen, Chuyen) else chuyen
+    with transaction.atomic():
+        chuyen = Chuyen.objects.select_for_update().select_related("xe").get(pk=chuyen_id)
+        if chuyen.ngay_gio_khoi_hanh <= timezone.now():
+            raise ValidationError("Chuyến đã khởi hành.")
+        if so_luong > chuyen.so_ve_con_lai:
+            raise ValidationError("Số lượng vé vượt quá số vé còn lại của chuyến.")
+
+        so_do = SoDoGhe.cua_chuyen(chuyen)
+        if ghe is None:
+            ghe = so_do.tim_cho(so_luong)
+            if ghe is None:
+                raise ValidationError("Không còn đủ ghế trống.")
+        try:
+            so_do.giu(ghe)
+        except ValueError as e:
+            raise ValidationError(str(e))
+        Chuyen.objects.filter(pk=chuyen_id).update(so_do_ghe=so_do.to_bytes())
+        return Ve.objects.create(chuyen=chuyen, khach=khach, so_luong=so_luong, ghe=format_ghe(ghe))
+
+
+def release_expired_holds(batch_size=None, now=None):
+    """
+    Hủy các vé CHO_THANH_TOAN đã quá `han_giu` và trả chỗ (cả ghế) về cho chuyến.
+
+    Mỗi lô là một transaction ngắn: tìm vé hết hạn bằng index
+    (trang_thai, han_giu), khoá các chuyến liên quan theo đúng thứ tự mà
+    Ve.save() dùng (Chuyen trước, Ve sau), rồi cập nhật bằng hai câu UPDATE.
+    Trả về tổng số vé đã hủy.
+    """
+    batch_size = batch_size or getattr(settings, 'SEAT_HOLD_SWEEP_BATCH_SIZE', 1000)
+    now = now or timezone.now()
+    da_huy = 0
+    while True:
+        with transaction.atomic():
+            ung_vien = list(
+                Ve.objects.filter(trang_thai="CHO_THANH_TOAN", han_giu__lt=now)
+                .order_by("han_giu")
+                .values_list("pk", "chuyen_id")[:batch_size]
+            )
+            if not ung_vien:
+                break
+            chuyen_ids = sorted({chuyen_id for _, chuyen_id in ung_vien})
+            chuyen_khoa = {
+                pk: (tuyen_id, SoDoGhe.tu_bytes(so_do_ghe, tong_so_ve))
+                for pk, tuyen_id, so_do_ghe, tong_so_ve in Chuyen.objects.select_for_update()
+                .filter(pk__in=chuyen_ids).order_by("pk")
+                .values_list("pk", "tuyen_id", "so_do_ghe", "tong_so_ve")
+            }
+
+            # Đọc lại sau khi khoá: vé có thể vừa được thanh toán
+            het_han = list(
+                Ve.objects.filter(
+                    pk__in=[pk for pk, _ in ung_vien], trang_thai="CHO_THANH_TOAN", han_giu__lt=now
+                ).values_list("pk", "chuyen_id", "so_luong", "ghe")
+            )
+            if het_han:
+                Ve.objects.filter(pk__in=[pk for pk, _, _, _ in het_han]).update(trang_thai="DA_HUY")
+                tra_lai = Counter()
+                tra_ghe = set()
+                for _, chuyen_id, so_luong, ghe in het_han:
+                    tra_lai[chuyen_id] += so_luong
+                    if ghe:
+                        chuyen_khoa[chuyen_id][1].tra(parse_ghe(ghe))
+                        tra_ghe.add(chuyen_id)
+                cap_nhat = {
+                    "so_ve_dang_giu": F("so_ve_dang_giu") - Case(
+                        *[When(pk=chuyen_id, then=Value(so_luong)) for chuyen_id, so_luong in tra_lai.items()],
+                        default=Value(0),
+                    ),
+                }
+                if tra_ghe:
+                    cap_nhat["so_do_ghe"] = Case(
+                        *[When(pk=chuyen_id, then=Value(chuyen_khoa[chuyen_id][1].to_bytes())) for chuyen_id in tra_ghe],
+                        default=F("so_do_ghe"),
+                        output_field=BinaryField(),
+                    )
+                Chuyen.objects.filter(pk__in=tra_lai).update(**cap_nhat)
+                # UPDATE hàng loạt không phát signal nên phải tự làm mới cache
+                # Gắn tuyến ngay lúc đăng ký: khi chạy trong transaction ngoài,
+                # callback chỉ chạy lúc commit ngoài, khi chuyen_khoa đã là của lô khác
+                for chuyen_id in tra_lai:
+                    transaction.on_commit(
+                        lambda c=chuyen_id, t=chuyen_khoa[chuyen_id][0]: invalidate_trip(c, t)
+                    )
+            da_huy += len(het_han)
+        if len(ung_vien) < batch_size:
+            break
+    return da_huy
+
+
+def encode_cursor(chuyen):
+    """Mốc keyset của một chuyến: `<micro giây epoch>-<id>`."""
+    epoch = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    delta = chuyen.ngay_gio_khoi_hanh - epoch
+    micro = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return f"{micro}-{chuyen.pk}"
+
+
+def decode_cursor(cursor):
+    """Trả về (ngay_gio_khoi_hanh, id) hoặc None nếu mốc không hợp lệ."""
+    try:
+        micro, pk = (int(x) for x in cursor.split("-"))
+        return datetime(1970, 1, 1, tzinfo=dt_timezone.utc) + timedelta(microseconds=micro), pk
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def search_trips(diem_di, diem_den, tu_ngay=None, den_ngay=None, so_ve=1,
+                 gia_tu=None, gia_den=None, sau=None, limit=20):
+    """
+    Tìm chuyến theo tuyến và khoảng ngày, phân trang keyset theo
+    (ngay_gio_khoi_hanh, id) để trang sau không phải OFFSET qua các trang trước.
+
+    Trả về (danh_sach_chuyen, moc_trang_sau | None).
+    """
+    now = timezone.now()
+    bat_dau = now
+    if tu_ngay:
+        bat_dau = max(now, timezone.make_aware(datetime.combine(tu_ngay, time.min)))
+
+    qs = Chuyen.objects.filter(
+        tuyen__diem_di=diem_di,
+        tuyen__diem_den=diem_den,
+        ngay_gio_khoi_hanh__gte=bat_dau,
+    )
+    if den_ngay:
+        qs = qs.filter(ngay_gio_khoi_hanh__lt=timezone.make_aware(datetime.combine(den_ngay + timedelta(days=1), time.min)))
+    if gia_tu is not None:
+        qs = qs.filter(gia_ve__gte=gia_tu)
+    if gia_den is not None:
+        qs = qs.filter(gia_ve__lte=gia_den)
+    moc = decode_cursor(sau) if sau else None
+    if moc:
+        ngay, pk = moc
+        qs = qs.filter(Q(ngay_gio_khoi_hanh__gt=ngay) | Q(ngay_gio_khoi_hanh=ngay, pk__gt=pk))
+
+    ket_qua = list(
+        qs.con_it_nhat(so_ve or 1)
+        .select_related("tuyen", "xe")
+        .order_by("ngay_gio_khoi_hanh", "pk")[:limit + 1]
+    )
+    if len(ket_qua) > limit:
+        ket_qua = ket_qua[:limit]
+        return ket_qua, encode_cursor(ket_qua[-1])
+    return ket_qua, None
+
+
+def _lich_khoi_hanh(gio_khoi_hanh, ngay_trong_tuan, tu_ngay, den_ngay):
+    """Sinh lần lượt các thời điểm khởi hành (aware) trong khoảng ngày."""
+    ngay = tu_ngay
+    while ngay <= den_ngay:
+        if ngay.weekday() in ngay_trong_tuan:
+            yield timezone.make_aware(datetime.combine(ngay, gio_khoi_hanh))
+        ngay += timedelta(days=1)
+
+
+def generate_schedule(tuyen, xe, gio_khoi_hanh, ngay_trong_tuan, tu_ngay, den_ngay, gia_ve,
+                      thoi_gian_chay=None, tong_so_ve=None, batch_size=None):
+    """
+    Tạo hàng loạt chuyến lặp lại: mỗi ngày trong `ngay_trong_tuan` (0 = thứ Hai)
+    từ `tu_ngay` tới `den_ngay`, khởi hành lúc `gio_khoi_hanh`.
+
+    Các ràng buộc của Chuyen.clean() được kiểm tra một lần cho cả lịch. Việc
+    trùng xe được phát hiện bằng một câu query lấy các chuyến cũ của xe nằm
+    trong khoảng lịch, rồi đối chiếu với lịch mới (đã sắp xếp) bằng bisect.
+    Chuyến được ghi bằng bulk_create theo lô trong một transaction, dòng Xe bị
+    khoá để hai lịch cho cùng một xe không chen nhau. Trả về số chuyến đã tạo.
+    """
+    batch_size = batch_size or getattr(settings, 'SCHEDULE_BULK_BATCH_SIZE', 1000)
+    ngay_trong_tuan = {int(ngay) for ngay in ngay_trong_tuan}
+    tong_so_ve = tong_so_ve or xe.so_ghe
+    if not ngay_trong_tuan or not ngay_trong_tuan <= set(range(7)):
+        raise ValidationError("Ngày trong tuần không hợp lệ.")
+    if den_ngay < tu_ngay:
+        raise ValidationError("Ngày kết thúc phải sau ngày bắt đầu.")
+    if gia_ve <= 0:
+        raise ValidationError("Giá vé phải lớn hơn 0.")
+    if tong_so_ve <= 0:
+        raise ValidationError("Tổng số vé phải lớn hơn 0.")
+    if tong_so_ve > xe.so_ghe:
+        raise ValidationError(f"Tổng số vé ({tong_so_ve}) vượt quá số ghế của xe ({xe.so_ghe}).")
+    if thoi_gian_chay is not None and thoi_gian_chay <= timedelta(0):
+        raise ValidationError("Thời gian chạy phải lớn hơn 0.")
+    if thoi_gian_chay is not None and thoi_gian_chay > thoi_gian_chay_toi_da():
+        raise ValidationError(f"Thời gian chạy không được quá {thoi_gian_chay_toi_da()}.")
+
+    khoi_hanh = list(_lich_khoi_hanh(gio_khoi_hanh, ngay_trong_tuan, tu_ngay, den_ngay))
+    if not khoi_hanh:
+        return 0
+    if khoi_hanh[0] < timezone.now():
+        raise ValidationError("Ngày giờ khởi hành không được sớm hơn hiện tại.")
+    thoi_gian_chay = thoi_gian_chay or timedelta(0)
+    # Lịch không được tự chồng lấn: so với khoảng cách ngắn nhất giữa hai chuyến
+    # liên tiếp (lịch thưa như mỗi tuần một chuyến cho phép chạy quá một ngày)
+    khoang_cach = min((sau - truoc for truoc, sau in zip(khoi_hanh, khoi_hanh[1:])), default=None)
+    if khoang_cach is not None and thoi_gian_chay > khoang_cach:
+        raise ValidationError("Thời gian chạy dài hơn khoảng cách giữa hai chuyến liên tiếp của lịch.")
+    ket_thuc = [bat_dau + thoi_gian_chay for bat_dau in khoi_hanh]
+
+    with transaction.atomic():
+        Xe.objects.select_for_update().get(pk=xe.pk)
+        chuyen_cu = Chuyen.objects.cua_xe_trong_khoang(xe.pk, khoi_hanh[0], ket_thuc[-1]).values_list(
+            "ngay_gio_khoi_hanh", "ket_thuc"
+        )
+        trung = []
+        for bat_dau_cu, ket_thuc_cu in chuyen_cu:
+            # Lịch mới không tự chồng lấn nên `ket_thuc` tăng dần: bỏ qua các
+            # chuyến đã kết thúc trước khi chuyến cũ bắt đầu.
+            i = bisect_right(ket_thuc, bat_dau_cu)
+            if i and khoi_hanh[i - 1] == bat_dau_cu:
+                i -= 1
+            while i < len(khoi_hanh) and khoi_hanh[i] <= ket_thuc_cu:
+                if chong_lan(khoi_hanh[i], ket_thuc[i], bat_dau_cu, ket_thuc_cu):
+                    trung.append(khoi_hanh[i])
+                i += 1
+        if trung:
+            trung = sorted(set(trung))
+            hien_thi = ", ".join(timezone.localtime(t).strftime('%d/%m/%Y %H:%M') for t in trung[:5])
+            raise ValidationError(f"Xe {xe.bien_so} đã có chuyến trùng giờ ({len(trung)} chuyến): {hien_thi}.")
+
+        chuyen_moi = (
+            Chuyen(
+                tuyen=tuyen, xe=xe, ngay_gio_khoi_hanh=bat_dau,
+                ngay_gio_den=den if thoi_gian_chay else None,
+                tong_so_ve=tong_so_ve, gia_ve=gia_ve,
+            )
+            for bat_dau, den in zip(khoi_hanh, ket_thuc)
+        )
+        while lo := list(islice(chuyen_moi, batch_size)):
+            Chuyen.objects.bulk_create(lo)
+        # bulk_create không phát signal nên phải tự làm mới cache tìm kiếm của tuyến
+        transaction.on_commit(lambda: invalidate_route(tuyen.pk))
+    return len(khoi_hanh)
+
+
+def audit_vehicle_overlaps(tu=None, xe_ids=None, chunk_size=2000):
+    """
+    Rà soát toàn bộ lịch xe trong một lượt, sinh ra các cặp chuyến trùng xe
+    (xe_id, chuyen_id_truoc, chuyen_id_sau), có thể giới hạn trong `xe_ids`.
+
+    Các chuyến được đọc theo thứ tự (xe, ngay_gio_khoi_hanh) của index
+    chuyen_xe_khoi_hanh_den_idx. Với mỗi xe, heap giữ các chuyến đang chạy
+    theo giờ kết thúc: chuyến nào kết thúc trước khi chuyến hiện tại khởi hành
+    thì bị loại, mọi chuyến còn lại đều trùng với nó. Tổng chi phí
+    O(n log n + số cặp trùng) thay vì so từng cặp.
+    """
+    qs = Chuyen.objects.all()
+    if tu is not None:
+        qs = qs.filter(ngay_gio_khoi_hanh__gte=tu - thoi_gian_chay_toi_da())
+    if xe_ids is not None:
+        qs = qs.filter(xe_id__in=xe_ids)
+    rows = qs.order_by("xe_id", "ngay_gio_khoi_hanh", "pk").values_list(
+        "xe_id", "pk", "ngay_gio_khoi_hanh", "ngay_gio_den"
+    )
+    xe_hien_tai, dang_chay = None, []
+    for xe_id, pk, bat_dau, ket_thuc in rows.iterator(chunk_size=chunk_size):
+        if xe_id != xe_hien_tai:
+            xe_hien_tai, dang_chay = xe_id, []
+        ket_thuc = ket_thuc or bat_dau
+        # Heap theo (giờ kết thúc, giờ khởi hành): chuyến khởi hành cùng lúc luôn bị giữ lại
+        while dang_chay and dang_chay[0][0] <= bat_dau and dang_chay[0][1] < bat_dau:
+            heapq.heappop(dang_chay)
+        for ket_thuc_truoc, _, pk_truoc in dang_chay:
+            if tu is None or min(ket_thuc, ket_thuc_truoc) >= tu:
+                yield xe_id, pk_truoc, pk
+        heapq.heappush(dang_chay, (ket_thuc, bat_dau, pk))
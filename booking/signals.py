@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_route_lookup, invalidate_trip
+from .models import Chuyen, NgayCanTongHop, ThanhToan, Tuyen, Ve
+from .seats import parse_ghe
+
+
+@receiver(post_delete, sender=Ve)
+def tra_lai_ve_khi_xoa(sender, instance, **kwargs):
+    """Trả số vé (và ghế) của vé bị xoá (kể cả xoá dây chuyền) về cho chuyến."""
+    chuyen_id, trang_thai, so_luong = getattr(
+        instance, "_trang_thai_goc", (instance.chuyen_id, instance.trang_thai, instance.so_luong)
+    )
+    Ve.cap_nhat_bo_dem(chuyen_id, trang_thai, -so_luong)
+    if trang_thai in Ve.TRUONG_BO_DEM:
+        Ve.tra_ghe(chuyen_id, parse_ghe(instance.ghe))
+
+
+@receiver(post_delete, sender=Chuyen)
+def danh_dau_ngay_khi_xoa_chuyen(sender, instance, **kwargs):
+    """Chuyến bị xoá: ngày khởi hành của nó phải được tổng hợp lại."""
+    NgayCanTongHop.danh_dau([instance.ngay_gio_khoi_hanh])
+
+
+# -------------------------
+# Làm mới cache tìm kiếm (sau khi transaction commit)
+# -------------------------
+def _invalidate_on_commit(chuyen_id, tuyen_id):
+    transaction.on_commit(lambda: invalidate_trip(chuyen_id, tuyen_id))
+
+
+@receiver([post_save, post_delete], sender=Tuyen)
+def lam_moi_cache_tuyen(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_route_lookup(instance.diem_di, instance.diem_den))
+
+
+@receiver([post_save, post_delete], sender=Chuyen)
+def lam_moi_cache_chuyen(sender, instance, **kwargs):
+    _invalidate_on_commit(instance.pk, instance.tuyen_id)
+
+
+@receiver([post_save, post_delete], sender=Ve)
+def lam_moi_cache_ve(sender, instance, **kwargs):
+    if Ve.chuyen.is_cached(instance):
+        tuyen_id = instance.chuyen.tuyen_id
+    else:
+        tuyen_id = Chuyen.objects.filter(pk=instance.chuyen_id).values_list("tuyen_id", flat=True).first()
+    if tuyen_id is not None:
+        _invalidate_on_commit(instance.chuyen_id, tuyen_id)
+
+
+@receiver([post_save, post_delete], sender=ThanhToan)
+def lam_moi_cache_thanh_toan(sender, instance, **kwargs):
+    ids = Ve.objects.filter(pk=instance.ve_id).values_list("chuyen_id", "chuyen__tuyen_id").first()
+    if ids:
+        _invalidate_on_commit(*ids)
@@ -1,3 +1,1020 @@
-from django.test import TestCase
+import io
+import threading
+import time
+from unittest import mock, skipIf
+from datetime import datetime, time as dt_time, timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import Account, KhachHang
+from . import analytics
+from .cache import cached_search_trips, cached_so_ve_con_lai, trip_cache
+from .gateway import FakeGateway
+from .models import Tuyen, Xe, Chuyen, Ve, ThanhToan, ThongKeNgay, NgayCanTongHop, XacNhanThanhToan, thoi_gian_chay_toi_da
+from .payments import callback_signature, confirm_payment, create_payment, process_callbacks
+from .reconciliation import reconcile_file
+from .reports import (
+    dashboard_stats, refresh_daily_stats, revenue_by_day, revenue_by_route, revenue_by_vehicle, total_revenue,
+)
+from .services import audit_vehicle_overlaps, encode_cursor, generate_schedule, release_expired_holds, reserve_seats, search_trips
+from .exports import iter_export as iter_export_ke_toan
+from .seats import SoDoGhe, parse_ghe
+from .timetable import COLUMNS, import_file, iter_export
+from .views import (
+    AdminChuyenCreateView, AdminChuyenListView, AdminChuyenUpdateView, AdminKeToanExportView, AdminPaymentListView, AdminVeListView, AdminXuatDuLieuView,
+    ChuyenSearchView, payment_callback,
+)
+
+
+def tao_chuyen(tong_so_ve=40, **kwargs):
+    tuyen, _ = Tuyen.objects.get_or_create(diem_di="Hà Nội", diem_den="Hải Phòng")
+    xe, _ = Xe.objects.get_or_create(bien_so="29B-12345", defaults={"loai_xe": "Giường nằm", "so_ghe": 45})
+    kwargs.setdefault("ngay_gio_khoi_hanh", timezone.now() + timedelta(days=1))
+    kwargs.setdefault("gia_ve", 150000)
+    return Chuyen.objects.create(tuyen=tuyen, xe=xe, tong_so_ve=tong_so_ve, **kwargs)
+
+
+def tao_khach(so=0):
+    return KhachHang.objects.create(ten=f"Khách {so}", so_dien_thoai=f"09{so:08d}", email=f"khach{so}@example.com")
+
+
+class BoDemSoVeTests(TestCase):
+    def setUp(self):
+        self.chuyen = tao_chuyen()
+        self.khach = tao_khach()
+
+    def test_bo_dem_theo_trang_thai_ve(self):
+        ve = Ve.objects.create(chuyen=self.chuyen, khach=self.khach, so_luong=3)
+        self.chuyen.refresh_from_db()
+        self.assertEqual((self.chuyen.so_ve_da_ban, self.chuyen.so_ve_dang_giu), (0, 3))
+
+        ve.trang_thai = "DA_THANH_TOAN"
+        ve.save()
+        self.chuyen.refresh_from_db()
+        self.assertEqual((self.chuyen.so_ve_da_ban, self.chuyen.so_ve_dang_giu), (3, 0))
+        self.assertEqual(self.chuyen.so_ve_con_lai, 37)
+
+        ve = Ve.objects.get(pk=ve.pk)
+        ve.trang_thai = "DA_HUY"
+        ve.save()
+        self.chuyen.refresh_from_db()
+        self.assertEqual((self.chuyen.so_ve_da_ban, self.chuyen.so_ve_dang_giu), (0, 0))
+
+    def test_xoa_khach_tra_lai_ve(self):
+        Ve.objects.create(chuyen=self.chuyen, khach=self.khach, so_luong=2, trang_thai="DA_THANH_TOAN")
+        self.khach.delete()
+        self.chuyen.refresh_from_db()
+        self.assertEqual(self.chuyen.so_ve_da_ban, 0)
+
+    def test_doc_so_ve_con_lai_cho_nhieu_chuyen_mot_query(self):
+        for _ in range(5):
+            chuyen = tao_chuyen()
+            Ve.objects.create(chuyen=chuyen, khach=self.khach, so_luong=2, trang_thai="DA_THANH_TOAN")
+        with self.assertNumQueries(1):
+            con_lai = [c.so_ve_con_lai for c in Chuyen.objects.all()]
+        self.assertEqual(sorted(con_lai), [38] * 5 + [40])
+        self.assertEqual(Chuyen.objects.con_it_nhat(39).count(), 1)
+
+    def test_dong_bo_so_ve(self):
+        Ve.objects.create(chuyen=self.chuyen, khach=self.khach, so_luong=4, trang_thai="DA_THANH_TOAN")
+        Chuyen.objects.update(so_ve_da_ban=0)
+        Chuyen.objects.dong_bo_so_ve()
+        self.chuyen.refresh_from_db()
+        self.assertEqual(self.chuyen.so_ve_da_ban, 4)
+
+
+    def test_luu_instance_cu_khong_ghi_de_bo_dem(self):
+        cu = Chuyen.objects.get(pk=self.chuyen.pk)
+        reserve_seats(self.chuyen, self.khach, 3)
+        cu.gia_ve = 200000
+        cu.save()
+        self.chuyen.refresh_from_db()
+        self.assertEqual((self.chuyen.so_ve_dang_giu, self.chuyen.gia_ve), (3, 200000))
+
+
+    def test_khong_giam_tong_so_ve_duoi_so_da_dung(self):
+        reserve_seats(self.chuyen, self.khach, 2)
+        chuyen = Chuyen.objects.get(pk=self.chuyen.pk)
+        chuyen.tong_so_ve = 1
+        with self.assertRaisesMessage(ValidationError, "nhỏ hơn số vé đã bán / đang giữ (2)"):
+            chuyen.clean()
+        chuyen.tong_so_ve = 2
+        chuyen.clean()
+
+
+class ReserveSeatsTests(TestCase):
+    def setUp(self):
+        self.chuyen = tao_chuyen(tong_so_ve=5)
+        self.khach = tao_khach()
+
+    def test_giu_cho_tang_bo_dem(self):
+        ve = reserve_seats(self.chuyen, self.khach, 3)
+        self.assertEqual(ve.trang_thai, "CHO_THANH_TOAN")
+        self.chuyen.refresh_from_db()
+        self.assertEqual(self.chuyen.so_ve_dang_giu, 3)
+
+    def test_tu_choi_khi_het_cho(self):
+        reserve_seats(self.chuyen, self.khach, 4)
+        with self.assertRaises(ValidationError):
+            reserve_seats(self.chuyen, self.khach, 2)
+        self.assertEqual(Ve.objects.count(), 1)
+
+    def test_tu_choi_chuyen_da_khoi_hanh(self):
+        Chuyen.objects.filter(pk=self.chuyen.pk).update(ngay_gio_khoi_hanh=timezone.now() - timedelta(hours=1))
+        with self.assertRaises(ValidationError):
+            reserve_seats(self.chuyen, self.khach, 1)
+
+
+class SoDoGheTests(TestCase):
+    def test_sua_chuyen_tu_admin_giu_nguyen_so_do_ghe(self):
+        chuyen = tao_chuyen(tong_so_ve=10)
+        khach = tao_khach()
+        staff = Account.objects.create_user(username="staff", email="staff@example.com", password="x", is_staff=True)
+        request = RequestFactory().post("/", {
+            "tuyen": chuyen.tuyen_id, "xe": chuyen.xe_id, "tong_so_ve": 10, "gia_ve": 200000,
+            "ngay_gio_khoi_hanh": timezone.localtime(chuyen.ngay_gio_khoi_hanh).strftime("%Y-%m-%d %H:%M"),
+        })
+        request.user = staff
+        kiem_tra, da_giu = Chuyen.kiem_tra_trung_lich, []
+
+        def khach_giu_ghe_cung_luc(instance):
+            # Khách giữ ghế sau khi view đã nạp chuyến, trước khi form được lưu
+            if not da_giu:
+                da_giu.append(reserve_seats(chuyen, khach, 2))
+            kiem_tra(instance)
+
+        with mock.patch.object(Chuyen, "kiem_tra_trung_lich", autospec=True, side_effect=khach_giu_ghe_cung_luc):
+            self.assertEqual(AdminChuyenUpdateView.as_view()(request, pk=chuyen.pk).status_code, 302)
+        ve = da_giu[0]
+
+        chuyen.refresh_from_db()
+        self.assertEqual(chuyen.gia_ve, 200000)
+        so_do = SoDoGhe.tu_bytes(chuyen.so_do_ghe, chuyen.tong_so_ve)
+        self.assertTrue(all(so_do.da_dat(ghe) for ghe in parse_ghe(ve.ghe)))
+        self.assertEqual(parse_ghe(reserve_seats(chuyen, khach, 2).ghe), [3, 4])
+
+    def test_tim_day_ghe_lien_nhau_trong_mot_hang(self):
+        so_do = SoDoGhe(12, so_ghe_moi_hang=4)
+        so_do.giu([1, 6])
+        self.assertEqual(so_do.tim_cho(3), [2, 3, 4])
+        self.assertEqual(so_do.tim_cho(4), [9, 10, 11, 12])
+        so_do.giu([10])
+        # Không còn hàng nào trống 4 ghế: lấy dãy số liền nhau tràn sang hàng sau
+        self.assertEqual(so_do.tim_cho(4), [2, 3, 4, 5])
+        so_do.giu([3, 8])
+        # Không còn dãy liền nhau nào: lấy các ghế trống số nhỏ nhất
+        self.assertEqual(so_do.tim_cho(5), [2, 4, 5, 7, 9])
+        self.assertIsNone(so_do.tim_cho(8))
+
+    def test_giu_va_tra_ghe(self):
+        so_do = SoDoGhe.tu_bytes(b"", 10)
+        so_do.giu([2, 9])
+        self.assertTrue(so_do.da_dat(9))
+        self.assertEqual(so_do.so_ghe_trong, 8)
+        with self.assertRaisesMessage(ValueError, "Ghế 9 đã có người đặt"):
+            so_do.giu([8, 9])
+        with self.assertRaisesMessage(ValueError, "Ghế 11 không tồn tại"):
+            so_do.giu([11])
+        so_do = SoDoGhe.tu_bytes(so_do.to_bytes(), 10)
+        so_do.tra([9])
+        self.assertEqual(so_do.to_bytes(), b"\x02\x00")
+
+    def test_dat_ve_xep_ghe_va_tra_ghe(self):
+        chuyen = tao_chuyen(tong_so_ve=8)
+        khach = tao_khach()
+        ve_1 = reserve_seats(chuyen, khach, 3)
+        ve_2 = reserve_seats(chuyen, khach, 2, ghe=[7, 8])
+        ve_3 = reserve_seats(chuyen, khach, 2)
+        self.assertEqual([ve_1.ghe, ve_2.ghe, ve_3.ghe], ["1,2,3", "7,8", "5,6"])
+        with self.assertRaisesMessage(ValidationError, "Ghế 5 đã có người đặt"):
+            reserve_seats(chuyen, khach, 1, ghe=[5])
+
+        ve_1.trang_thai = "DA_HUY"
+        ve_1.save()
+        ve_3.delete()
+        Ve.objects.filter(pk=ve_2.pk).update(han_giu=timezone.now() - timedelta(minutes=1))
+        release_expired_holds()
+        chuyen.refresh_from_db()
+        self.assertEqual(SoDoGhe.cua_chuyen(chuyen).so_ghe_trong, 8)
+        self.assertEqual(chuyen.so_ve_dang_giu, 0)
+
+
+class ReleaseExpiredHoldsTests(TestCase):
+    def setUp(self):
+        self.chuyen = tao_chuyen(tong_so_ve=10)
+        self.khach = tao_khach()
+
+    def test_huy_ve_het_han_theo_lo(self):
+        cu = timezone.now() - timedelta(minutes=1)
+        for _ in range(5):
+            reserve_seats(self.chuyen, self.khach, 1)
+        Ve.objects.update(han_giu=cu)
+        con_han = reserve_seats(self.chuyen, self.khach, 2)
+        self.chuyen.refresh_from_db()
+        self.assertEqual(self.chuyen.so_ve_con_lai, 3)
+
+        self.assertEqual(release_expired_holds(batch_size=2), 5)
+        self.chuyen.refresh_from_db()
+        self.assertEqual(self.chuyen.so_ve_dang_giu, 2)
+        self.assertEqual(self.chuyen.so_ve_con_lai, 8)
+        self.assertEqual(Ve.objects.get(pk=con_han.pk).trang_thai, "CHO_THANH_TOAN")
+        self.assertEqual(Ve.objects.filter(trang_thai="DA_HUY").count(), 5)
+
+    def test_ve_da_thanh_toan_khong_bi_huy(self):
+        ve = reserve_seats(self.chuyen, self.khach, 1)
+        ve.trang_thai = "DA_THANH_TOAN"
+        ve.han_giu = timezone.now() - timedelta(minutes=1)
+        ve.save()
+        self.assertEqual(release_expired_holds(), 0)
+
+
+class SearchTripsTests(TestCase):
+    def setUp(self):
+        bat_dau = timezone.now() + timedelta(days=1)
+        self.chuyens = [tao_chuyen(ngay_gio_khoi_hanh=bat_dau + timedelta(hours=i), gia_ve=100000 + i) for i in range(5)]
+        # Trùng giờ khởi hành để kiểm tra mốc keyset theo id
+        self.chuyens.append(tao_chuyen(ngay_gio_khoi_hanh=self.chuyens[-1].ngay_gio_khoi_hanh, gia_ve=100004))
+        tao_chuyen(ngay_gio_khoi_hanh=bat_dau - timedelta(days=2))
+
+    def test_phan_trang_keyset(self):
+        trang, moc = search_trips("Hà Nội", "Hải Phòng", limit=4)
+        self.assertEqual(trang, self.chuyens[:4])
+        trang, moc_sau = search_trips("Hà Nội", "Hải Phòng", sau=moc, limit=4)
+        self.assertEqual(trang, self.chuyens[4:])
+        self.assertIsNone(moc_sau)
+
+    def test_loc_theo_so_ve_va_gia(self):
+        Chuyen.objects.filter(pk=self.chuyens[0].pk).update(so_ve_da_ban=39)
+        trang, _ = search_trips("Hà Nội", "Hải Phòng", so_ve=2, gia_den=100002)
+        self.assertEqual(trang, self.chuyens[1:3])
+        trang, _ = search_trips("Hải Phòng", "Hà Nội")
+        self.assertEqual(trang, [])
+
+
+    def test_view_phan_trang_bang_moc(self):
+        cache.clear()
+        trip_cache.clear()
+        url = reverse("chuyen-search")
+        query = {"diem_di": "Hà Nội", "diem_den": "Hải Phòng"}
+        with mock.patch.object(ChuyenSearchView, "page_size", 4):
+            response = self.client.get(url, query)
+            self.assertEqual(list(response.context["danh_sach_chuyen"]), self.chuyens[:4])
+            trang_sau_url = response.context["trang_sau_url"]
+            self.assertIn("sau=", trang_sau_url)
+            response = self.client.get(url + trang_sau_url)
+            self.assertEqual(list(response.context["danh_sach_chuyen"]), self.chuyens[4:])
+            self.assertIsNone(response.context["trang_sau_url"])
+
+            # Mốc hỏng: trả trang đầu, không lỗi 500
+            for sau in ("abc", "1-2-3", "99999999999999999999-1"):
+                response = self.client.get(url, {**query, "sau": sau})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context["danh_sach_chuyen"]), self.chuyens[:4])
+
+
+class TripCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        trip_cache.clear()
+        self.chuyen = tao_chuyen(tong_so_ve=5)
+        self.khach = tao_khach()
+
+    def test_lan_tim_thu_hai_khong_query(self):
+        cached_search_trips("Hà Nội", "Hải Phòng")
+        with self.assertNumQueries(0):
+            trang, _ = cached_search_trips("Hà Nội", "Hải Phòng")
+        self.assertEqual(trang, [self.chuyen])
+        stats = trip_cache.stats()
+        self.assertEqual(stats["miss"], 2)  # tra id tuyến + kết quả tìm kiếm
+        self.assertEqual(stats["local_hit"], 2)
+
+    def test_moc_khong_hop_le_dung_key_trang_dau(self):
+        cached_search_trips("Hà Nội", "Hải Phòng")
+        with self.assertNumQueries(0):
+            for sau in ("rac", "1-x", "9" * 40 + "-1"):
+                self.assertEqual(cached_search_trips("Hà Nội", "Hải Phòng", sau=sau), ([self.chuyen], None))
+        self.assertEqual(trip_cache.stats()["miss"], 2)
+        # Mốc hợp lệ vẫn là một trang riêng
+        moc = encode_cursor(self.chuyen)
+        self.assertEqual(cached_search_trips("Hà Nội", "Hải Phòng", sau=moc), ([], None))
+        self.assertEqual(trip_cache.stats()["miss"], 3)
+
+    def test_dat_ve_lam_moi_cache(self):
+        trang, _ = cached_search_trips("Hà Nội", "Hải Phòng", so_ve=3)
+        self.assertEqual(trang, [self.chuyen])
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_seats(self.chuyen, self.khach, 3)
+        trang, _ = cached_search_trips("Hà Nội", "Hải Phòng", so_ve=3)
+        self.assertEqual(trang, [])
+
+    def test_het_han_giu_cho_lam_moi_cache(self):
+        reserve_seats(self.chuyen, self.khach, 5)
+        self.assertEqual(cached_search_trips("Hà Nội", "Hải Phòng")[0], [])
+        Ve.objects.update(han_giu=timezone.now() - timedelta(minutes=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            release_expired_holds()
+        self.assertEqual(cached_search_trips("Hà Nội", "Hải Phòng")[0], [self.chuyen])
+
+    def test_het_han_nhieu_lo_trong_transaction_ngoai(self):
+        khac = Tuyen.objects.create(diem_di="Hà Nội", diem_den="Nam Định")
+        chuyens = [self.chuyen, tao_chuyen(tong_so_ve=5), tao_chuyen(tong_so_ve=5)]
+        Chuyen.objects.filter(pk=chuyens[2].pk).update(tuyen=khac)
+        for chuyen in chuyens:
+            reserve_seats(chuyen, self.khach, 5)
+        self.assertEqual(cached_search_trips("Hà Nội", "Hải Phòng")[0], [])
+        Ve.objects.update(han_giu=timezone.now() - timedelta(minutes=1))
+        # TestCase đã bọc transaction: callback của mọi lô chỉ chạy khi thoát khối này
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertEqual(release_expired_holds(batch_size=1), 3)
+        self.assertEqual(len(callbacks), 3)
+        self.assertEqual(cached_search_trips("Hà Nội", "Hải Phòng")[0], chuyens[:2])
+        self.assertEqual(cached_search_trips("Hà Nội", "Nam Định")[0], [chuyens[2]])
+
+
+class AdminListQueryCountTests(TestCase):
+    """Số query để hiển thị một trang không được phụ thuộc vào số dòng."""
+
+    def setUp(self):
+        self.staff = Account.objects.create_user(username="staff", email="staff@example.com", password="x", is_staff=True)
+
+    def tao_du_lieu(self, so_dong):
+        for i in range(so_dong):
+            khach = tao_khach(KhachHang.objects.count())
+            ve = Ve.objects.create(chuyen=tao_chuyen(), khach=khach, so_luong=1, trang_thai="DA_THANH_TOAN")
+            ThanhToan.objects.create(ve=ve, phuong_thuc="Chuyển khoản", ma_giao_dich=f"GD{ve.pk}")
+
+    def dem_query(self, view_class, doc_dong):
+        request = RequestFactory().get("/")
+        request.user = self.staff
+        with CaptureQueriesContext(connection) as ctx:
+            response = view_class.as_view()(request)
+            for obj in response.context_data["object_list"]:
+                doc_dong(obj)
+        return len(ctx.captured_queries)
+
+    def assertQueriesPerPage(self, view_class, doc_dong, so_query):
+        self.tao_du_lieu(2)
+        self.assertEqual(self.dem_query(view_class, doc_dong), so_query)
+        self.tao_du_lieu(view_class.paginate_by)
+        self.assertEqual(self.dem_query(view_class, doc_dong), so_query)
+
+    def test_ve_list(self):
+        self.assertQueriesPerPage(AdminVeListView, lambda ve: (str(ve), str(ve.chuyen)), 2)
+
+    def test_payment_list(self):
+        self.assertQueriesPerPage(
+            AdminPaymentListView, lambda tt: (str(tt), tt.so_tien, str(tt.ve), str(tt.ve.chuyen)), 2
+        )
+
+    def test_chuyen_list(self):
+        self.assertQueriesPerPage(AdminChuyenListView, lambda c: (str(c), str(c.xe), c.so_ve_con_lai), 2)
+
+
+class RevenueReportTests(TestCase):
+    def setUp(self):
+        khach = tao_khach()
+        self.chuyen_a = tao_chuyen(gia_ve=100000)
+        tuyen_b = Tuyen.objects.create(diem_di="Hà Nội", diem_den="Nam Định")
+        self.chuyen_b = Chuyen.objects.create(
+            tuyen=tuyen_b, xe=self.chuyen_a.xe, tong_so_ve=40, gia_ve=80000,
+            ngay_gio_khoi_hanh=self.chuyen_a.ngay_gio_khoi_hanh,
+        )
+        for i, (chuyen, so_luong, trang_thai) in enumerate([
+            (self.chuyen_a, 2, "THANH_CONG"), (self.chuyen_a, 1, "THANH_CONG"),
+            (self.chuyen_b, 3, "THANH_CONG"), (self.chuyen_b, 5, "THAT_BAI"),
+        ]):
+            ve = Ve.objects.create(chuyen=chuyen, khach=khach, so_luong=so_luong)
+            ThanhToan.objects.create(ve=ve, phuong_thuc="Thẻ", ma_giao_dich=f"GD{i}", trang_thai=trang_thai)
+
+    def test_so_tien_chot_luc_thanh_toan(self):
+        Chuyen.objects.filter(pk=self.chuyen_a.pk).update(gia_ve=1)
+        self.assertEqual(ThanhToan.objects.get(ma_giao_dich="GD0").so_tien, 200000)
+
+    def test_doanh_thu_moi_bao_cao_mot_query(self):
+        with self.assertNumQueries(1):
+            theo_tuyen = revenue_by_route()
+        self.assertEqual(
+            [(r["ve__chuyen__tuyen__diem_den"], r["doanh_thu"], r["so_ve"]) for r in theo_tuyen],
+            [("Hải Phòng", 300000, 3), ("Nam Định", 240000, 3)],
+        )
+        with self.assertNumQueries(1):
+            theo_ngay = revenue_by_day()
+        self.assertEqual([(r["ngay"], r["doanh_thu"]) for r in theo_ngay], [(timezone.now().date(), 540000)])
+        with self.assertNumQueries(1):
+            theo_xe = revenue_by_vehicle()
+        self.assertEqual([r["so_giao_dich"] for r in theo_xe], [3])
+        self.assertEqual(total_revenue(), 540000)
+
+
+@override_settings(DASHBOARD_STATS_LOOKBACK_SECONDS=0)
+class DailyStatsTests(TestCase):
+    def setUp(self):
+        self.khach = tao_khach()
+        self.chuyen_a = tao_chuyen(tong_so_ve=10)
+        tuyen_b = Tuyen.objects.create(diem_di="Hà Nội", diem_den="Nam Định")
+        self.chuyen_b = Chuyen.objects.create(
+            tuyen=tuyen_b, xe=self.chuyen_a.xe, tong_so_ve=20, gia_ve=80000,
+            ngay_gio_khoi_hanh=self.chuyen_a.ngay_gio_khoi_hanh + timedelta(days=2),
+        )
+        self.ngay_a = timezone.localdate(self.chuyen_a.ngay_gio_khoi_hanh)
+        self.ngay_b = timezone.localdate(self.chuyen_b.ngay_gio_khoi_hanh)
+
+    def ban_ve(self, chuyen, so_luong, ma):
+        create_payment(reserve_seats(chuyen, self.khach, so_luong), "Thẻ", ma)
+        confirm_payment(ma)
+
+    def test_chi_tong_hop_lai_ngay_co_thay_doi(self):
+        self.ban_ve(self.chuyen_a, 4, "GD1")
+        self.assertEqual(refresh_daily_stats(), 2)
+        self.assertEqual(refresh_daily_stats(), 0)
+
+        self.ban_ve(self.chuyen_b, 5, "GD2")
+        reserve_seats(self.chuyen_a, self.khach, 1)  # chỉ giữ chỗ: không tính lại ngày của chuyến A
+        moc_a = ThongKeNgay.objects.get(ngay=self.ngay_a).cap_nhat_luc
+        self.assertEqual(refresh_daily_stats(), 1)
+        self.assertEqual(ThongKeNgay.objects.get(ngay=self.ngay_a).cap_nhat_luc, moc_a)
+        self.assertEqual(
+            list(ThongKeNgay.objects.order_by("ngay").values_list("ngay", "so_ghe", "so_ve_da_ban", "doanh_thu")),
+            [(self.ngay_a, 10, 4, 600000), (self.ngay_b, 20, 5, 400000)],
+        )
+
+        # Chuyến bị xoá: ngày của nó được đánh dấu để tổng hợp lại
+        self.chuyen_b.delete()
+        self.assertEqual(refresh_daily_stats(), 1)
+        self.assertEqual(list(ThongKeNgay.objects.values_list("ngay", flat=True)), [self.ngay_a])
+        self.assertFalse(NgayCanTongHop.objects.exists())
+
+    def test_chi_danh_dau_chuyen_khi_doanh_thu_doi(self):
+        ve = reserve_seats(self.chuyen_a, self.khach, 1)
+        moc = Chuyen.objects.get(pk=self.chuyen_a.pk).cap_nhat_luc
+        with CaptureQueriesContext(connection) as ctx:
+            create_payment(ve, "Thẻ", "GD1")
+        self.assertFalse([q for q in ctx.captured_queries if "booking_chuyen" in q["sql"] and "UPDATE" in q["sql"]])
+        self.assertEqual(Chuyen.objects.get(pk=self.chuyen_a.pk).cap_nhat_luc, moc)
+        ve.trang_thai = "DA_THANH_TOAN"
+        ve.save()
+        moc = Chuyen.objects.get(pk=self.chuyen_a.pk).cap_nhat_luc
+        confirm_payment("GD1")  # vé đã thanh toán sẵn: bộ đếm không đổi nhưng doanh thu đổi
+        self.assertGreater(Chuyen.objects.get(pk=self.chuyen_a.pk).cap_nhat_luc, moc)
+
+    def test_doi_ngay_khoi_hanh_tong_hop_lai_ngay_cu(self):
+        refresh_daily_stats()
+        chuyen = Chuyen.objects.get(pk=self.chuyen_a.pk)
+        chuyen.ngay_gio_khoi_hanh += timedelta(days=2)
+        chuyen.save()
+        self.assertEqual(refresh_daily_stats(), 2)
+        self.assertEqual(
+            list(ThongKeNgay.objects.order_by("tuyen_id").values_list("ngay", "tuyen_id", "so_chuyen")),
+            [(self.ngay_b, self.chuyen_a.tuyen_id, 1), (self.ngay_b, self.chuyen_b.tuyen_id, 1)],
+        )
+
+        # Nhập lại lịch chạy dời chuyến về ngày cũ
+        dong = ",".join([
+            str(chuyen.pk), "Hà Nội", "Hải Phòng", chuyen.xe.bien_so,
+            self.chuyen_a.ngay_gio_khoi_hanh.isoformat(), "", "10", "150000",
+        ])
+        import_file("chuyen", io.StringIO(",".join(COLUMNS["chuyen"]) + "\n" + dong + "\n"), "csv")
+        self.assertEqual(refresh_daily_stats(), 2)
+        self.assertEqual(
+            list(ThongKeNgay.objects.order_by("ngay").values_list("ngay", "so_chuyen")),
+            [(self.ngay_a, 1), (self.ngay_b, 1)],
+        )
+
+    def test_dashboard_doc_bang_thong_ke(self):
+        self.ban_ve(self.chuyen_a, 5, "GD1")
+        self.ban_ve(self.chuyen_b, 2, "GD2")
+        create_payment(reserve_seats(self.chuyen_b, self.khach, 1), "Thẻ", "GD3")
+        refresh_daily_stats()
+        with self.assertNumQueries(6):
+            stats = dashboard_stats(self.ngay_a, self.ngay_b)
+        self.assertEqual(stats["tong"]["so_ve_da_ban"], 7)
+        self.assertEqual(stats["tong"]["ty_le_lap_day"], 23.3)
+        self.assertEqual(
+            [(r["tuyen__diem_den"], r["ty_le_lap_day"], r["doanh_thu"]) for r in stats["theo_tuyen"]],
+            [("Hải Phòng", 50.0, 750000), ("Nam Định", 10.0, 160000)],
+        )
+        self.assertEqual([r["so_chuyen"] for r in stats["theo_xe"]], [2])
+        self.assertEqual((stats["cho_xu_ly"]["so"], stats["cho_xu_ly"]["so_tien"]), (1, 80000))
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        trip_cache.clear()
+        analytics.analytics_cache.clear()
+        cache.clear()
+        self.hom_nay = timezone.localdate()
+        self.ngay_qua = self.hom_nay - timedelta(days=3)
+        khoi_hanh = timezone.make_aware(datetime.combine(self.ngay_qua, dt_time(12)))
+        self.chuyen = tao_chuyen(tong_so_ve=10, ngay_gio_khoi_hanh=khoi_hanh)
+        self.chuyen_2 = tao_chuyen(tong_so_ve=20, ngay_gio_khoi_hanh=khoi_hanh + timedelta(hours=2))
+        self.tuyen_id = self.chuyen.tuyen_id
+        khach = tao_khach()
+        for chuyen, so_luong, truoc, trang_thai in [
+            (self.chuyen, 2, timedelta(days=10), "DA_THANH_TOAN"),
+            (self.chuyen, 3, timedelta(days=1, hours=1), "DA_THANH_TOAN"),
+            (self.chuyen, 4, timedelta(hours=5), "CHO_THANH_TOAN"),
+            (self.chuyen_2, 5, timedelta(days=3), "DA_THANH_TOAN"),
+        ]:
+            ve = Ve.objects.create(chuyen=chuyen, khach=khach, so_luong=so_luong, trang_thai=trang_thai)
+            Ve.objects.filter(pk=ve.pk).update(thoi_gian_dat=chuyen.ngay_gio_khoi_hanh - truoc)
+
+    def test_duong_cong_dat_ve(self):
+        ket_qua = analytics.booking_curves([self.tuyen_id], self.ngay_qua, self.hom_nay, horizon=7)[self.tuyen_id]
+        self.assertEqual((ket_qua["so_chuyen"], ket_qua["so_ghe"], ket_qua["so_ve_da_ban"]), (2, 30, 10))
+        # 7 ngày trước: 2 vé; 3 ngày trước: +5; 1 ngày trước: +3
+        self.assertEqual(
+            [round(x * 30) for x in ket_qua["duong_cong"]], [10, 10, 7, 7, 2, 2, 2, 2],
+        )
+        self.assertEqual((ket_qua["lap_day_p50"], ket_qua["lap_day_p90"]), (0.5, 0.5))
+        self.assertAlmostEqual(ket_qua["ty_le_lap_day"], 1 / 3)
+
+    def test_cache_ngay_da_qua(self):
+        analytics.route_day_stats([self.tuyen_id], self.ngay_qua, self.ngay_qua)
+        with self.assertNumQueries(0):
+            ngay = analytics.route_day_stats([self.tuyen_id], self.ngay_qua, self.ngay_qua)
+        self.assertEqual(ngay[self.tuyen_id, self.ngay_qua]["so_chuyen"], 2)
+        # Bộ đếm riêng, không lẫn vào thống kê cache tìm chuyến
+        stats = analytics.analytics_cache.stats()
+        self.assertEqual((stats["miss"], stats["local_hit"]), (1, 1))
+        self.assertEqual([trip_cache.stats()[name] for name in trip_cache.STATS_KEYS], [0, 0, 0])
+        # Hôm nay và các ngày tới luôn tính lại
+        with self.assertNumQueries(2):
+            analytics.route_day_stats([self.tuyen_id], self.ngay_qua, self.hom_nay)
+
+    @skipIf(analytics.np is None, "numpy chưa được cài")
+    def test_numpy_va_python_cung_ket_qua(self):
+        co_numpy = analytics.booking_curves([self.tuyen_id], self.ngay_qua, self.hom_nay, horizon=7)
+        analytics.analytics_cache.clear()
+        cache.clear()
+        with mock.patch.object(analytics, "np", None):
+            khong_numpy = analytics.booking_curves([self.tuyen_id], self.ngay_qua, self.hom_nay, horizon=7)
+        self.assertEqual(co_numpy, khong_numpy)
+
+
+class GenerateScheduleTests(TestCase):
+    def setUp(self):
+        self.tuyen = Tuyen.objects.create(diem_di="Hà Nội", diem_den="Lào Cai")
+        self.xe = Xe.objects.create(bien_so="24B-00001", loai_xe="Ghế ngồi", so_ghe=30)
+        self.tu_ngay = timezone.localdate() + timedelta(days=1)
+
+    def tao_lich(self, **kwargs):
+        kwargs.setdefault("ngay_trong_tuan", [0, 2, 4])
+        kwargs.setdefault("den_ngay", self.tu_ngay + timedelta(days=27))
+        kwargs.setdefault("thoi_gian_chay", timedelta(hours=5))
+        return generate_schedule(self.tuyen, self.xe, dt_time(7, 30), tu_ngay=self.tu_ngay, gia_ve=200000, **kwargs)
+
+    def test_tao_theo_ngay_trong_tuan(self):
+        self.assertEqual(self.tao_lich(batch_size=5), 12)
+        chuyens = Chuyen.objects.filter(tuyen=self.tuyen)
+        self.assertEqual(chuyens.count(), 12)
+        self.assertEqual({timezone.localtime(c.ngay_gio_khoi_hanh).weekday() for c in chuyens}, {0, 2, 4})
+        chuyen = chuyens.first()
+        self.assertEqual(chuyen.tong_so_ve, 30)
+        self.assertEqual(chuyen.ngay_gio_den - chuyen.ngay_gio_khoi_hanh, timedelta(hours=5))
+
+    def test_so_query_khong_phu_thuoc_so_chuyen(self):
+        with self.assertNumQueries(6):  # savepoint, khoá xe, kiểm tra trùng, 2 lô INSERT, release
+            self.tao_lich(ngay_trong_tuan=range(7), den_ngay=self.tu_ngay + timedelta(days=99), batch_size=50)
+        self.assertEqual(Chuyen.objects.count(), 100)
+
+    def test_phat_hien_xe_trung_lich(self):
+        ngay = self.tu_ngay + timedelta(days=(2 - self.tu_ngay.weekday()) % 7)  # thứ Tư đầu tiên
+        bat_dau = timezone.make_aware(timezone.datetime.combine(ngay, dt_time(10, 0)))
+        Chuyen.objects.create(
+            tuyen=self.tuyen, xe=self.xe, ngay_gio_khoi_hanh=bat_dau,
+            ngay_gio_den=bat_dau + timedelta(hours=2), tong_so_ve=30, gia_ve=1,
+        )
+        with self.assertRaisesMessage(ValidationError, "đã có chuyến trùng giờ (1 chuyến)"):
+            self.tao_lich()
+        self.assertEqual(Chuyen.objects.count(), 1)
+        # Chuyến nối đuôi (kết thúc đúng lúc chuyến cũ khởi hành) thì hợp lệ
+        self.assertEqual(self.tao_lich(thoi_gian_chay=timedelta(hours=2, minutes=30)), 12)
+
+    def test_thoi_gian_chay_theo_khoang_cach_giua_hai_chuyen(self):
+        # Mỗi tuần một chuyến: chạy 30 giờ vẫn không tự chồng lấn
+        self.assertEqual(self.tao_lich(ngay_trong_tuan=[0], thoi_gian_chay=timedelta(hours=30)), 4)
+        Chuyen.objects.all().delete()
+        # Thứ Hai và thứ Ba cách nhau một ngày
+        with self.assertRaisesMessage(ValidationError, "khoảng cách giữa hai chuyến"):
+            self.tao_lich(ngay_trong_tuan=[0, 1, 4], thoi_gian_chay=timedelta(hours=30))
+        with self.assertRaisesMessage(ValidationError, "không được quá"):
+            self.tao_lich(ngay_trong_tuan=[0], thoi_gian_chay=thoi_gian_chay_toi_da() + timedelta(hours=1))
+        self.assertFalse(Chuyen.objects.exists())
+
+    def test_kiem_tra_rang_buoc_mot_lan(self):
+        with self.assertRaisesMessage(ValidationError, "vượt quá số ghế"):
+            self.tao_lich(tong_so_ve=31)
+        with self.assertRaisesMessage(ValidationError, "sớm hơn hiện tại"):
+            generate_schedule(self.tuyen, self.xe, dt_time(7, 30), range(7),
+                              self.tu_ngay - timedelta(days=2), self.tu_ngay, 200000)
+        self.assertFalse(Chuyen.objects.exists())
+
+
+class VehicleOverlapTests(TestCase):
+    def setUp(self):
+        self.bat_dau = timezone.now() + timedelta(days=1)
+        self.chuyen = tao_chuyen(ngay_gio_khoi_hanh=self.bat_dau, ngay_gio_den=self.bat_dau + timedelta(hours=4))
+
+    def chuyen_moi(self, lech, thoi_gian=timedelta(hours=2), **kwargs):
+        kwargs.setdefault("xe", self.chuyen.xe)
+        bat_dau = self.bat_dau + lech
+        return Chuyen(
+            tuyen=self.chuyen.tuyen, ngay_gio_khoi_hanh=bat_dau,
+            ngay_gio_den=bat_dau + thoi_gian if thoi_gian is not None else None,
+            tong_so_ve=40, gia_ve=150000, **kwargs,
+        )
+
+    def test_clean_chan_xe_trung_lich(self):
+        for lech in (timedelta(hours=-1), timedelta(hours=1), timedelta(0)):
+            with self.assertRaisesMessage(ValidationError, "Xe đã được xếp cho chuyến khác"):
+                self.chuyen_moi(lech).clean()
+        with self.assertRaisesMessage(ValidationError, "Xe đã được xếp cho chuyến khác"):
+            self.chuyen_moi(timedelta(hours=2), thoi_gian=None).clean()
+        # Nối đuôi, xe khác, hoặc sửa chính chuyến đó thì hợp lệ
+        self.chuyen_moi(timedelta(hours=4)).clean()
+        self.chuyen_moi(timedelta(hours=-2)).clean()
+        xe_khac = Xe.objects.create(bien_so="30A-00001", loai_xe="Ghế ngồi", so_ghe=45)
+        self.chuyen_moi(timedelta(0), xe=xe_khac).clean()
+        self.chuyen.clean()
+
+    def test_gioi_han_thoi_gian_chay(self):
+        with self.assertRaisesMessage(ValidationError, "Thời gian chạy không được quá"):
+            self.chuyen_moi(timedelta(days=2), thoi_gian=timedelta(hours=73)).clean()
+
+    def test_ra_soat_toan_bo_lich_xe(self):
+        trung_1 = self.chuyen_moi(timedelta(hours=3))
+        trung_2 = self.chuyen_moi(timedelta(hours=3, minutes=30), thoi_gian=None)
+        noi_duoi = self.chuyen_moi(timedelta(hours=5))
+        khac_xe = self.chuyen_moi(timedelta(0), xe=Xe.objects.create(bien_so="30A-00001", loai_xe="Ghế ngồi", so_ghe=45))
+        for chuyen in (trung_1, trung_2, noi_duoi, khac_xe):
+            chuyen.save()
+        xe_id = self.chuyen.xe_id
+        self.assertEqual(
+            sorted(audit_vehicle_overlaps()),
+            sorted([
+                (xe_id, self.chuyen.pk, trung_1.pk),
+                (xe_id, self.chuyen.pk, trung_2.pk),
+                (xe_id, trung_1.pk, trung_2.pk),
+            ]),
+        )
+        self.assertEqual(list(audit_vehicle_overlaps(tu=self.bat_dau + timedelta(hours=5, minutes=30))), [])
+
+
+    def test_admin_kiem_tra_lai_sau_khi_khoa_xe(self):
+        staff = Account.objects.create_user(username="staff", email="staff@example.com", password="x", is_staff=True)
+        bat_dau = timezone.localtime(self.bat_dau + timedelta(hours=6))
+        data = {
+            "tuyen": self.chuyen.tuyen_id, "xe": self.chuyen.xe_id, "tong_so_ve": 40, "gia_ve": 150000,
+            "ngay_gio_khoi_hanh": bat_dau.strftime("%Y-%m-%d %H:%M"),
+            "ngay_gio_den": (bat_dau + timedelta(hours=2)).strftime("%Y-%m-%d %H:%M"),
+        }
+        kiem_tra = Chuyen.kiem_tra_trung_lich
+
+        def admin_khac_luu_cung_luc(chuyen):
+            # Lần kiểm tra trong clean() qua, rồi một admin khác lưu chuyến trùng trước khi form được lưu
+            kiem_tra(chuyen)
+            if not Chuyen.objects.filter(ngay_gio_khoi_hanh=chuyen.ngay_gio_khoi_hanh).exists():
+                Chuyen.objects.create(
+                    tuyen=chuyen.tuyen, xe=chuyen.xe, tong_so_ve=40, gia_ve=150000,
+                    ngay_gio_khoi_hanh=chuyen.ngay_gio_khoi_hanh, ngay_gio_den=chuyen.ngay_gio_den,
+                )
+
+        request = RequestFactory().post("/", data)
+        request.user = staff
+        with mock.patch.object(Chuyen, "kiem_tra_trung_lich", autospec=True, side_effect=admin_khac_luu_cung_luc):
+            response = AdminChuyenCreateView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Xe đã được xếp cho chuyến khác", str(response.context_data["form"].non_field_errors()))
+        self.assertEqual(Chuyen.objects.count(), 2)
+
+        sau = (bat_dau + timedelta(hours=3)).strftime("%Y-%m-%d %H:%M")
+        request = RequestFactory().post("/", {**data, "ngay_gio_khoi_hanh": sau, "ngay_gio_den": ""})
+        request.user = staff
+        self.assertEqual(AdminChuyenCreateView.as_view()(request).status_code, 302)
+        self.assertEqual(Chuyen.objects.count(), 3)
+
+
+class TimetableImportExportTests(TestCase):
+    def nhap(self, kind, text, fmt="csv", **kwargs):
+        return import_file(kind, io.StringIO(text), fmt, **kwargs)
+
+    def test_upsert_tuyen_va_xe(self):
+        Tuyen.objects.create(diem_di="Hà Nội", diem_den="Vinh", khoang_cach=1)
+        result = self.nhap("tuyen", "diem_di,diem_den,khoang_cach\nHà Nội,Vinh,290\nHà Nội,Huế,650\nHuế,Huế,\n")
+        self.assertEqual((result.rows, result.imported, result.error_count), (3, 2, 1))
+        self.assertEqual(result.errors[0][0], 4)
+        self.assertEqual(Tuyen.objects.get(diem_den="Vinh").khoang_cach, 290)
+        self.assertEqual(Tuyen.objects.count(), 2)
+
+        result = self.nhap("xe", '{"bien_so": "37B-1", "loai_xe": "Limousine", "so_ghe": 9}\nkhông phải json\n', "jsonl")
+        self.assertEqual((result.imported, result.error_count), (1, 1))
+        self.assertEqual(Xe.objects.get(bien_so="37B-1").so_ghe, 9)
+
+    def test_nhap_chuyen_theo_lo(self):
+        self.nhap("tuyen", "diem_di,diem_den\nHà Nội,Vinh\n")
+        self.nhap("xe", "bien_so,loai_xe,so_ghe\n37B-1,Limousine,9\n")
+        bat_dau = timezone.now() + timedelta(days=1)
+        dong = [f",Hà Nội,Vinh,37B-1,{(bat_dau + timedelta(days=i)).isoformat()},,9,250000" for i in range(5)]
+        dong.append(",Hà Nội,Huế,37B-1,2030-01-01T08:00:00,,9,250000")
+        dong.append(",Hà Nội,Vinh,37B-1,2030-01-01T08:00:00,,10,250000")
+        with self.assertNumQueries(12):  # mỗi lô: savepoint, tra tuyến, khoá xe, lịch xe, INSERT, release
+            result = self.nhap("chuyen", "\n".join([",".join(COLUMNS["chuyen"]), *dong]), batch_size=4)
+        self.assertEqual((result.imported, result.error_count), (5, 2))
+        self.assertIn("Không tìm thấy tuyến", result.errors[0][1])
+        self.assertIn("vượt quá số ghế", result.errors[1][1])
+
+        # Xuất rồi nhập lại có sửa giá: cập nhật theo id, không tạo chuyến mới
+        xuat = "".join(iter_export("chuyen")).replace("250000.00", "300000")
+        result = self.nhap("chuyen", xuat)
+        self.assertEqual((result.imported, result.error_count), (5, 0))
+        self.assertEqual(Chuyen.objects.count(), 5)
+        self.assertEqual(set(Chuyen.objects.values_list("gia_ve", flat=True)), {300000})
+
+    def test_tu_choi_dong_trung_gio_xe(self):
+        chuyen = tao_chuyen()
+        Chuyen.objects.filter(pk=chuyen.pk).update(ngay_gio_den=chuyen.ngay_gio_khoi_hanh + timedelta(hours=3))
+        bien_so, bat_dau = chuyen.xe.bien_so, chuyen.ngay_gio_khoi_hanh
+        dong = [
+            # Trùng chuyến đã có
+            f",Hà Nội,Hải Phòng,{bien_so},{(bat_dau + timedelta(hours=1)).isoformat()},,40,150000",
+            f",Hà Nội,Hải Phòng,{bien_so},{(bat_dau + timedelta(hours=5)).isoformat()},{(bat_dau + timedelta(hours=8)).isoformat()},40,150000",
+            # Trùng dòng ngay trên trong cùng file
+            f",Hà Nội,Hải Phòng,{bien_so},{(bat_dau + timedelta(hours=6)).isoformat()},,40,150000",
+            # Dời chính chuyến cũ: không tự trùng với khoảng chạy cũ của nó
+            f"{chuyen.pk},Hà Nội,Hải Phòng,{bien_so},{(bat_dau + timedelta(hours=1)).isoformat()},{(bat_dau + timedelta(hours=4)).isoformat()},40,150000",
+        ]
+        result = self.nhap("chuyen", "\n".join([",".join(COLUMNS["chuyen"]), *dong]))
+        self.assertEqual((result.imported, result.error_count), (2, 2))
+        self.assertEqual([line for line, _ in result.errors], [2, 4])
+        self.assertIn(f"#{chuyen.pk}", result.errors[0][1])
+        self.assertIn("dòng 3", result.errors[1][1])
+        self.assertEqual(Chuyen.objects.count(), 2)
+        self.assertEqual(list(audit_vehicle_overlaps()), [])
+
+    def test_doi_tuyen_lam_moi_cache_tuyen_cu_va_chuyen(self):
+        trip_cache.clear()
+        chuyen = tao_chuyen()
+        Tuyen.objects.create(diem_di="Hà Nội", diem_den="Vinh")
+        self.assertEqual(cached_search_trips("Hà Nội", "Hải Phòng")[0], [chuyen])
+        self.assertEqual(cached_so_ve_con_lai(chuyen.pk), 40)
+
+        dong = ",".join([
+            str(chuyen.pk), "Hà Nội", "Vinh", chuyen.xe.bien_so,
+            chuyen.ngay_gio_khoi_hanh.isoformat(), "", "30", "150000",
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nhap("chuyen", ",".join(COLUMNS["chuyen"]) + "\n" + dong + "\n")
+        self.assertEqual(cached_search_trips("Hà Nội", "Hải Phòng")[0], [])
+        self.assertEqual(cached_search_trips("Hà Nội", "Vinh")[0], [chuyen])
+        self.assertEqual(cached_so_ve_con_lai(chuyen.pk), 30)
+
+    def test_xuat_jsonl_qua_streaming_response(self):
+        tao_chuyen()
+        staff = Account.objects.create_user(username="staff", email="staff@example.com", password="x", is_staff=True)
+        request = RequestFactory().get("/", {"format": "jsonl"})
+        request.user = staff
+        response = AdminXuatDuLieuView.as_view()(request, loai="chuyen")
+        self.assertTrue(response.streaming)
+        dong = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(dong), 1)
+        self.assertIn('"bien_so": "29B-12345"', dong[0])
+
+
+class FinanceExportTests(TestCase):
+    def setUp(self):
+        chuyen = tao_chuyen()
+        self.hom_nay = timezone.localdate()
+        for i in range(5):
+            ve = Ve.objects.create(chuyen=chuyen, khach=tao_khach(i), so_luong=1)
+            ThanhToan.objects.create(ve=ve, phuong_thuc="Thẻ", ma_giao_dich=f"GD{i}", trang_thai="THANH_CONG")
+        # Một vé đặt từ tháng trước, nằm ngoài khoảng xuất
+        Ve.objects.filter(pk=ve.pk).update(thoi_gian_dat=timezone.now() - timedelta(days=40))
+
+    def doc_csv(self, kind, **kwargs):
+        text = "".join(iter_export_ke_toan(kind, self.hom_nay - timedelta(days=1), self.hom_nay, **kwargs))
+        self.assertTrue(text.startswith("\ufeff"))
+        return text[1:].splitlines()
+
+    def test_xuat_theo_lo_keyset(self):
+        with self.assertNumQueries(3):  # 2 + 2 + 0 dòng
+            dong = self.doc_csv("ve", batch_size=2)
+        self.assertEqual(dong[0].split(",")[:3], ["Mã vé", "Thời gian đặt", "Trạng thái"])
+        self.assertEqual(len(dong), 5)
+        self.assertEqual([d.split(",")[0] for d in dong[1:]], [str(pk) for pk in Ve.objects.order_by("pk").values_list("pk", flat=True)[:4]])
+        self.assertIn("Hà Nội,Hải Phòng", dong[1])
+
+        dong = self.doc_csv("thanh_toan", batch_size=2)
+        self.assertEqual(len(dong), 6)
+        self.assertIn("GD0,Thẻ,THANH_CONG,150000.00", dong[1])
+
+    def test_view_stream_csv(self):
+        staff = Account.objects.create_user(username="staff", email="staff@example.com", password="x", is_staff=True)
+        view = AdminKeToanExportView.as_view(kind="thanh_toan")
+        request = RequestFactory().get("/", {"tu_ngay": self.hom_nay.isoformat(), "den_ngay": self.hom_nay.isoformat()})
+        request.user = staff
+        response = view(request)
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(b"".join(response.streaming_content).decode().splitlines()), 6)
+
+        request = RequestFactory().get("/", {"tu_ngay": "2025-02-01", "den_ngay": "2025-01-01"})
+        request.user = staff
+        self.assertEqual(view(request).status_code, 400)
+
+
+class PaymentTests(TestCase):
+    def setUp(self):
+        self.chuyen = tao_chuyen(tong_so_ve=4)
+        self.khach = tao_khach()
+        self.ve = reserve_seats(self.chuyen, self.khach, 2)
+
+    def test_tao_giao_dich_idempotent(self):
+        thanh_toan = create_payment(self.ve, "Thẻ", "GD1")
+        self.assertEqual(create_payment(self.ve, "Thẻ", "GD1").pk, thanh_toan.pk)
+        self.assertEqual(thanh_toan.so_tien, 300000)
+        with self.assertRaisesMessage(ValidationError, "đang xử lý"):
+            create_payment(self.ve, "Thẻ", "GD2")
+        with self.assertRaisesMessage(ValidationError, "vé khác"):
+            create_payment(reserve_seats(self.chuyen, self.khach, 1), "Thẻ", "GD1")
+
+    def test_xac_nhan_mot_lan(self):
+        create_payment(self.ve, "Thẻ", "GD1")
+        self.assertEqual(confirm_payment("GD1").trang_thai, "THANH_CONG")
+        self.ve.refresh_from_db()
+        self.chuyen.refresh_from_db()
+        self.assertEqual(self.ve.trang_thai, "DA_THANH_TOAN")
+        self.assertEqual((self.chuyen.so_ve_da_ban, self.chuyen.so_ve_dang_giu), (2, 0))
+        # Callback lặp lại, kể cả báo thất bại, không đổi gì
+        self.assertEqual(confirm_payment("GD1", thanh_cong=False).trang_thai, "THANH_CONG")
+        self.chuyen.refresh_from_db()
+        self.assertEqual(self.chuyen.so_ve_da_ban, 2)
+
+    def test_that_bai_roi_thanh_toan_lai(self):
+        thanh_toan = create_payment(self.ve, "Thẻ", "GD1")
+        self.assertEqual(confirm_payment("GD1", thanh_cong=False).trang_thai, "THAT_BAI")
+        self.assertEqual(Ve.objects.get(pk=self.ve.pk).trang_thai, "CHO_THANH_TOAN")
+        lan_2 = create_payment(self.ve, "Ví", "GD2")
+        self.assertEqual(lan_2.pk, thanh_toan.pk)
+        self.assertEqual(confirm_payment("GD2").trang_thai, "THANH_CONG")
+
+    def test_ve_da_bi_huy_vi_het_han(self):
+        create_payment(self.ve, "Thẻ", "GD1")
+        Ve.objects.filter(pk=self.ve.pk).update(han_giu=timezone.now() - timedelta(minutes=1))
+        release_expired_holds()
+        # Còn chỗ: giữ lại đúng ghế cũ
+        self.assertEqual(confirm_payment("GD1").trang_thai, "THANH_CONG")
+        self.ve.refresh_from_db()
+        self.assertEqual((self.ve.trang_thai, self.ve.ghe), ("DA_THANH_TOAN", "1,2"))
+
+        ve = reserve_seats(self.chuyen, self.khach, 2)
+        create_payment(ve, "Thẻ", "GD2")
+        Ve.objects.filter(pk=ve.pk).update(han_giu=timezone.now() - timedelta(minutes=1))
+        release_expired_holds()
+        reserve_seats(self.chuyen, tao_khach(1), 2)
+        # Hết chỗ: không bán quá số vé, đánh dấu cần hoàn tiền
+        self.assertEqual(confirm_payment("GD2").trang_thai, "CAN_HOAN_TIEN")
+        self.assertEqual(Ve.objects.get(pk=ve.pk).trang_thai, "DA_HUY")
+        self.chuyen.refresh_from_db()
+        self.assertEqual(self.chuyen.so_ve_con_lai, 0)
+
+    def test_hang_doi_callback(self):
+        gateway = FakeGateway(so_lan_gui=2)
+        # Callback tới trước khi giao dịch được ghi: worker thử lại sau
+        self.assertTrue(gateway.charge(ThanhToan(ma_giao_dich="GD1", so_tien=0)))
+        self.assertEqual(process_callbacks(), (0, 2))
+        self.assertEqual(list(XacNhanThanhToan.objects.values_list("so_lan_thu", flat=True)), [1, 1])
+
+        create_payment(self.ve, "Thẻ", "GD1")
+        self.assertEqual(process_callbacks(now=timezone.now() + timedelta(seconds=3)), (2, 0))
+        self.assertEqual(ThanhToan.objects.get(ma_giao_dich="GD1").trang_thai, "THANH_CONG")
+        self.assertFalse(XacNhanThanhToan.objects.exclude(trang_thai="DA_XU_LY").exists())
+
+        XacNhanThanhToan.objects.create(ma_giao_dich="KHONG_CO", thanh_cong=True)
+        self.assertEqual(process_callbacks(max_attempts=1), (0, 1))
+        self.assertEqual(XacNhanThanhToan.objects.get(ma_giao_dich="KHONG_CO").trang_thai, "LOI")
+
+    def test_view_callback_kiem_tra_chu_ky(self):
+        factory = RequestFactory()
+        data = {"ma_giao_dich": "GD1", "thanh_cong": "1", "chu_ky": callback_signature("GD1", True)}
+        self.assertEqual(payment_callback(factory.post("/", data)).status_code, 202)
+        data["thanh_cong"] = "0"
+        self.assertEqual(payment_callback(factory.post("/", data)).status_code, 403)
+        self.assertEqual(payment_callback(factory.get("/")).status_code, 405)
+        self.assertEqual(XacNhanThanhToan.objects.filter(ma_giao_dich="GD1", thanh_cong=True).count(), 1)
+
+
+class ReconcilePaymentTests(TestCase):
+    def setUp(self):
+        self.chuyen = tao_chuyen(tong_so_ve=10)
+        self.khach = tao_khach()
+        self.ve = []
+        for i in range(5):
+            ve = reserve_seats(self.chuyen, self.khach, 1)
+            create_payment(ve, "Thẻ", f"GD{i}")
+            self.ve.append(ve)
+        confirm_payment("GD4")
+
+    def doi_soat(self, lines, **kwargs):
+        text = "ma_giao_dich,trang_thai,so_tien\n" + "\n".join(lines) + "\n"
+        return reconcile_file(io.StringIO(text), **kwargs)
+
+    def test_chot_giao_dich_theo_lo(self):
+        lines = [
+            "GD0,THANH_CONG,150000", "GD1,THAT_BAI,150000", "GD2,THANH_CONG,99000",
+            "GD4,THANH_CONG,150000", "GD9,THANH_CONG,150000", "GD3,???,1",
+        ]
+        with self.assertNumQueries(13):  # lô 1: đọc, khoá chuyến, khoá vé + thanh toán, 5 UPDATE; lô 2 chỉ đọc
+            result = self.doi_soat(lines, batch_size=3)
+        self.assertEqual((result.rows, result.matched, result.confirmed, result.failed), (6, 1, 1, 1))
+        self.assertEqual(dict(result.mismatch_count), {"SAI_SO_TIEN": 1, "KHONG_CO": 1, "DONG_LOI": 1})
+        trang_thai = dict(ThanhToan.objects.values_list("ma_giao_dich", "trang_thai"))
+        self.assertEqual(
+            trang_thai,
+            {"GD0": "THANH_CONG", "GD1": "THAT_BAI", "GD2": "CHO_XU_LY", "GD3": "CHO_XU_LY", "GD4": "THANH_CONG"},
+        )
+        self.assertEqual(Ve.objects.get(pk=self.ve[0].pk).trang_thai, "DA_THANH_TOAN")
+        self.chuyen.refresh_from_db()
+        self.assertEqual((self.chuyen.so_ve_da_ban, self.chuyen.so_ve_dang_giu), (2, 3))
+
+        # Chạy lại cùng file: không đổi gì, GD0 / GD1 giờ là khớp
+        result = self.doi_soat(lines)
+        self.assertEqual((result.matched, result.confirmed, result.failed), (3, 0, 0))
+        # Cổng báo thất bại cho giao dịch đã thành công: chỉ báo lệch
+        result = self.doi_soat(["GD0,THAT_BAI,150000"])
+        self.assertEqual(result.mismatches, [(2, "GD0", "LECH_TRANG_THAI", "THANH_CONG")])
+
+    def test_nhieu_lo_trong_transaction_ngoai(self):
+        khac = tao_chuyen(tong_so_ve=10, ngay_gio_khoi_hanh=timezone.now() + timedelta(days=2))
+        create_payment(reserve_seats(khac, self.khach, 1), "Thẻ", "GD5")
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            result = self.doi_soat(["GD0,THANH_CONG,150000", "GD5,THANH_CONG,150000"], batch_size=1)
+        self.assertEqual(result.confirmed, 2)
+        self.assertEqual(len(callbacks), 2)
+
+    def test_dry_run_va_ve_da_huy(self):
+        result = self.doi_soat(["GD0,THANH_CONG,150000"], dry_run=True)
+        self.assertEqual(result.confirmed, 0)
+        self.assertEqual(ThanhToan.objects.get(ma_giao_dich="GD0").trang_thai, "CHO_XU_LY")
+
+        Ve.objects.filter(pk=self.ve[0].pk).update(han_giu=timezone.now() - timedelta(minutes=1))
+        release_expired_holds()
+        result = self.doi_soat(["GD0,THANH_CONG,150000"])
+        self.assertEqual(result.confirmed, 1)
+        self.assertEqual(Ve.objects.get(pk=self.ve[0].pk).trang_thai, "DA_THANH_TOAN")
+
+    def test_thieu_cot(self):
+        with self.assertRaisesMessage(ValueError, "thiếu cột: so_tien"):
+            reconcile_file(io.StringIO("ma_giao_dich,trang_thai\nGD0,THANH_CONG\n"))
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ReserveSeatsStressTests(TransactionTestCase):
+    SO_LUONG_YEU_CAU = 300
+    SO_LUONG = 30
+
+    def test_khong_ban_qua_so_ve(self):
+        chuyen = tao_chuyen(tong_so_ve=40)
+        khach = tao_khach()
+        ket_qua = {"thanh_cong": 0, "het_ve": 0}
+        khoa = threading.Lock()
+        bat_dau = threading.Barrier(self.SO_LUONG)
+
+        def dat_ve(so_yeu_cau):
+            bat_dau.wait()
+            try:
+                for _ in range(so_yeu_cau):
+                    try:
+                        reserve_seats(chuyen.pk, khach, 1)
+                        key = "thanh_cong"
+                    except ValidationError:
+                        key = "het_ve"
+                    with khoa:
+                        ket_qua[key] += 1
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=dat_ve, args=(self.SO_LUONG_YEU_CAU // self.SO_LUONG,))
+            for _ in range(self.SO_LUONG)
+        ]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        thoi_gian = time.perf_counter() - t0
+
+        chuyen.refresh_from_db()
+        self.assertEqual(ket_qua["thanh_cong"], 40)
+        self.assertEqual(ket_qua["het_ve"], self.SO_LUONG_YEU_CAU - 40)
+        self.assertEqual(chuyen.so_ve_dang_giu, 40)
+        self.assertEqual(sum(Ve.objects.filter(chuyen=chuyen).values_list("so_luong", flat=True)), 40)
+        ghe = [g for value in Ve.objects.filter(chuyen=chuyen).values_list("ghe", flat=True) for g in parse_ghe(value)]
+        self.assertEqual(sorted(ghe), list(range(1, 41)))
+        self.assertEqual(SoDoGhe.cua_chuyen(chuyen).so_ghe_trong, 0)
+        print(f"\nreserve_seats: {self.SO_LUONG_YEU_CAU / thoi_gian:.0f} yêu cầu/giây ({self.SO_LUONG} luồng)")
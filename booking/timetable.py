@@ -0,0 +1,397 @@
+"""
+Nhập / xuất hàng loạt Tuyen, Xe, Chuyen dạng CSV hoặc JSONL.
+
+File được đọc từng dòng và xử lý theo lô: mỗi lô được kiểm tra bằng vài câu
+query IN rồi ghi bằng một lệnh bulk_create(update_conflicts=True) trong một
+transaction ngắn, nên file vài chục nghìn dòng không phải nạp hết vào bộ nhớ.
+Dòng lỗi bị bỏ qua và được báo lại kèm số dòng. Xuất file đọc database bằng
+iterator(chunk_size) và sinh ra từng dòng text (dùng cho StreamingHttpResponse
+hoặc ghi thẳng ra file).
+
+Khoá dùng để upsert:
+- Tuyen: (diem_di, diem_den)
+- Xe: bien_so
+- Chuyen: cột `id` (để trống thì tạo chuyến mới); tuyến tham chiếu bằng
+  diem_di / diem_den, xe tham chiếu bằng bien_so. Các dòng Xe của lô bị khoá
+  như generate_schedule; dòng làm xe trùng giờ với chuyến đã có hoặc với dòng
+  đã nhận trước đó trong file bị từ chối.
+"""
+import csv
+import json
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import invalidate_route, invalidate_route_lookup, invalidate_trip
+from .csvutil import Echo
+from .models import Chuyen, NgayCanTongHop, Tuyen, Xe, chong_lan, thoi_gian_chay_toi_da
+
+FORMATS = ("csv", "jsonl")
+
+COLUMNS = {
+    "tuyen": ["diem_di", "diem_den", "khoang_cach"],
+    "xe": ["bien_so", "loai_xe", "so_ghe"],
+    "chuyen": ["id", "diem_di", "diem_den", "bien_so", "ngay_gio_khoi_hanh", "ngay_gio_den", "tong_so_ve", "gia_ve"],
+}
+
+# Số lỗi tối đa giữ lại chi tiết (vẫn đếm đủ)
+MAX_ERRORS = 1000
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    imported: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)
+    xe_ids: set = field(default_factory=set)
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+
+# -------------------------
+# Đọc / ghi file
+# -------------------------
+def iter_rows(stream, fmt):
+    """Đọc lần lượt (số dòng, dict) từ một stream text."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_no, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f"Định dạng không hỗ trợ: {fmt}")
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_export(kind, fmt="csv", chunk_size=2000):
+    """Sinh từng dòng text của file xuất, đọc database theo từng chunk."""
+    columns = COLUMNS[kind]
+    if kind == "tuyen":
+        qs = Tuyen.objects.order_by("pk").values_list(*columns)
+    elif kind == "xe":
+        qs = Xe.objects.order_by("pk").values_list(*columns)
+    else:
+        qs = Chuyen.objects.order_by("pk").values_list(
+            "pk", "tuyen__diem_di", "tuyen__diem_den", "xe__bien_so",
+            "ngay_gio_khoi_hanh", "ngay_gio_den", "tong_so_ve", "gia_ve",
+        )
+    rows = qs.iterator(chunk_size=chunk_size)
+    if fmt == "csv":
+        writer = csv.writer(Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow([_text(value) for value in row])
+    elif fmt == "jsonl":
+        for row in rows:
+            yield json.dumps(
+                {column: None if value is None else _text(value) for column, value in zip(columns, row)},
+                ensure_ascii=False,
+            ) + "\n"
+    else:
+        raise ValueError(f"Định dạng không hỗ trợ: {fmt}")
+
+
+# -------------------------
+# Chuyển đổi từng ô
+# -------------------------
+def _chuoi(row, key, required=True):
+    value = row.get(key)
+    value = "" if value is None else str(value).strip()
+    if required and not value:
+        raise ValidationError(f"Thiếu cột {key}.")
+    return value
+
+
+def _so_nguyen(row, key, required=True):
+    value = _chuoi(row, key, required)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError(f"{key} phải là số nguyên.")
+
+
+def _so_thap_phan(row, key):
+    try:
+        return Decimal(_chuoi(row, key))
+    except InvalidOperation:
+        raise ValidationError(f"{key} phải là số.")
+
+
+def _thoi_gian(row, key, required=True):
+    value = _chuoi(row, key, required)
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError(f"{key} không đúng định dạng ngày giờ (ISO 8601).")
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+# -------------------------
+# Kiểm tra + ghi từng lô
+# -------------------------
+def _upsert(model, objs, unique_fields, update_fields):
+    # MySQL/MariaDB không nhận unique_fields (ON DUPLICATE KEY áp cho mọi khoá unique)
+    if not connection.features.supports_update_conflicts_with_target:
+        unique_fields = None
+    model.objects.bulk_create(objs, update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields)
+
+
+def _tao_tuyen(row):
+    tuyen = Tuyen(
+        diem_di=_chuoi(row, "diem_di"), diem_den=_chuoi(row, "diem_den"),
+        khoang_cach=_so_nguyen(row, "khoang_cach", False),
+    )
+    tuyen.clean()
+    return (tuyen.diem_di, tuyen.diem_den), tuyen
+
+
+def _tao_xe(row):
+    xe = Xe(bien_so=_chuoi(row, "bien_so"), loai_xe=_chuoi(row, "loai_xe"), so_ghe=_so_nguyen(row, "so_ghe"))
+    xe.clean()
+    return xe.bien_so, xe
+
+
+def _nhap_theo_khoa(kind, batch, result):
+    """Tuyen / Xe: kiểm tra từng dòng, gộp trùng khoá trong lô (giữ dòng sau cùng) rồi upsert."""
+    tao, unique_fields, update_fields = {
+        "tuyen": (_tao_tuyen, ["diem_di", "diem_den"], ["khoang_cach"]),
+        "xe": (_tao_xe, ["bien_so"], ["loai_xe", "so_ghe"]),
+    }[kind]
+    objs = {}
+    for line, row in batch:
+        try:
+            key, obj = tao(row)
+        except ValidationError as e:
+            result.add_error(line, "; ".join(e.messages))
+            continue
+        objs[key] = obj
+    if objs:
+        _upsert(Tuyen if kind == "tuyen" else Xe, list(objs.values()), unique_fields, update_fields)
+    if kind == "tuyen":
+        # Tuyến mới có thể đang bị cache là "không tồn tại"
+        transaction.on_commit(lambda: [invalidate_route_lookup(*key) for key in objs])
+    return len(objs)
+
+
+def _loai_trung_xe(hop_le, bien_so, result):
+    """
+    Giữ lại các dòng (số dòng, chuyến) không làm xe trùng giờ, xét theo thứ tự
+    trong file: với chuyến đã có (một câu query cho cả lô) và với các dòng đã
+    nhận trước nó. Dòng sửa chuyến cũ thay khoảng chạy cũ của chính chuyến đó.
+    """
+    if not hop_le:
+        return []
+    toi_da = thoi_gian_chay_toi_da()
+    # lich[xe_id]: danh sách (bắt đầu, kết thúc, khoá) đã sắp xếp; khoang[khoá] để
+    # gỡ khoảng cũ khi chuyến được sửa. Khoá là pk, hoặc -số dòng với chuyến mới.
+    lich, khoang = {}, {}
+    for khoa, xe_id, bat_dau, ket_thuc in (
+        Chuyen.objects.filter(
+            xe_id__in={chuyen.xe_id for _, chuyen in hop_le},
+            ngay_gio_khoi_hanh__gte=min(chuyen.ngay_gio_khoi_hanh for _, chuyen in hop_le) - toi_da,
+            ngay_gio_khoi_hanh__lte=max(chuyen.ngay_gio_den or chuyen.ngay_gio_khoi_hanh for _, chuyen in hop_le),
+        )
+        .annotate(ket_thuc=Coalesce("ngay_gio_den", "ngay_gio_khoi_hanh"))
+        .order_by("xe_id", "ngay_gio_khoi_hanh")
+        .values_list("pk", "xe_id", "ngay_gio_khoi_hanh", "ket_thuc")
+    ):
+        lich.setdefault(xe_id, []).append((bat_dau, ket_thuc, khoa))
+        khoang[khoa] = xe_id, (bat_dau, ket_thuc, khoa)
+
+    nhan = []
+    for line, chuyen in hop_le:
+        bat_dau = chuyen.ngay_gio_khoi_hanh
+        ket_thuc = chuyen.ngay_gio_den or bat_dau
+        khoa = chuyen.pk if chuyen.pk is not None else -line
+        cua_xe = lich.setdefault(chuyen.xe_id, [])
+        i = bisect_left(cua_xe, (bat_dau - toi_da,))
+        trung = None
+        while i < len(cua_xe) and cua_xe[i][0] <= ket_thuc:
+            bat_dau_cu, ket_thuc_cu, khoa_cu = cua_xe[i]
+            if khoa_cu != khoa and chong_lan(bat_dau, ket_thuc, bat_dau_cu, ket_thuc_cu):
+                trung = cua_xe[i]
+                break
+            i += 1
+        if trung:
+            if trung[2] < 0:
+                result.add_error(line, f"Xe {bien_so[chuyen.xe_id]} trùng giờ với chuyến ở dòng {-trung[2]}.")
+            else:
+                gio = timezone.localtime(trung[0]).strftime('%d/%m/%Y %H:%M')
+                result.add_error(line, f"Xe {bien_so[chuyen.xe_id]} đã có chuyến trùng giờ (#{trung[2]}, {gio}).")
+            continue
+        if khoa in khoang:
+            xe_cu, cu = khoang[khoa]
+            lich[xe_cu].remove(cu)
+        khoang[khoa] = chuyen.xe_id, (bat_dau, ket_thuc, khoa)
+        insort(cua_xe, khoang[khoa][1])
+        nhan.append((line, chuyen))
+    return nhan
+
+
+def _nhap_chuyen(batch, result):
+    tuyens = {
+        (diem_di, diem_den): pk
+        for pk, diem_di, diem_den in Tuyen.objects.filter(
+            diem_di__in={_chuoi(row, "diem_di", False) for _, row in batch},
+            diem_den__in={_chuoi(row, "diem_den", False) for _, row in batch},
+        ).values_list("pk", "diem_di", "diem_den")
+    }
+    # Khoá xe (theo pk để các lô chạy song song không deadlock) cho tới hết lô,
+    # để lịch khác của cùng xe không chen vào giữa lúc kiểm tra trùng và lúc ghi
+    xes = {
+        bien_so: (pk, so_ghe)
+        for pk, bien_so, so_ghe in Xe.objects.select_for_update().filter(
+            bien_so__in={_chuoi(row, "bien_so", False) for _, row in batch}
+        ).order_by("pk").values_list("pk", "bien_so", "so_ghe")
+    }
+    ids = set()
+    for _, row in batch:
+        try:
+            ids.add(_so_nguyen(row, "id", False))
+        except ValidationError:
+            pass
+    # Không cho giảm tổng số vé xuống dưới số vé đã bán / đang giữ; giờ khởi hành
+    # và tuyến cũ để đánh dấu ngày cần tổng hợp lại và làm mới cache của tuyến cũ
+    da_dung, khoi_hanh_cu, tuyen_cu = {}, {}, {}
+    for pk, so, khoi_hanh, tuyen_id in (
+        Chuyen.objects.filter(pk__in=ids - {None})
+        .annotate(da_dung=F("so_ve_da_ban") + F("so_ve_dang_giu"))
+        .values_list("pk", "da_dung", "ngay_gio_khoi_hanh", "tuyen_id")
+    ):
+        da_dung[pk], khoi_hanh_cu[pk], tuyen_cu[pk] = so, khoi_hanh, tuyen_id
+
+    hop_le = []
+    for line, row in batch:
+        try:
+            pk = _so_nguyen(row, "id", False)
+            tuyen = tuyens.get((_chuoi(row, "diem_di"), _chuoi(row, "diem_den")))
+            if tuyen is None:
+                raise ValidationError(f"Không tìm thấy tuyến {row['diem_di']} → {row['diem_den']}.")
+            xe = xes.get(_chuoi(row, "bien_so"))
+            if xe is None:
+                raise ValidationError(f"Không tìm thấy xe {row['bien_so']}.")
+            chuyen = Chuyen(
+                pk=pk, tuyen_id=tuyen, xe_id=xe[0],
+                ngay_gio_khoi_hanh=_thoi_gian(row, "ngay_gio_khoi_hanh"),
+                ngay_gio_den=_thoi_gian(row, "ngay_gio_den", False),
+                tong_so_ve=_so_nguyen(row, "tong_so_ve"), gia_ve=_so_thap_phan(row, "gia_ve"),
+            )
+            # Như Chuyen.clean() nhưng cho phép chuyến trong quá khứ (nhập lại file đã xuất);
+            # trùng xe được kiểm tra cho cả lô bên dưới.
+            if chuyen.ngay_gio_den and chuyen.ngay_gio_den < chuyen.ngay_gio_khoi_hanh:
+                raise ValidationError("Ngày giờ đến phải sau hoặc bằng ngày giờ khởi hành.")
+            if chuyen.ngay_gio_den and chuyen.ngay_gio_den - chuyen.ngay_gio_khoi_hanh > thoi_gian_chay_toi_da():
+                raise ValidationError(f"Thời gian chạy không được quá {thoi_gian_chay_toi_da()}.")
+            if chuyen.tong_so_ve <= 0:
+                raise ValidationError("Tổng số vé phải lớn hơn 0.")
+            if chuyen.gia_ve <= 0:
+                raise ValidationError("Giá vé phải lớn hơn 0.")
+            if chuyen.tong_so_ve > xe[1]:
+                raise ValidationError(f"Tổng số vé ({chuyen.tong_so_ve}) vượt quá số ghế của xe ({xe[1]}).")
+            if chuyen.tong_so_ve < da_dung.get(pk, 0):
+                raise ValidationError(f"Tổng số vé nhỏ hơn số vé đã bán / đang giữ ({da_dung[pk]}).")
+        except ValidationError as e:
+            result.add_error(line, "; ".join(e.messages))
+            continue
+        hop_le.append((line, chuyen))
+
+    cap_nhat, tao_moi = {}, []
+    for line, chuyen in _loai_trung_xe(hop_le, {pk: bien_so for bien_so, (pk, _) in xes.items()}, result):
+        if chuyen.pk is None:
+            tao_moi.append(chuyen)
+        else:
+            cap_nhat[chuyen.pk] = chuyen
+        result.xe_ids.add(chuyen.xe_id)
+
+    if cap_nhat:
+        _upsert(
+            Chuyen, list(cap_nhat.values()), ["id"],
+            ["tuyen", "xe", "ngay_gio_khoi_hanh", "ngay_gio_den", "tong_so_ve", "gia_ve", "cap_nhat_luc"],
+        )
+        NgayCanTongHop.danh_dau(
+            khoi_hanh_cu[pk] for pk, chuyen in cap_nhat.items()
+            if pk in khoi_hanh_cu
+            and timezone.localdate(khoi_hanh_cu[pk]) != timezone.localdate(chuyen.ngay_gio_khoi_hanh)
+        )
+    if tao_moi:
+        Chuyen.objects.bulk_create(tao_moi)
+    # bulk_create không phát signal nên phải tự làm mới cache tìm kiếm, kể cả
+    # tuyến cũ của chuyến bị đổi tuyến và số vé còn lại của từng chuyến đã sửa
+    tuyen_ids = {chuyen.tuyen_id for chuyen in [*cap_nhat.values(), *tao_moi]}
+    tuyen_ids.update(tuyen_cu[pk] for pk in cap_nhat if pk in tuyen_cu)
+    chuyen_sua = {pk: chuyen.tuyen_id for pk, chuyen in cap_nhat.items()}
+
+    def lam_moi_cache():
+        for tuyen_id in tuyen_ids:
+            invalidate_route(tuyen_id)
+        for pk, tuyen_id in chuyen_sua.items():
+            invalidate_trip(pk, tuyen_id)
+
+    transaction.on_commit(lam_moi_cache)
+    return len(cap_nhat) + len(tao_moi)
+
+
+def import_rows(kind, rows, batch_size=None):
+    """
+    Nhập các dòng (số dòng, dict) theo lô `batch_size` (TIMETABLE_IMPORT_BATCH_SIZE).
+    Trả về ImportResult.
+    """
+    if kind not in COLUMNS:
+        raise ValueError(f"Loại dữ liệu không hỗ trợ: {kind}")
+    batch_size = batch_size or getattr(settings, "TIMETABLE_IMPORT_BATCH_SIZE", 1000)
+    result = ImportResult()
+    rows = iter(rows)
+    while batch := list(islice(rows, batch_size)):
+        result.rows += len(batch)
+        hop_le = []
+        for line, row in batch:
+            if row is None:
+                result.add_error(line, "Dòng không hợp lệ.")
+            else:
+                hop_le.append((line, row))
+        if hop_le:
+            with transaction.atomic():
+                if kind == "chuyen":
+                    result.imported += _nhap_chuyen(hop_le, result)
+                else:
+                    result.imported += _nhap_theo_khoa(kind, hop_le, result)
+    return result
+
+
+def import_file(kind, stream, fmt="csv", batch_size=None):
+    return import_rows(kind, iter_rows(stream, fmt), batch_size=batch_size)
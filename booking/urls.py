@@ -1,12 +1,15 @@
 from django.urls import path
 from .views import (
-    AdminChuyenCreateView, AdminChuyenDeleteView, AdminChuyenListView, AdminChuyenUpdateView,
+    AdminChuyenCreateView, AdminChuyenDeleteView, AdminLichChayCreateView, AdminChuyenListView, AdminChuyenUpdateView,
     AdminTuyenCreateView, AdminTuyenDeleteView, AdminTuyenListView, AdminTuyenUpdateView,
     AdminXeCreateView, AdminXeDeleteView, AdminXeListView, AdminXeUpdateView,
-    AdminPaymentListView, AdminVeListView
+    AdminKeToanExportView, AdminNhapDuLieuView, AdminXuatDuLieuView, AdminPaymentListView, AdminVeListView, ChuyenSearchView,
+    payment_callback,
 )
 
 urlpatterns = [
+    path('tim-chuyen/', ChuyenSearchView.as_view(), name='chuyen-search'),
+
     path('tuyen/', AdminTuyenListView.as_view(), name='tuyen-list'),
     path('tuyen/create/', AdminTuyenCreateView.as_view(), name='tuyen-create'),
     path('tuyen/<int:pk>/update/', AdminTuyenUpdateView.as_view(), name='tuyen-update'),
@@ -15,6 +18,7 @@ urlpatterns = [
     
     path('chuyen/', AdminChuyenListView.as_view(), name='chuyen-list'),
     path('chuyen/create/', AdminChuyenCreateView.as_view(), name='chuyen-create'),
+    path('chuyen/lich-chay/', AdminLichChayCreateView.as_view(), name='chuyen-schedule'),
     path('chuyen/<int:pk>/update/', AdminChuyenUpdateView.as_view(), name='chuyen-update'),
     path('chuyen/<int:pk>/delete/', AdminChuyenDeleteView.as_view(), name='chuyen-delete'),
 
@@ -25,6 +29,12 @@ urlpatterns = [
     path('xe/<int:pk>/delete/', AdminXeDeleteView.as_view(), name='xe-delete'),
 
     
+    path('du-lieu/nhap/', AdminNhapDuLieuView.as_view(), name='data-import'),
+    path('du-lieu/<str:loai>/xuat/', AdminXuatDuLieuView.as_view(), name='data-export'),
+
     path('payment/', AdminPaymentListView.as_view(), name='payment-list'),
+    path('payment/export/', AdminKeToanExportView.as_view(kind='thanh_toan'), name='payment-export'),
+    path('payment/callback/', payment_callback, name='payment-callback'),
     path('ve/', AdminVeListView.as_view(), name='ve-list'),
+    path('ve/export/', AdminKeToanExportView.as_view(kind='ve'), name='ve-export'),
 ]
@@ -1,8 +1,22 @@
 from django.shortcuts import render
 from django.shortcuts import render
+import io
+from datetime import timedelta
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, TemplateView, FormView, View
+from .exports import iter_export as iter_export_ke_toan
+from .forms import ChuyenSearchForm, KhoangNgayForm, LichChayForm, NhapDuLieuForm
 from .models import Tuyen, Chuyen, Xe, Ve, ThanhToan
+from .payments import enqueue_callback, verify_signature
+from .cache import cached_search_trips
+from .services import audit_vehicle_overlaps, generate_schedule
+from .timetable import COLUMNS, FORMATS, import_file, iter_export
 from django.urls import reverse_lazy
 #============== ADMIN ==================
 class StaffRequiredMixins(UserPassesTestMixin):
@@ -22,18 +36,21 @@ class AdminXeListView(LoginRequiredMixin,StaffRequiredMixins,ListView):
 
 class AdminChuyenListView(LoginRequiredMixin,StaffRequiredMixins,ListView):
     model = Chuyen
+    queryset = Chuyen.objects.select_related('tuyen', 'xe').order_by('-ngay_gio_khoi_hanh', '-id')
     template_name = "bookingticket/admin/chuyen_list.html"
     context_object_name = "danh_sach_chuyen"
     paginate_by = 10
 
 class AdminVeListView(LoginRequiredMixin,StaffRequiredMixins,ListView):
     model = Ve
+    queryset = Ve.objects.select_related('khach', 'chuyen__tuyen').order_by('-thoi_gian_dat', '-id')
     template_name = "bookingticket/admin/ve_list.html"
     context_object_name = "danh_sach_ve"
     paginate_by = 20
 
 class AdminPaymentListView(LoginRequiredMixin,StaffRequiredMixins,ListView):
     model = ThanhToan
+    queryset = ThanhToan.objects.select_related('ve__khach', 've__chuyen__tuyen').order_by('-ngay_gio', '-id')
     template_name = "bookingticket/admin/payment_list.html"
     context_object_name = "danh_sach_thanh_toan"
     paginate_by = 20
@@ -44,16 +61,96 @@ class AdminTuyenCreateView(LoginRequiredMixin,StaffRequiredMixins,CreateView):
     fields = ['diem_di', 'diem_den', 'khoang_cach']
     success_url = reverse_lazy('tuyen-list')
     
-class AdminChuyenCreateView(LoginRequiredMixin, StaffRequiredMixins, CreateView):
+class KhoaXeMixin:
+    """
+    Lưu chuyến sau khi khoá dòng Xe và kiểm tra lại trùng lịch trong cùng
+    transaction (như generate_schedule): Chuyen.clean() kiểm tra khi chưa khoá
+    nên hai admin lưu cùng lúc cho một xe có thể cùng qua.
+    """
+
+    def form_valid(self, form):
+        with transaction.atomic():
+            Xe.objects.select_for_update().get(pk=form.instance.xe_id)
+            try:
+                form.instance.kiem_tra_trung_lich()
+            except ValidationError as e:
+                form.add_error(None, e)
+                return self.form_invalid(form)
+            return super().form_valid(form)
+
+class AdminChuyenCreateView(LoginRequiredMixin, StaffRequiredMixins, KhoaXeMixin, CreateView):
     model = Chuyen
     template_name = "bookingticket/admin/chuyen_form.html"
     fields = ['tuyen', 'xe', 'ngay_gio_khoi_hanh', 'ngay_gio_den', 'tong_so_ve', 'gia_ve']
     success_url = reverse_lazy('chuyen-list')
     
+class AdminLichChayCreateView(LoginRequiredMixin, StaffRequiredMixins, FormView):
+    form_class = LichChayForm
+    template_name = "bookingticket/admin/lich_chay_form.html"
+    success_url = reverse_lazy('chuyen-list')
+
+    def form_valid(self, form):
+        cd = form.cleaned_data
+        try:
+            so_chuyen = generate_schedule(
+                cd['tuyen'], cd['xe'], cd['gio_khoi_hanh'], cd['ngay_trong_tuan'], cd['tu_ngay'], cd['den_ngay'],
+                cd['gia_ve'], tong_so_ve=cd['tong_so_ve'],
+                thoi_gian_chay=timedelta(minutes=cd['thoi_gian_chay']) if cd['thoi_gian_chay'] else None,
+            )
+        except ValidationError as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
+        messages.success(self.request, f"Đã tạo {so_chuyen} chuyến.")
+        return super().form_valid(form)
+
+class AdminNhapDuLieuView(LoginRequiredMixin, StaffRequiredMixins, FormView):
+    form_class = NhapDuLieuForm
+    template_name = "bookingticket/admin/nhap_du_lieu.html"
+
+    def form_valid(self, form):
+        cd = form.cleaned_data
+        # Đọc thẳng từ file tải lên (Django lưu file lớn ra đĩa tạm), không nạp cả file vào bộ nhớ
+        stream = io.TextIOWrapper(cd['tep'].file, encoding='utf-8-sig', newline='')
+        result = import_file(cd['loai'], stream, cd['dinh_dang'])
+        so_cap_trung = sum(1 for _ in audit_vehicle_overlaps(xe_ids=result.xe_ids)) if result.xe_ids else 0
+        messages.success(self.request, f"Đã nhập {result.imported}/{result.rows} dòng, {result.error_count} dòng lỗi.")
+        if so_cap_trung:
+            messages.warning(self.request, f"Có {so_cap_trung} cặp chuyến trùng xe.")
+        return self.render_to_response(self.get_context_data(form=form, result=result))
+
+class AdminXuatDuLieuView(LoginRequiredMixin, StaffRequiredMixins, View):
+    def get(self, request, loai):
+        dinh_dang = request.GET.get('format', 'csv')
+        if loai not in COLUMNS or dinh_dang not in FORMATS:
+            raise Http404
+        response = StreamingHttpResponse(
+            iter_export(loai, dinh_dang),
+            content_type="text/csv; charset=utf-8" if dinh_dang == "csv" else "application/x-ndjson; charset=utf-8",
+        )
+        response['Content-Disposition'] = f'attachment; filename="{loai}.{dinh_dang}"'
+        return response
+
+class AdminKeToanExportView(LoginRequiredMixin, StaffRequiredMixins, View):
+    """CSV vé / thanh toán theo khoảng ngày (?tu_ngay=...&den_ngay=...), stream từng lô."""
+    kind = "ve"
+
+    def get(self, request):
+        form = KhoangNgayForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+        cd = form.cleaned_data
+        response = StreamingHttpResponse(
+            iter_export_ke_toan(self.kind, cd['tu_ngay'], cd['den_ngay']), content_type="text/csv; charset=utf-8"
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{self.kind}_{cd["tu_ngay"]:%Y%m%d}_{cd["den_ngay"]:%Y%m%d}.csv"'
+        )
+        return response
+
 class AdminXeCreateView(LoginRequiredMixin, StaffRequiredMixins, CreateView):
     model = Xe
     template_name = "bookingticket/admin/xe_form.html"
-    fields = ['bien_so', 'loai_xe', 'so_ghe']
+    fields = ['bien_so', 'loai_xe', 'so_ghe', 'so_ghe_moi_hang']
     success_url = reverse_lazy('xe-list')
     
 class AdminTuyenUpdateView(LoginRequiredMixin, StaffRequiredMixins,UpdateView):
@@ -62,7 +159,7 @@ class AdminTuyenUpdateView(LoginRequiredMixin, StaffRequiredMixins,UpdateView):
     fields = ['diem_di', 'diem_den', 'khoang_cach']
     success_url = reverse_lazy('tuyen-list')
     
-class AdminChuyenUpdateView(LoginRequiredMixin, StaffRequiredMixins, UpdateView):
+class AdminChuyenUpdateView(LoginRequiredMixin, StaffRequiredMixins, KhoaXeMixin, UpdateView):
     model = Chuyen
     template_name = "bookingticket/admin/chuyen_form.html"
     fields = ['tuyen', 'xe', 'ngay_gio_khoi_hanh', 'ngay_gio_den', 'tong_so_ve', 'gia_ve']
@@ -72,7 +169,7 @@ class AdminXeUpdateView(LoginRequiredMixin, StaffRequiredMixins, UpdateView):
     
     model = Xe
     template_name = "bookingticket/admin/xe_form.html"
-    fields = ['bien_so', 'loai_xe', 'so_ghe']
+    fields = ['bien_so', 'loai_xe', 'so_ghe', 'so_ghe_moi_hang']
     success_url = reverse_lazy('xe-list')
 class AdminTuyenDeleteView(LoginRequiredMixin, StaffRequiredMixins, DeleteView):
     model = Tuyen
@@ -90,4 +187,46 @@ class AdminXeDeleteView(LoginRequiredMixin, StaffRequiredMixins, DeleteView):
 
     model = Xe
     template_name = "bookingticket/admin/xe_confirm_delete.html"
-    success_url = reverse_lazy('xe-list')
\ No newline at end of file
+    success_url = reverse_lazy('xe-list')
+
+#============== KHÁCH HÀNG ==================
+class ChuyenSearchView(TemplateView):
+    template_name = "bookingticket/chuyen_search.html"
+    page_size = 20
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = ChuyenSearchForm(self.request.GET or None)
+        danh_sach_chuyen, trang_sau_url = [], None
+        if form.is_valid():
+            cd = form.cleaned_data
+            danh_sach_chuyen, moc = cached_search_trips(
+                cd['diem_di'], cd['diem_den'],
+                tu_ngay=cd['tu_ngay'], den_ngay=cd['den_ngay'], so_ve=cd['so_ve'],
+                gia_tu=cd['gia_tu'], gia_den=cd['gia_den'],
+                sau=self.request.GET.get('sau'), limit=self.page_size,
+            )
+            if moc:
+                query = self.request.GET.copy()
+                query['sau'] = moc
+                trang_sau_url = f"?{query.urlencode()}"
+        context.update(form=form, danh_sach_chuyen=danh_sach_chuyen, trang_sau_url=trang_sau_url)
+        return context
+
+
+#============== CỔNG THANH TOÁN ==================
+@csrf_exempt
+@require_POST
+def payment_callback(request):
+    """
+    Callback của cổng thanh toán: kiểm tra chữ ký rồi xếp hàng, trả 202 ngay.
+    Worker process_payment_callbacks mới khoá vé / chuyến và xác nhận.
+    """
+    ma_giao_dich = request.POST.get('ma_giao_dich', '').strip()
+    thanh_cong = request.POST.get('thanh_cong') == '1'
+    if not ma_giao_dich:
+        return HttpResponseBadRequest("Thiếu mã giao dịch.")
+    if not verify_signature(ma_giao_dich, thanh_cong, request.POST.get('chu_ky')):
+        return HttpResponseForbidden("Sai chữ ký.")
+    enqueue_callback(ma_giao_dich, thanh_cong)
+    return HttpResponse(status=202)
@@ -1,16 +1,36 @@
 # users/backends.py
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q
 
 class EmailBackend(ModelBackend):
+    """
+    Đăng nhập bằng email hoặc username trong một query, luôn băm mật khẩu đúng
+    một lần mỗi lần thử (kể cả khi không tìm thấy tài khoản) để thời gian phản
+    hồi không lộ việc tài khoản có tồn tại hay không.
+    """
     def authenticate(self, request, username=None, password=None, **kwargs):
         UserModel = get_user_model()
-        try:
-            # Gán `username` (từ form) vào `email` để tìm kiếm
-            user = UserModel.objects.get(email=username) 
-        except UserModel.DoesNotExist:
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        # Gán `username` (từ form) vào `email` để tìm kiếm (qua unique index email_normalized)
+        email_key = UserModel.normalize_email_key(username)
+        dieu_kien = Q(username=username)
+        if email_key:
+            dieu_kien |= Q(email_normalized=email_key)
+        users = list(UserModel._default_manager.filter(dieu_kien)[:2])
+        # Ưu tiên tài khoản khớp email nếu email của người này trùng username của người khác
+        user = next((u for u in users if email_key and u.email_normalized == email_key), None)
+        if user is None and users:
+            user = users[0]
+
+        if user is None:
+            # Băm giả để thời gian xử lý giống trường hợp sai mật khẩu
+            UserModel().set_password(password)
             return None
-        
         if user.check_password(password):
             return user
         return None
@@ -20,4 +40,4 @@ class EmailBackend(ModelBackend):
         try:
             return UserModel.objects.get(pk=user_id)
         except UserModel.DoesNotExist:
-            return None
\ No newline at end of file
+            return None
@@ -0,0 +1,111 @@
+"""
+Hàng đợi email (outbox).
+
+View chỉ ghi email vào bảng EmailOutbox rồi trả response ngay; worker
+`python manage.py send_queued_emails` gửi theo lô trên một kết nối SMTP
+dùng lại, thử lại với thời gian chờ tăng dần khi lỗi.
+"""
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+
+def queue_email(subject, message, recipient_list, html_message=None):
+    """Thay cho send_mail(): chỉ ghi vào outbox, không chờ SMTP."""
+    return EmailOutbox.objects.bulk_create([
+        EmailOutbox(recipient=recipient, subject=subject, body=message, html_body=html_message or "")
+        for recipient in recipient_list
+    ])
+
+
+def _claim(batch_size, now):
+    """
+    Nhận một lô email đến hạn (chuyển sang SENDING) trong một transaction
+    ngắn. Email SENDING quá EMAIL_OUTBOX_CLAIM_TIMEOUT giây (worker chết giữa
+    chừng) được nhận lại.
+    """
+    timeout = getattr(settings, "EMAIL_OUTBOX_CLAIM_TIMEOUT", 600)
+    with transaction.atomic():
+        qs = EmailOutbox.objects.filter(
+            Q(status="PENDING", send_after__lte=now)
+            | Q(status="SENDING", claimed_at__lt=now - timezone.timedelta(seconds=timeout))
+        ).order_by("send_after", "id")
+        if connection.features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+        batch = list(qs[:batch_size])
+        if batch:
+            # Tính lần thử ngay khi nhận: email làm worker chết không bị gửi lại mãi
+            EmailOutbox.objects.filter(pk__in=[email.pk for email in batch]).update(
+                status="SENDING", claimed_at=now, attempts=F("attempts") + 1,
+            )
+    for email in batch:
+        email.attempts += 1
+    return batch
+
+
+def _mo_ket_noi(mail_connection):
+    """
+    Mở kết nối SMTP dùng chung cho cả lô. Nếu không mở được thì để nguyên:
+    từng email sẽ tự thử mở khi gửi và lỗi được ghi vào outbox như lỗi gửi.
+    """
+    try:
+        mail_connection.open()
+    except Exception:
+        mail_connection.close()
+
+
+def send_pending(batch_size=None, max_attempts=None, now=None):
+    """
+    Gửi một lô email đến hạn, trả về (số gửi được, số lỗi).
+
+    Lô được nhận bằng SELECT ... FOR UPDATE SKIP LOCKED (nếu database hỗ trợ)
+    trong một transaction ngắn nên có thể chạy nhiều worker song song. Việc gửi
+    SMTP nằm ngoài transaction, mỗi email được đánh dấu SENT / lỗi ngay sau khi
+    gửi: SMTP chậm không giữ transaction và worker chết giữa chừng không làm
+    gửi lại các email đã gửi xong.
+    """
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50)
+    max_attempts = max_attempts or getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    now = now or timezone.now()
+
+    batch = _claim(batch_size, now)
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    mail_connection = get_connection(fail_silently=False)
+    # Backend chỉ giữ kết nối giữa các lần send() nếu đã được mở từ trước
+    _mo_ket_noi(mail_connection)
+    try:
+        for email in batch:
+            message = EmailMultiAlternatives(
+                subject=email.subject, body=email.body,
+                from_email=settings.DEFAULT_FROM_EMAIL, to=[email.recipient],
+                connection=mail_connection,
+            )
+            if email.html_body:
+                message.attach_alternative(email.html_body, "text/html")
+            try:
+                message.send()
+            except Exception as e:
+                failed += 1
+                cap_nhat = {"last_error": str(e)}
+                if email.attempts >= max_attempts:
+                    cap_nhat["status"] = "FAILED"
+                else:
+                    cap_nhat["status"] = "PENDING"
+                    cap_nhat["send_after"] = now + timezone.timedelta(minutes=2 ** email.attempts)
+                # Kết nối có thể đã hỏng: mở lại một lần cho các email còn lại
+                mail_connection.close()
+                _mo_ket_noi(mail_connection)
+            else:
+                sent += 1
+                cap_nhat = {"status": "SENT", "sent_at": timezone.now()}
+            EmailOutbox.objects.filter(pk=email.pk, status="SENDING").update(**cap_nhat)
+    finally:
+        mail_connection.close()
+    return sent, failed
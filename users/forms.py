@@ -1,6 +1,34 @@
 from django import forms
+from django.db.models import CharField, Value
 from .models import Account, KhachHang
 
+CONFLICT_MESSAGES = {
+    'email': "Email này đã được sử dụng.",
+    'so_dien_thoai': "Số điện thoại này đã được sử dụng.",
+    'cccd': "Số CCCD này đã tồn tại.",
+}
+
+def find_conflicts(email, so_dien_thoai, cccd):
+    """Trả về {field: thông báo lỗi} cho các giá trị đã tồn tại, trong một query (UNION ALL)."""
+    queries = []
+    email_key = Account.normalize_email_key(email)
+    if email_key:
+        queries.append(Account.objects.filter(email_normalized=email_key)
+                       .values_list(Value('email', output_field=CharField())))
+        queries.append(KhachHang.objects.filter(email=email)
+                       .values_list(Value('email', output_field=CharField())))
+    if so_dien_thoai:
+        queries.append(KhachHang.objects.filter(so_dien_thoai=so_dien_thoai)
+                       .values_list(Value('so_dien_thoai', output_field=CharField())))
+    if cccd:
+        queries.append(KhachHang.objects.filter(cccd=cccd)
+                       .values_list(Value('cccd', output_field=CharField())))
+    if not queries:
+        return {}
+    fields = queries[0].union(*queries[1:], all=True) if len(queries) > 1 else queries[0]
+    return {field: CONFLICT_MESSAGES[field] for (field,) in fields}
+
+
 class RegistrationForm(forms.Form):
     # Các trường cho model KhachHang
     ten = forms.CharField(max_length=100, label="Họ và tên")
@@ -12,23 +40,14 @@ class RegistrationForm(forms.Form):
     password = forms.CharField(widget=forms.PasswordInput, label="Mật khẩu")
     password2 = forms.CharField(label="Xác nhận mật khẩu", widget=forms.PasswordInput)
 
-    def clean_email(self):
-        email = self.cleaned_data.get('email')
-        if Account.objects.filter(email=email).exists():
-            raise forms.ValidationError("Email này đã được sử dụng.")
-        return email
-
-    def clean_so_dien_thoai(self):
-        so_dien_thoai = self.cleaned_data.get('so_dien_thoai')
-        if KhachHang.objects.filter(so_dien_thoai=so_dien_thoai).exists():
-            raise forms.ValidationError("Số điện thoại này đã được sử dụng.")
-        return so_dien_thoai
-
-    def clean_cccd(self):
-        cccd = self.cleaned_data.get('cccd')
-        if KhachHang.objects.filter(cccd=cccd).exists():
-            raise forms.ValidationError("Số CCCD này đã tồn tại.")
-        return cccd
+    def clean(self):
+        cleaned_data = super().clean()
+        # Một query UNION cho cả ba ràng buộc unique thay vì ba lần exists()
+        for field, message in find_conflicts(
+            cleaned_data.get('email'), cleaned_data.get('so_dien_thoai'), cleaned_data.get('cccd')
+        ).items():
+            self.add_error(field, message)
+        return cleaned_data
 
     def clean_password2(self):
         cd = self.cleaned_data
@@ -40,6 +59,6 @@ class CustomPasswordResetRequestForm(forms.Form):
 
     def clean_email(self):
         email = self.cleaned_data.get('email')
-        if not Account.objects.filter(email=email, is_active=True).exists():
+        if not Account.objects.filter(email_normalized=Account.normalize_email_key(email), is_active=True).exists():
             raise forms.ValidationError("Không tìm thấy tài khoản nào với email này.")
         return email
\ No newline at end of file
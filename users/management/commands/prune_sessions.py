@@ -0,0 +1,27 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "Xoá session hết hạn trong bảng django_session theo từng lô nhỏ (thay cho clearsessions)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--pause", type=float, default=0.1, help="Nghỉ giữa các lô (giây) để không giữ khoá lâu.")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        total = 0
+        while True:
+            keys = list(
+                Session.objects.filter(expire_date__lt=now)
+                .values_list("session_key", flat=True)[:options["batch_size"]]
+            )
+            if not keys:
+                break
+            total += Session.objects.filter(session_key__in=keys).delete()[0]
+            time.sleep(options["pause"])
+        self.stdout.write(f"Đã xoá {total} session hết hạn.")
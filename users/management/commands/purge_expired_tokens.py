@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.models import EmailVerification, PasswordReset, TokenTableSnapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Xoá token xác thực email / reset mật khẩu đã hết hạn theo từng lô nhỏ "
+        "và ghi lại kích thước bảng (TokenTableSnapshot)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--pause", type=float, default=0.05, help="Nghỉ giữa các lô (giây) để không giữ khoá lâu.")
+        parser.add_argument("--stats", type=int, metavar="N", help="Chỉ in N lần đo gần nhất của mỗi bảng, không xoá.")
+
+    def handle(self, *args, **options):
+        models = [EmailVerification, PasswordReset]
+        if options["stats"]:
+            for model in models:
+                for snap in TokenTableSnapshot.objects.filter(
+                    table_name=model._meta.db_table
+                ).order_by("-taken_at")[:options["stats"]]:
+                    self.stdout.write(
+                        f"{snap.taken_at:%Y-%m-%d %H:%M} {snap.table_name}: {snap.total_rows} dòng, "
+                        f"{snap.expired_rows} hết hạn, đã xoá {snap.deleted_rows}"
+                    )
+            return
+
+        now = timezone.now()
+        for model in models:
+            expired = model.objects.filter(expires_at__lt=now)
+            expired_rows = expired.count()
+            deleted = 0
+            while True:
+                # Lấy id qua index expires_at rồi xoá theo khoá chính: mỗi lô chỉ khoá vài nghìn dòng
+                ids = list(expired.order_by("expires_at").values_list("pk", flat=True)[:options["batch_size"]])
+                if not ids:
+                    break
+                deleted += model.objects.filter(pk__in=ids).delete()[0]
+                time.sleep(options["pause"])
+            snap = TokenTableSnapshot.objects.create(
+                table_name=model._meta.db_table,
+                total_rows=model.objects.count(),
+                expired_rows=expired_rows,
+                deleted_rows=deleted,
+            )
+            self.stdout.write(f"{snap.table_name}: đã xoá {deleted} token hết hạn, còn {snap.total_rows} dòng.")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users.ratelimit import stats
+
+
+class Command(BaseCommand):
+    help = "In số request đã kiểm tra / bị chặn bởi rate limit theo từng view."
+
+    def handle(self, *args, **options):
+        for scope, counts in stats().items():
+            self.stdout.write(f"{scope}: checked={counts['checked']} blocked={counts['blocked']}")
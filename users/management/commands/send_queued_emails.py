@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.emails import send_pending
+
+
+class Command(BaseCommand):
+    help = "Gửi các email đang chờ trong outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Số email gửi trên mỗi kết nối SMTP.")
+        parser.add_argument(
+            "--interval", type=int, default=0,
+            help="Chạy như worker: kiểm tra outbox sau mỗi N giây. Mặc định gửi hết rồi dừng.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            total_sent = total_failed = 0
+            while True:
+                sent, failed = send_pending(batch_size=options["batch_size"])
+                total_sent += sent
+                total_failed += failed
+                if not sent and not failed:
+                    break
+            if total_sent or total_failed or not options["interval"]:
+                self.stdout.write(f"Đã gửi {total_sent} email, {total_failed} lỗi.")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
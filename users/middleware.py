@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, logout
+from django.shortcuts import redirect
+from django.urls import reverse
+
+
+class SessionRefreshMiddleware:
+    """
+    Thay cho SESSION_SAVE_EVERY_REQUEST: chỉ đánh dấu session cần lưu lại (để
+    gia hạn SESSION_COOKIE_AGE) khi lần gia hạn trước đã cách ít nhất
+    SESSION_REFRESH_INTERVAL giây, nên các request dồn dập không ghi session.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.interval = getattr(settings, 'SESSION_REFRESH_INTERVAL', 60)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        session = getattr(request, 'session', None)
+        if session is not None and not session.modified and not session.is_empty():
+            now = int(time.time())
+            if now - session.get('_refreshed_at', 0) >= self.interval:
+                session['_refreshed_at'] = now
+        return response
+
+
+class AutoLogoutMiddleware:
+    """
+    Đăng xuất người dùng không hoạt động quá AUTO_LOGOUT_DELAY giây.
+
+    Chỉ đọc `last_activity` trong session (cookie đã ký, không query DB) và chỉ
+    ghi lại mốc này khi đã cũ hơn AUTO_LOGOUT_REFRESH_INTERVAL giây, nên phần
+    lớn request chỉ tốn một phép so sánh.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.delay = getattr(settings, 'AUTO_LOGOUT_DELAY', 300)
+        self.refresh_interval = getattr(settings, 'AUTO_LOGOUT_REFRESH_INTERVAL', 30)
+
+    def __call__(self, request):
+        session = getattr(request, 'session', None)
+        # Kiểm tra khoá trong session thay vì request.user để không phải tải user từ DB
+        if session is not None and SESSION_KEY in session:
+            now = time.time()
+            last_activity = session.get('last_activity')
+            if last_activity is not None and now - last_activity > self.delay:
+                logout(request)
+                return redirect(f"{reverse('login')}?expired=1&reason=Timeout")
+            if last_activity is None or now - last_activity >= self.refresh_interval:
+                session['last_activity'] = now
+        return self.get_response(request)
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:20
+
+import logging
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+
+def chuan_hoa_email(apps, schema_editor):
+    Account = apps.get_model('users', 'Account')
+    da_gap = set()
+    cap_nhat = []
+    for account in Account.objects.order_by('id').only('id', 'email').iterator(chunk_size=2000):
+        key = (account.email or '').strip().lower() or None
+        if key in da_gap:
+            # Email trùng (khác hoa/thường): giữ tài khoản cũ nhất, các tài khoản sau để NULL
+            logger.warning("Account %s: email %s bị trùng, bỏ qua email_normalized", account.id, account.email)
+            continue
+        if key:
+            da_gap.add(key)
+        account.email_normalized = key
+        cap_nhat.append(account)
+        if len(cap_nhat) >= 2000:
+            Account.objects.bulk_update(cap_nhat, ['email_normalized'])
+            cap_nhat = []
+    Account.objects.bulk_update(cap_nhat, ['email_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='email_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=254, null=True),
+        ),
+        migrations.RunPython(chuan_hoa_email, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='account',
+            name='email_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=254, null=True, unique=True),
+        ),
+    ]
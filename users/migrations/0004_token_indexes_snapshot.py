@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_account_email_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenTableSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(max_length=50)),
+                ('total_rows', models.PositiveBigIntegerField()),
+                ('expired_rows', models.PositiveBigIntegerField()),
+                ('deleted_rows', models.PositiveBigIntegerField(default=0)),
+                ('taken_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='emailverification',
+            index=models.Index(fields=['account', 'is_used'], name='emailverif_account_used_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailverification',
+            index=models.Index(fields=['expires_at'], name='emailverif_expires_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='passwordreset',
+            index=models.Index(fields=['account', 'is_used'], name='pwreset_account_used_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='passwordreset',
+            index=models.Index(fields=['expires_at'], name='pwreset_expires_idx'),
+        ),
+    ]
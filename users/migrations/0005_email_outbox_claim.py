@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_token_indexes_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailoutbox',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='emailoutbox',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Chờ gửi'), ('SENDING', 'Đang gửi'), ('SENT', 'Đã gửi'), ('FAILED', 'Gửi lỗi')], default='PENDING', max_length=10),
+        ),
+    ]
@@ -9,6 +9,20 @@ import uuid
 # -------------------------
 class Account(AbstractUser):
     email_verified = models.BooleanField(default=False)
+    # Email đã chuẩn hoá (strip + lower), có unique index để đăng nhập / kiểm tra trùng
+    # không phải quét cả bảng. MariaDB không hỗ trợ index trên biểu thức lower(email).
+    email_normalized = models.CharField(max_length=254, unique=True, null=True, blank=True, editable=False)
+
+    @staticmethod
+    def normalize_email_key(email):
+        return (email or "").strip().lower() or None
+
+    def save(self, *args, **kwargs):
+        self.email_normalized = self.normalize_email_key(self.email)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "email" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "email_normalized"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.username
@@ -40,6 +54,12 @@ class EmailVerification(models.Model):
     def __str__(self):
         return f"Email verification for {self.account.username}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["account", "is_used"], name="emailverif_account_used_idx"),
+            models.Index(fields=["expires_at"], name="emailverif_expires_idx"),
+        ]
+
 
 # -------------------------
 # 0.2. Password Reset
@@ -67,6 +87,26 @@ class PasswordReset(models.Model):
     def __str__(self):
         return f"Password reset for {self.account.username}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["account", "is_used"], name="pwreset_account_used_idx"),
+            models.Index(fields=["expires_at"], name="pwreset_expires_idx"),
+        ]
+
+
+# -------------------------
+# 0.2.1. Thống kê kích thước bảng token (ghi bởi purge_expired_tokens)
+# -------------------------
+class TokenTableSnapshot(models.Model):
+    table_name = models.CharField(max_length=50)
+    total_rows = models.PositiveBigIntegerField()
+    expired_rows = models.PositiveBigIntegerField()
+    deleted_rows = models.PositiveBigIntegerField(default=0)
+    taken_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.table_name}: {self.total_rows} dòng ({self.taken_at:%d/%m/%Y %H:%M})"
+
 
 # -------------------------
 # 1. Khách hàng
@@ -90,3 +130,36 @@ class KhachHang(models.Model):
     class Meta:
         verbose_name = "Khách hàng"
         verbose_name_plural = "Khách hàng"
+
+
+# -------------------------
+# 0.3. Email Outbox
+# -------------------------
+class EmailOutbox(models.Model):
+    STATUS_CHOICES = [
+        ("PENDING", "Chờ gửi"),
+        ("SENDING", "Đang gửi"),
+        ("SENT", "Đã gửi"),
+        ("FAILED", "Gửi lỗi"),
+    ]
+
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="PENDING")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    send_after = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    # Lúc worker nhận email để gửi (status SENDING)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "send_after"], name="emailoutbox_status_send_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.recipient} ({self.status})"
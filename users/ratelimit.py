@@ -0,0 +1,119 @@
+"""
+Giới hạn tần suất (sliding window) cho các view đăng nhập / đăng ký / gửi email.
+
+Bộ đếm nằm trong cache Django (`RATELIMIT_CACHE_ALIAS`): production dùng cache
+dùng chung giữa các worker, test dùng LocMemCache trong bộ nhớ. Việc kiểm tra
+chạy trước khi đọc form nên request bị chặn không tốn băm mật khẩu hay query DB.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+RATE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """'5/m' -> (5, 60)"""
+    count, unit = rate.split("/")
+    return int(count), RATE_UNITS[unit]
+
+
+def _cache():
+    return caches[getattr(settings, "RATELIMIT_CACHE_ALIAS", "default")]
+
+
+def _incr(cache, key, timeout):
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:  # key vừa bị evict
+        cache.set(key, 1, timeout)
+        return 1
+
+
+def hit(scope, ident, rate, now=None):
+    """
+    Ghi nhận một request và trả về True nếu vẫn trong giới hạn.
+
+    Sliding window xấp xỉ bằng hai cửa sổ cố định: số request của cửa sổ trước
+    được tính theo tỉ lệ thời gian còn chồng lên cửa sổ hiện tại.
+    """
+    limit, window = parse_rate(rate)
+    now = time.time() if now is None else now
+    current = int(now // window)
+    digest = hashlib.sha1(str(ident).encode()).hexdigest()
+    key = f"rl:{scope}:{digest}:{window}"
+    cache = _cache()
+    count = _incr(cache, f"{key}:{current}", window * 2)
+    previous = cache.get(f"{key}:{current - 1}", 0)
+    weight = 1 - (now % window) / window
+    return previous * weight + count <= limit
+
+
+def _count(scope, name):
+    _incr(_cache(), f"rl:stats:{scope}:{name}", None)
+
+
+def stats(scopes=None):
+    """{scope: {'checked': n, 'blocked': n}} để theo dõi."""
+    scopes = scopes or getattr(settings, "RATELIMITS", {}).keys()
+    cache = _cache()
+    result = {}
+    for scope in scopes:
+        values = cache.get_many([f"rl:stats:{scope}:checked", f"rl:stats:{scope}:blocked"])
+        result[scope] = {
+            "checked": values.get(f"rl:stats:{scope}:checked", 0),
+            "blocked": values.get(f"rl:stats:{scope}:blocked", 0),
+        }
+    return result
+
+
+def client_ip(request):
+    """
+    IP của client. Sau reverse proxy, lấy địa chỉ thứ RATELIMIT_TRUSTED_PROXIES
+    tính từ bên phải của RATELIMIT_IP_HEADER: mỗi proxy tin cậy nối thêm địa chỉ
+    nó nhận được, còn các địa chỉ bên trái do client tự gửi nên không tin được.
+    """
+    header = getattr(settings, "RATELIMIT_IP_HEADER", None)
+    proxies = getattr(settings, "RATELIMIT_TRUSTED_PROXIES", 1)
+    if header and proxies > 0 and request.META.get(header):
+        # X-Forwarded-For: "<client tự khai>, ..., <client>, <proxy 1>, ..."
+        entries = [entry.strip() for entry in request.META[header].split(",") if entry.strip()]
+        if entries:
+            return entries[-min(proxies, len(entries))]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def ratelimit(scope, email_field="email"):
+    """
+    Decorator cho view: áp dụng RATELIMITS[scope] = {'ip': '20/m', 'email': '5/m'}
+    cho các request POST, theo IP và theo email gửi lên.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method == "POST" and getattr(settings, "RATELIMIT_ENABLED", True):
+                rates = getattr(settings, "RATELIMITS", {}).get(scope, {})
+                checks = []
+                if "ip" in rates:
+                    checks.append(("ip", client_ip(request), rates["ip"]))
+                email = (request.POST.get(email_field) or "").strip().lower()
+                if "email" in rates and email:
+                    checks.append(("email", email, rates["email"]))
+
+                _count(scope, "checked")
+                # Luôn ghi nhận đủ các khoá để kẻ tấn công không né được bằng cách đổi IP
+                allowed = all([hit(f"{scope}:{kind}", ident, rate) for kind, ident, rate in checks])
+                if not allowed:
+                    _count(scope, "blocked")
+                    return HttpResponse(
+                        "Bạn thao tác quá nhanh. Vui lòng thử lại sau ít phút.",
+                        status=429, content_type="text/plain; charset=utf-8",
+                    )
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,38 @@
+from django.db import transaction
+
+from .models import Account, KhachHang, EmailVerification
+from .tokens import use_stateless_tokens
+
+
+def register_account(cd):
+    """
+    Tạo Account + KhachHang (+ EmailVerification) trong một transaction.
+
+    Trùng email / số điện thoại / CCCD do đăng ký đồng thời sẽ nổi lên thành
+    IntegrityError từ ràng buộc unique và không để lại dữ liệu dở dang.
+    Trả về (account, verification); verification là None khi dùng token ký.
+    """
+    # Tách 'ten'
+    ten_parts = cd['ten'].split(' ')
+    first_name = ten_parts[0]
+    last_name = ' '.join(ten_parts[1:]) if len(ten_parts) > 1 else ''
+
+    with transaction.atomic():
+        account = Account.objects.create_user(
+            username=cd['email'],
+            email=cd['email'],
+            password=cd['password'],
+            first_name=first_name,
+            last_name=last_name,
+            is_active=False,
+            email_verified=False
+        )
+        KhachHang.objects.create(
+            account=account,
+            ten=cd['ten'],
+            so_dien_thoai=cd['so_dien_thoai'],
+            cccd=cd['cccd'],
+            email=cd['email']
+        )
+        verification = None if use_stateless_tokens() else EmailVerification.objects.create(account=account)
+    return account, verification
@@ -1,3 +1,378 @@
-from django.test import TestCase
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import SESSION_KEY, authenticate
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .emails import queue_email, send_pending
+from .forms import RegistrationForm
+from .middleware import AutoLogoutMiddleware, SessionRefreshMiddleware
+from .models import Account, EmailOutbox, EmailVerification, KhachHang, PasswordReset, TokenTableSnapshot
+from .ratelimit import client_ip, hit, ratelimit, stats
+from .services import register_account
+from .tokens import email_verification_token, password_reset_token
+
+
+class EmailOutboxTests(TestCase):
+    def test_queue_khong_gui_ngay(self):
+        queue_email("Tiêu đề", "Nội dung", ["a@example.com", "b@example.com"], html_message="<p>Nội dung</p>")
+        self.assertEqual(EmailOutbox.objects.filter(status="PENDING").count(), 2)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_gui_theo_lo_tren_mot_ket_noi(self):
+        queue_email("Tiêu đề", "Nội dung", [f"u{i}@example.com" for i in range(3)])
+        with mock.patch("users.emails.get_connection", wraps=mail.get_connection) as get_connection:
+            self.assertEqual(send_pending(), (3, 0))
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(EmailOutbox.objects.filter(status="SENT").count(), 3)
+        self.assertEqual(send_pending(), (0, 0))
+
+    def test_loi_giua_lo_mo_lai_ket_noi_mot_lan(self):
+        queue_email("Tiêu đề", "Nội dung", [f"u{i}@example.com" for i in range(3)])
+        gui = mail.EmailMultiAlternatives.send
+
+        def loi_o_email_thu_hai(message):
+            if message.to == ["u1@example.com"]:
+                raise SMTPException("mất kết nối")
+            return gui(message)
+
+        with mock.patch("users.emails.get_connection", wraps=mail.get_connection) as get_connection, \
+                mock.patch.object(locmem.EmailBackend, "open", autospec=True) as mo, \
+                mock.patch.object(mail.EmailMultiAlternatives, "send", autospec=True, side_effect=loi_o_email_thu_hai):
+            self.assertEqual(send_pending(), (2, 1))
+        get_connection.assert_called_once()
+        self.assertEqual(mo.call_count, 2)  # đầu lô + một lần sau lỗi
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_thu_lai_roi_danh_dau_loi(self):
+        queue_email("Tiêu đề", "Nội dung", ["a@example.com"])
+        with mock.patch("django.core.mail.EmailMultiAlternatives.send", side_effect=SMTPException("timeout")):
+            self.assertEqual(send_pending(max_attempts=2), (0, 1))
+            email = EmailOutbox.objects.get()
+            self.assertEqual((email.status, email.attempts, email.last_error), ("PENDING", 1, "timeout"))
+            self.assertEqual(send_pending(max_attempts=2), (0, 0))  # chưa tới hạn thử lại
+            self.assertEqual(send_pending(max_attempts=2, now=email.send_after), (0, 1))
+        self.assertEqual(EmailOutbox.objects.get().status, "FAILED")
+
+    def test_worker_chet_giua_lo_khong_gui_lai_email_da_gui(self):
+        queue_email("Tiêu đề", "Nội dung", [f"u{i}@example.com" for i in range(3)])
+        gui = mail.EmailMultiAlternatives.send
+
+        def chet_o_email_thu_hai(message):
+            trang_thai = dict(EmailOutbox.objects.values_list("recipient", "status"))
+            self.assertEqual(trang_thai[message.to[0]], "SENDING")  # đã nhận trước khi gửi
+            if message.to == ["u1@example.com"]:
+                raise KeyboardInterrupt
+            return gui(message)
+
+        with mock.patch("django.core.mail.EmailMultiAlternatives.send", autospec=True, side_effect=chet_o_email_thu_hai):
+            with self.assertRaises(KeyboardInterrupt):
+                send_pending()
+        self.assertEqual(
+            dict(EmailOutbox.objects.values_list("recipient", "status")),
+            {"u0@example.com": "SENT", "u1@example.com": "SENDING", "u2@example.com": "SENDING"},
+        )
+        self.assertEqual(send_pending(), (0, 0))  # chưa quá hạn nhận
+        with override_settings(EMAIL_OUTBOX_CLAIM_TIMEOUT=60):
+            self.assertEqual(send_pending(now=timezone.now() + timezone.timedelta(seconds=61)), (2, 0))
+        self.assertEqual([m.to for m in mail.outbox], [["u0@example.com"], ["u1@example.com"], ["u2@example.com"]])
+        self.assertEqual(EmailOutbox.objects.get(recipient="u1@example.com").attempts, 2)
+
+
+class EmailLookupTests(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(username="an", email="An.Nguyen@Example.com", password="matkhau123")
+
+    def test_dang_nhap_khong_phan_biet_hoa_thuong(self):
+        with self.assertNumQueries(1):
+            user = authenticate(username="  an.nguyen@example.COM", password="matkhau123")
+        self.assertEqual(user, self.account)
+
+    def test_email_trung_khac_hoa_thuong(self):
+        form = RegistrationForm(data={
+            "ten": "Nguyễn An", "cccd": "001", "so_dien_thoai": "0900000001",
+            "email": "an.nguyen@example.com", "password": "x", "password2": "x",
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn("email", form.errors)
+        with self.assertRaises(IntegrityError):
+            Account.objects.create_user(username="an2", email="AN.NGUYEN@example.com", password="x")
+
+    def test_doi_email_cap_nhat_cot_chuan_hoa(self):
+        self.account.email = "Moi@Example.com"
+        self.account.save(update_fields=["email"])
+        self.assertEqual(Account.objects.get(pk=self.account.pk).email_normalized, "moi@example.com")
+
+    def test_doi_email_bi_chiem_truoc_khi_luu(self):
+        Account.objects.create_user(username="binh", email="binh@example.com", password="x")
+        self.client.force_login(self.account)
+        # Tài khoản kia ghi email sau khi view đã kiểm tra: chỉ ràng buộc unique bắt được
+        with mock.patch("django.db.models.query.QuerySet.exists", return_value=False):
+            response = self.client.post(reverse("profile"), {"email": "Binh@Example.com", "ten": "An"})
+        self.assertRedirects(response, reverse("profile"), fetch_redirect_response=False)
+        thong_bao = [str(m) for m in response.wsgi_request._messages]
+        self.assertIn("Email đã được sử dụng bởi tài khoản khác!", thong_bao)
+        email = self.account.email
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.email, email)
+        self.assertEqual(KhachHang.objects.get(account=self.account).email, email)
+        self.assertEqual(KhachHang.objects.get(account=self.account).ten, "An")
+
+
+class EmailBackendTests(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(username="admin", email="an@example.com", password="matkhau123")
+
+    def test_dang_nhap_bang_username(self):
+        self.assertEqual(authenticate(username="admin", password="matkhau123"), self.account)
+
+    def test_sai_mat_khau_chi_bam_mot_lan(self):
+        with mock.patch.object(Account, "check_password", autospec=True, return_value=False) as check, \
+                self.assertNumQueries(1):
+            self.assertIsNone(authenticate(username="an@example.com", password="sai"))
+        check.assert_called_once()
+
+    def test_khong_co_tai_khoan_van_bam_gia(self):
+        with mock.patch.object(Account, "set_password", autospec=True) as set_password, self.assertNumQueries(1):
+            self.assertIsNone(authenticate(username="khongco@example.com", password="sai"))
+        set_password.assert_called_once()
+
+
+class SessionRefreshMiddlewareTests(TestCase):
+    def goi(self, session):
+        request = RequestFactory().get("/")
+        request.session = session
+        SessionRefreshMiddleware(lambda r: HttpResponse())(request)
+        return session
+
+    def test_chi_gia_han_sau_moi_khoang(self):
+        session = SessionStore()
+        session["last_activity"] = 1
+        session.modified = False
+        with mock.patch("users.middleware.time.time", return_value=1000):
+            self.assertTrue(self.goi(session).modified)
+        session.modified = False
+        with mock.patch("users.middleware.time.time", return_value=1030):
+            self.assertFalse(self.goi(session).modified)
+        with mock.patch("users.middleware.time.time", return_value=1060):
+            self.assertTrue(self.goi(session).modified)
+
+    def test_khong_tao_session_cho_khach_vang_lai(self):
+        session = self.goi(SessionStore())
+        self.assertFalse(session.modified)
+
+
+class AutoLogoutMiddlewareTests(TestCase):
+    def goi(self, last_activity, now):
+        session = SessionStore()
+        session[SESSION_KEY] = "1"
+        session["last_activity"] = last_activity
+        session.modified = False
+        request = RequestFactory().get("/")
+        request.session = session
+        with mock.patch("users.middleware.time.time", return_value=now), \
+                mock.patch("users.middleware.reverse", return_value="/accounts/login/"), \
+                self.assertNumQueries(0):
+            response = AutoLogoutMiddleware(lambda r: HttpResponse("ok"))(request)
+        return response, session
+
+    def test_trong_khoang_khong_ghi_session(self):
+        response, session = self.goi(1000, 1010)
+        self.assertEqual(response.content, b"ok")
+        self.assertFalse(session.modified)
+
+    def test_gia_han_theo_khoang_tho(self):
+        _, session = self.goi(1000, 1031)
+        self.assertTrue(session.modified)
+        self.assertEqual(session["last_activity"], 1031)
+
+    def test_het_han_chuyen_ve_login(self):
+        request = RequestFactory().get("/")
+        request.session = SessionStore()
+        request.session[SESSION_KEY] = "1"
+        request.session["last_activity"] = 1000
+        with mock.patch("users.middleware.time.time", return_value=1301), \
+                mock.patch("users.middleware.reverse", return_value="/accounts/login/"), \
+                mock.patch("users.middleware.logout") as logout:
+            response = AutoLogoutMiddleware(lambda r: HttpResponse("ok"))(request)
+        logout.assert_called_once_with(request)
+        self.assertEqual(response.url, "/accounts/login/?expired=1&reason=Timeout")
+
+
+class PurgeExpiredTokensTests(TestCase):
+    def test_xoa_token_het_han_theo_lo(self):
+        account = Account.objects.create_user(username="an", email="an@example.com", password="x")
+        qua_han = timezone.now() - timezone.timedelta(hours=1)
+        for _ in range(5):
+            EmailVerification.objects.create(account=account, expires_at=qua_han)
+        con_han = EmailVerification.objects.create(account=account)
+        PasswordReset.objects.create(account=account, expires_at=qua_han)
+
+        call_command("purge_expired_tokens", batch_size=2, pause=0, stdout=mock.MagicMock())
+
+        self.assertEqual(list(EmailVerification.objects.all()), [con_han])
+        self.assertFalse(PasswordReset.objects.exists())
+        snap = TokenTableSnapshot.objects.get(table_name=EmailVerification._meta.db_table)
+        self.assertEqual((snap.total_rows, snap.expired_rows, snap.deleted_rows), (1, 5, 5))
+
+
+class StatelessTokenTests(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(username="an", email="an@example.com", password="x", is_active=False)
+
+    def test_token_xac_thuc_chi_dung_mot_lan(self):
+        token = email_verification_token.make_token(self.account)
+        with self.assertNumQueries(1):
+            self.assertEqual(email_verification_token.check_token(token), (self.account, None))
+        self.account.is_active = self.account.email_verified = True
+        self.account.save()
+        self.assertEqual(email_verification_token.check_token(token)[1], "used")
+
+    def test_token_reset_het_hieu_luc_khi_doi_mat_khau(self):
+        token = password_reset_token.make_token(self.account)
+        self.assertIsNone(password_reset_token.check_token(token)[1])
+        self.account.set_password("moi")
+        self.account.save()
+        self.assertEqual(password_reset_token.check_token(token)[1], "used")
+
+    def test_token_het_han_va_sai_chu_ky(self):
+        token = password_reset_token.make_token(self.account)
+        with self.settings(PASSWORD_RESET_EXPIRE_HOURS=-1):
+            self.assertEqual(password_reset_token.check_token(token), (None, "expired"))
+        self.assertEqual(password_reset_token.check_token(token + "x"), (None, "invalid"))
+        self.assertEqual(email_verification_token.check_token(token), (None, "invalid"))
+
+
+class RegistrationTests(TestCase):
+    DATA = {
+        "ten": "Nguyễn Văn An", "cccd": "001200000001", "so_dien_thoai": "0900000001",
+        "email": "an@example.com", "password": "matkhau123", "password2": "matkhau123",
+    }
+
+    def test_kiem_tra_trung_trong_mot_query(self):
+        register_account(self.DATA)
+        form = RegistrationForm(data={**self.DATA, "email": "khac@example.com"})
+        with self.assertNumQueries(1):
+            self.assertFalse(form.is_valid())
+        self.assertEqual(set(form.errors), {"so_dien_thoai", "cccd"})
+
+    def test_dang_ky_hop_le(self):
+        form = RegistrationForm(data=self.DATA)
+        self.assertTrue(form.is_valid())
+        account, verification = register_account(form.cleaned_data)
+        self.assertEqual(account.khachhang.so_dien_thoai, "0900000001")
+        self.assertEqual(verification.account, account)
+
+    def test_trung_khi_ghi_thi_khong_de_lai_du_lieu_do_dang(self):
+        register_account(self.DATA)
+        with self.assertRaises(IntegrityError):
+            register_account({**self.DATA, "email": "khac@example.com", "cccd": "002"})
+        self.assertEqual(Account.objects.count(), 1)
+        self.assertEqual(KhachHang.objects.count(), 1)
+
+    def test_view_bao_loi_khi_bi_dang_ky_dong_thoi_chiem_truoc(self):
+        cache.clear()
+        # Người đăng ký đồng thời ghi cùng email sau khi form đã kiểm tra xong:
+        # form không thấy trùng, register_account gặp IntegrityError của email_normalized
+        register_account({**self.DATA, "so_dien_thoai": "0900000002", "cccd": "001200000002"})
+        with mock.patch("users.forms.find_conflicts", return_value={}):
+            response = self.client.post(reverse("register"), self.DATA)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.context["form"].errors), {"email"})
+        self.assertEqual(Account.objects.count(), 1)
+
+        # Không tìm ra trường trùng: vẫn hiện lỗi chung thay vì lỗi 500
+        data = {**self.DATA, "email": "moi@example.com", "so_dien_thoai": "0900000003", "cccd": "001200000003"}
+        with mock.patch("users.views.register_account", side_effect=IntegrityError):
+            response = self.client.post(reverse("register"), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["form"].non_field_errors(), ["Đăng ký không thành công, vui lòng thử lại."])
+
+
+    def test_loi_ghi_outbox_huy_dang_ky(self):
+        cache.clear()
+        with mock.patch("users.views.queue_email", side_effect=DatabaseError("outbox")):
+            with self.assertRaises(DatabaseError):
+                self.client.post(reverse("register"), self.DATA)
+        self.assertFalse(Account.objects.exists())
+        self.assertFalse(KhachHang.objects.exists())
+
+        response = self.client.post(reverse("register"), self.DATA)
+        self.assertRedirects(response, reverse("login"), fetch_redirect_response=False)
+        self.assertEqual(EmailOutbox.objects.get().recipient, "an@example.com")
+
+
+@override_settings(RATELIMITS={"login": {"ip": "3/m", "email": "2/m"}})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.view = mock.Mock(return_value=HttpResponse("ok"))
+        self.limited = ratelimit("login", email_field="username")(self.view)
+
+    def post(self, username, ip="10.0.0.1"):
+        return self.limited(self.factory.post("/login/", {"username": username}, REMOTE_ADDR=ip))
+
+    def test_chan_theo_email_truoc_khi_goi_view(self):
+        self.assertEqual(self.post("An@Example.com").status_code, 200)
+        self.assertEqual(self.post("an@example.com", ip="10.0.0.2").status_code, 200)
+        self.assertEqual(self.post("an@example.com", ip="10.0.0.3").status_code, 429)
+        self.assertEqual(self.view.call_count, 2)
+        self.assertEqual(self.post("khac@example.com", ip="10.0.0.4").status_code, 200)
+
+    def test_chan_theo_ip(self):
+        for i in range(3):
+            self.assertEqual(self.post(f"u{i}@example.com").status_code, 200)
+        self.assertEqual(self.post("u9@example.com").status_code, 429)
+        self.assertEqual(stats(["login"]), {"login": {"checked": 4, "blocked": 1}})
+
+    @override_settings(RATELIMIT_IP_HEADER="HTTP_X_FORWARDED_FOR", RATELIMIT_TRUSTED_PROXIES=1)
+    def test_x_forwarded_for_gia_mao_khong_reset_bo_dem(self):
+        for i in range(4):
+            request = self.factory.post(
+                "/login/", {"username": f"u{i}@example.com"},
+                REMOTE_ADDR="127.0.0.1", HTTP_X_FORWARDED_FOR=f"1.2.3.{i}, 203.0.113.7",
+            )
+            self.assertEqual(client_ip(request), "203.0.113.7")
+            self.assertEqual(self.limited(request).status_code, 200 if i < 3 else 429)
+
+        with override_settings(RATELIMIT_TRUSTED_PROXIES=2):
+            request = self.factory.post("/", HTTP_X_FORWARDED_FOR="1.2.3.4, 203.0.113.7, 10.0.0.9")
+            self.assertEqual(client_ip(request), "203.0.113.7")
+
+    def test_get_khong_bi_gioi_han(self):
+        for _ in range(5):
+            self.assertEqual(self.limited(self.factory.get("/login/")).status_code, 200)
+        self.assertEqual(stats(["login"]), {"login": {"checked": 0, "blocked": 0}})
+
+    def test_cua_so_truot(self):
+        # 2 request cuối cửa sổ trước vẫn được tính một phần ở đầu cửa sổ sau
+        self.assertTrue(hit("t", "x", "2/m", now=119))
+        self.assertTrue(hit("t", "x", "2/m", now=119))
+        self.assertFalse(hit("t", "x", "2/m", now=121))
+        self.assertTrue(hit("t", "y", "2/m", now=170))
+
+
+class AdminDashboardTests(TestCase):
+    def test_chi_nhan_vien_xem_duoc(self):
+        url = reverse("dashboard")
+        khach = Account.objects.create_user(username="khach", email="khach@example.com", password="x")
+        self.client.force_login(khach)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        staff = Account.objects.create_user(username="staff", email="staff@example.com", password="x", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["tong"]["so_chuyen"], 0)
+        self.assertEqual(self.client.get(url, {"tu_ngay": "2025-02-01", "den_ngay": "2025-01-01"}).status_code, 200)
@@ -0,0 +1,76 @@
+"""
+Token không trạng thái (ký HMAC, có thời điểm tạo) cho xác thực email và
+reset mật khẩu, dùng khi STATELESS_TOKENS = True.
+
+Token chứa id tài khoản và một HMAC của "trạng thái" tài khoản. Khi trạng thái
+đổi (email đã xác thực, mật khẩu đã đổi) token cũ tự mất hiệu lực, nên token
+chỉ dùng được một lần mà không cần bảng EmailVerification / PasswordReset.
+"""
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .models import Account
+
+
+def use_stateless_tokens():
+    return getattr(settings, 'STATELESS_TOKENS', False)
+
+
+class StatelessTokenGenerator:
+    salt = None
+    expire_setting = None
+    default_expire_hours = 1
+
+    def _state(self, account):
+        raise NotImplementedError
+
+    def _state_hash(self, account):
+        return salted_hmac(self.salt, self._state(account)).hexdigest()[:20]
+
+    @property
+    def max_age(self):
+        return getattr(settings, self.expire_setting, self.default_expire_hours) * 3600
+
+    def make_token(self, account):
+        return signing.dumps({"u": account.pk, "s": self._state_hash(account)}, salt=self.salt)
+
+    def check_token(self, token):
+        """
+        Trả về (account, loi). `loi` là None nếu hợp lệ, hoặc một trong
+        'expired', 'invalid', 'used'.
+        """
+        try:
+            data = signing.loads(token, salt=self.salt, max_age=self.max_age)
+        except signing.SignatureExpired:
+            return None, "expired"
+        except signing.BadSignature:
+            return None, "invalid"
+        account = Account.objects.filter(pk=data.get("u")).first()
+        if account is None:
+            return None, "invalid"
+        if not constant_time_compare(data.get("s", ""), self._state_hash(account)):
+            return account, "used"
+        return account, None
+
+
+class EmailVerificationTokenGenerator(StatelessTokenGenerator):
+    salt = "users.tokens.EmailVerificationTokenGenerator"
+    expire_setting = "EMAIL_VERIFICATION_EXPIRE_HOURS"
+    default_expire_hours = 24
+
+    def _state(self, account):
+        return f"{account.pk}{account.email}{account.email_verified}{account.is_active}"
+
+
+class PasswordResetTokenGenerator(StatelessTokenGenerator):
+    salt = "users.tokens.PasswordResetTokenGenerator"
+    expire_setting = "PASSWORD_RESET_EXPIRE_HOURS"
+
+    def _state(self, account):
+        last_login = "" if account.last_login is None else account.last_login.replace(microsecond=0, tzinfo=None)
+        return f"{account.pk}{account.password}{last_login}"
+
+
+email_verification_token = EmailVerificationTokenGenerator()
+password_reset_token = PasswordResetTokenGenerator()
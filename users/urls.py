@@ -11,6 +11,11 @@ urlpatterns = [
          views.verify_email_view, 
          name='verify_email'),
 
+    # Token ký không lưu DB (khi STATELESS_TOKENS = True)
+    path('verify-email/s/<str:token>/', 
+         views.verify_email_signed_view, 
+         name='verify_email_signed'),
+
     # THÊM: Đường dẫn để gửi lại email xác thực
     path('resend-verification/', 
          views.resend_verification, 
@@ -29,6 +34,10 @@ urlpatterns = [
          views.password_reset_confirm_view, 
          name='password_reset_confirm'),
 
+    path('password-reset/confirm/s/<str:token>/', 
+         views.password_reset_confirm_signed_view, 
+         name='password_reset_confirm_signed'),
+
     # --- 4. Profile & Dashboard ---
     # THÊM: Đường dẫn cho trang profile
     path('profile/', views.user_profile, name='profile'),
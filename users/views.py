@@ -1,91 +1,103 @@
 # users/views.py
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
+from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import AuthenticationForm, SetPasswordForm
 from django.contrib.auth.decorators import login_required, user_passes_test
-from datetime import datetime
+from django.db import IntegrityError, transaction
+from datetime import datetime, timedelta
+import logging
 import time # Import time để quản lý session
 
 # Import các form và model của bạn
-from .forms import RegistrationForm, CustomPasswordResetRequestForm
-from .models import Account, KhachHang, EmailVerification, PasswordReset, Ve
+from .forms import RegistrationForm, CustomPasswordResetRequestForm, find_conflicts
+from .emails import queue_email
+from .models import Account, KhachHang, EmailVerification, PasswordReset
+from .ratelimit import ratelimit
+from .services import register_account
+from .tokens import email_verification_token, password_reset_token, use_stateless_tokens
+from booking.forms import KhoangNgayForm
+from booking.models import Ve
+from booking.reports import dashboard_stats
+
+logger = logging.getLogger(__name__)
 
 # ===============================================
 # === HELPER: CÁC HÀM GỬI EMAIL (TỪ AUTH_VIEWS.PY)
 # ===============================================
 
-def send_verification_email(request, account, verification):
-    """Gửi email xác thực (Logic từ auth_views.py)"""
-    try:
-        # Đã bỏ 'src:' namespace
-        verification_url = request.build_absolute_uri(
-            reverse('verify_email', kwargs={'token': verification.token})
-        )
-        
-        subject = 'Xác thực tài khoản BookingTicket'
-        # Dùng template path cũ của bạn
-        html_message = render_to_string('users/verify_email_body.html', {
-            'user': account,
-            'ten': account.khachhang.ten,
-            'verify_url': verification_url,
-            'expire_hours': getattr(settings, 'EMAIL_VERIFICATION_EXPIRE_HOURS', 24),
-        })
-        plain_message = strip_tags(html_message)
-        
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[account.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        print(f"Email verification sent to {account.email}")
-    except Exception as e:
-        print(f"Error sending email: {str(e)}")
-        pass
+def send_verification_email(request, account, verification=None):
+    """
+    Ghi email xác thực vào outbox (Logic từ auth_views.py). Không có `verification`
+    thì dùng token ký.
 
-def send_password_reset_email(request, account, reset_token):
-    """Gửi email khôi phục mật khẩu (Logic từ auth_views.py)"""
-    try:
-        # Đã bỏ 'src:' namespace
-        reset_url = request.build_absolute_uri(
-            reverse('password_reset_confirm', kwargs={'token': reset_token.token})
-        )
-        
-        subject = 'Khôi phục mật khẩu BookingTicket'
-        # Dùng template path cũ của bạn
-        html_message = render_to_string('users/password_reset_email.html', {
-            'user': account,
-            'username': account.khachhang.ten,
-            'reset_url': reset_url,
-            'expire_hours': getattr(settings, 'PASSWORD_RESET_EXPIRE_HOURS', 1),
-        })
-        plain_message = strip_tags(html_message)
-        
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[account.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        print(f"Password reset email sent to {account.email}")
-    except Exception as e:
-        print(f"Error sending password reset email: {str(e)}")
-        pass
+    Lỗi ghi outbox được để lọt ra ngoài: hàm chạy trong transaction đăng ký,
+    nuốt lỗi ở đây sẽ tạo tài khoản không có email xác thực. Lỗi SMTP do worker
+    send_queued_emails xử lý, ngoài transaction.
+    """
+    # Đã bỏ 'src:' namespace
+    if verification is None:
+        url = reverse('verify_email_signed', kwargs={'token': email_verification_token.make_token(account)})
+    else:
+        url = reverse('verify_email', kwargs={'token': verification.token})
+    verification_url = request.build_absolute_uri(url)
+
+    subject = 'Xác thực tài khoản BookingTicket'
+    # Dùng template path cũ của bạn
+    html_message = render_to_string('users/verify_email.html', {
+        'user': account,
+        'ten': account.khachhang.ten,
+        'verify_url': verification_url,
+        'expire_hours': getattr(settings, 'EMAIL_VERIFICATION_EXPIRE_HOURS', 24),
+    })
+    plain_message = strip_tags(html_message)
+
+    # Chỉ ghi vào outbox, worker send_queued_emails sẽ gửi qua SMTP
+    queue_email(
+        subject=subject,
+        message=plain_message,
+        recipient_list=[account.email],
+        html_message=html_message,
+    )
+    logger.info("Email verification queued for %s", account.email)
+
+def send_password_reset_email(request, account, reset_token=None):
+    """Ghi email khôi phục mật khẩu vào outbox. Không có `reset_token` thì dùng token ký."""
+    # Đã bỏ 'src:' namespace
+    if reset_token is None:
+        url = reverse('password_reset_confirm_signed', kwargs={'token': password_reset_token.make_token(account)})
+    else:
+        url = reverse('password_reset_confirm', kwargs={'token': reset_token.token})
+    reset_url = request.build_absolute_uri(url)
+
+    subject = 'Khôi phục mật khẩu BookingTicket'
+    # Dùng template path cũ của bạn
+    html_message = render_to_string('users/password_reset_email.html', {
+        'user': account,
+        'username': account.khachhang.ten,
+        'reset_url': reset_url,
+        'expire_hours': getattr(settings, 'PASSWORD_RESET_EXPIRE_HOURS', 1),
+    })
+    plain_message = strip_tags(html_message)
+
+    queue_email(
+        subject=subject,
+        message=plain_message,
+        recipient_list=[account.email],
+        html_message=html_message,
+    )
+    logger.info("Password reset email queued for %s", account.email)
 
 # ===============================================
 # === 1. ĐĂNG KÝ (GIỮ NGUYÊN FORM, THÊM HELPER)
 # ===============================================
 
+@ratelimit('register')
 def register_view(request):
     """
     Trang đăng ký (Giữ nguyên cấu trúc dùng RegistrationForm)
@@ -97,37 +109,21 @@ def register_view(request):
         form = RegistrationForm(request.POST)
         if form.is_valid():
             cd = form.cleaned_data
-            
-            # Tách 'ten'
-            ten_parts = cd['ten'].split(' ')
-            first_name = ten_parts[0]
-            last_name = ' '.join(ten_parts[1:]) if len(ten_parts) > 1 else ''
-
-            account = Account.objects.create_user(
-                username=cd['email'], 
-                email=cd['email'],
-                password=cd['password'],
-                first_name=first_name,
-                last_name=last_name,
-                is_active=False,
-                email_verified=False
-            )
-
-            KhachHang.objects.create(
-                account=account,
-                ten=cd['ten'],
-                so_dien_thoai=cd['so_dien_thoai'],
-                cccd=cd['cccd'],
-                email=cd['email'] # Thêm email nếu model KhachHang của bạn có
-            )
-
-            # Tạo token và GỌI HELPER
-            verification = EmailVerification.objects.create(account=account)
-            send_verification_email(request, account, verification)
-            
-            messages.success(request, f'Đăng ký thành công! Vui lòng kiểm tra email {cd["email"]} để xác thực tài khoản.')
-            # Redirect về trang login (không có namespace 'src:')
-            return redirect('login')
+            try:
+                # Tài khoản, khách hàng, token và email trong outbox được ghi cùng một transaction
+                with transaction.atomic():
+                    account, verification = register_account(cd)
+                    send_verification_email(request, account, verification)
+            except IntegrityError:
+                # Bị người đăng ký đồng thời chiếm trước: báo lại đúng trường bị trùng
+                for field, message in find_conflicts(cd['email'], cd['so_dien_thoai'], cd['cccd']).items():
+                    form.add_error(field, message)
+                if not form.errors:
+                    form.add_error(None, 'Đăng ký không thành công, vui lòng thử lại.')
+            else:
+                messages.success(request, f'Đăng ký thành công! Vui lòng kiểm tra email {cd["email"]} để xác thực tài khoản.')
+                # Redirect về trang login (không có namespace 'src:')
+                return redirect('login')
     else:
         form = RegistrationForm()
         
@@ -138,6 +134,7 @@ def register_view(request):
 # === 2. ĐĂNG NHẬP (SỬA LỖI & MERGE LOGIC)
 # ===============================================
 
+@ratelimit('login', email_field='username')
 def login_view(request):
     """
     Trang đăng nhập (Sửa lỗi và merge logic từ auth_views.py)
@@ -249,15 +246,39 @@ def verify_email_view(request, token):
         messages.error(request, 'Link xác thực không hợp lệ!')
         return redirect('login')
 
+def verify_email_signed_view(request, token):
+    """Xác thực email bằng token ký (STATELESS_TOKENS), không đọc bảng EmailVerification"""
+    account, error = email_verification_token.check_token(token)
+    if error == 'expired':
+        messages.error(request, 'Link xác thực đã hết hạn!')
+        return redirect('resend_verification')
+    if error == 'used':
+        messages.error(request, 'Link xác thực đã được sử dụng!')
+        return redirect('login')
+    if error:
+        messages.error(request, 'Link xác thực không hợp lệ!')
+        return redirect('login')
+
+    account.is_active = True
+    account.email_verified = True
+    account.save(update_fields=['is_active', 'email_verified'])
+
+    messages.success(request, 'Xác thực email thành công! Bạn có thể đăng nhập.')
+    return redirect('login')
+
 # Thêm view Gửi lại email (từ auth_views.py, bỏ 'src:')
+@ratelimit('resend_verification')
 def resend_verification(request):
     """Gửi lại email xác thực"""
     if request.method == 'POST':
         email = request.POST.get('email')
         try:
-            account = Account.objects.get(email=email, is_active=False)
-            EmailVerification.objects.filter(account=account, is_used=False).update(is_used=True)
-            verification = EmailVerification.objects.create(account=account)
+            account = Account.objects.get(email_normalized=Account.normalize_email_key(email), is_active=False)
+            if use_stateless_tokens():
+                verification = None
+            else:
+                EmailVerification.objects.filter(account=account, is_used=False).update(is_used=True)
+                verification = EmailVerification.objects.create(account=account)
             send_verification_email(request, account, verification)
             
             messages.success(request, f'Email xác thực đã được gửi lại tới {email}')
@@ -273,6 +294,7 @@ def resend_verification(request):
 # === 5. RESET MẬT KHẨU (GIỮ FORM, MERGE LOGIC)
 # ===============================================
 
+@ratelimit('password_reset')
 def password_reset_request_view(request):
     """
     Trang yêu cầu reset (Giữ CustomPasswordResetRequestForm, merge logic)
@@ -281,13 +303,16 @@ def password_reset_request_view(request):
         form = CustomPasswordResetRequestForm(request.POST)
         if form.is_valid():
             email = form.cleaned_data['email']
-            account = Account.objects.get(email=email, is_active=True)
-            
-            # Vô hiệu hóa token cũ (Logic từ auth_views.py)
-            PasswordReset.objects.filter(account=account, is_used=False).update(is_used=True)
+            account = Account.objects.get(email_normalized=Account.normalize_email_key(email), is_active=True)
             
-            # Tạo token mới
-            reset_token = PasswordReset.objects.create(account=account)
+            if use_stateless_tokens():
+                reset_token = None
+            else:
+                # Vô hiệu hóa token cũ (Logic từ auth_views.py)
+                PasswordReset.objects.filter(account=account, is_used=False).update(is_used=True)
+
+                # Tạo token mới
+                reset_token = PasswordReset.objects.create(account=account)
             
             # GỌI HELPER
             send_password_reset_email(request, account, reset_token)
@@ -342,6 +367,35 @@ def password_reset_confirm_view(request, token):
         messages.error(request, 'Token không hợp lệ hoặc không tồn tại.')
         return redirect('login')
 
+def password_reset_confirm_signed_view(request, token):
+    """Đặt lại MK bằng token ký (STATELESS_TOKENS), không đọc bảng PasswordReset"""
+    account, error = password_reset_token.check_token(token)
+    if error == 'expired':
+        messages.error(request, 'Link khôi phục đã hết hạn!')
+        return redirect('password_reset_request')
+    if error == 'used':
+        messages.error(request, 'Link khôi phục đã được sử dụng!')
+        return redirect('login')
+    if error:
+        messages.error(request, 'Token không hợp lệ hoặc không tồn tại.')
+        return redirect('login')
+
+    if request.method == 'POST':
+        # Đổi mật khẩu làm thay đổi hash nên token này tự hết hiệu lực
+        form = SetPasswordForm(user=account, data=request.POST)
+        if form.is_valid():
+            form.save()
+            messages.success(request, 'Đổi mật khẩu thành công! Bạn có thể đăng nhập.')
+            return redirect('login')
+    else:
+        form = SetPasswordForm(user=account)
+
+    return render(request, 'users/password_reset_confirm.html', {
+        'form': form,
+        'token': token,
+        'account': account
+    })
+
 # ===============================================
 # === 6. PROFILE & ADMIN (TỪ AUTH_VIEWS.PY)
 # ===============================================
@@ -376,11 +430,23 @@ def user_profile(request):
         
         new_email = request.POST.get('email', request.user.email)
         if new_email != request.user.email:
-            if not Account.objects.filter(email=new_email).exclude(id=request.user.id).exists():
+            email_cu = request.user.email
+            da_dung = Account.objects.filter(
+                email_normalized=Account.normalize_email_key(new_email)
+            ).exclude(id=request.user.id).exists()
+            if not da_dung:
                 request.user.email = new_email
-                khach_hang.email = new_email
-                request.user.save()
-            else:
+                try:
+                    # Tài khoản khác vẫn có thể ghi cùng email sau bước kiểm tra
+                    # trên; ràng buộc unique của email_normalized là chốt cuối
+                    with transaction.atomic():
+                        request.user.save()
+                except IntegrityError:
+                    request.user.email = email_cu
+                    da_dung = True
+                else:
+                    khach_hang.email = new_email
+            if da_dung:
                 messages.error(request, 'Email đã được sử dụng bởi tài khoản khác!')
                 
         khach_hang.save()
@@ -393,3 +459,22 @@ def user_profile(request):
     }
     # Dùng template path của bạn (nếu có)
     return render(request, 'users/profile.html', context)
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def admin_dashboard(request):
+    """
+    Trang tổng quan cho nhân viên: vé đã bán, doanh thu, tỉ lệ lấp đầy theo
+    tuyến / xe và thanh toán đang chờ. Số liệu đọc từ bảng thống kê ngày
+    (refresh_daily_stats), mặc định 30 ngày trước tới 7 ngày tới.
+    """
+    hom_nay = timezone.localdate()
+    form = KhoangNgayForm(request.GET or {
+        'tu_ngay': hom_nay - timedelta(days=29), 'den_ngay': hom_nay + timedelta(days=7),
+    })
+    context = {'form': form}
+    if form.is_valid():
+        context.update(dashboard_stats(form.cleaned_data['tu_ngay'], form.cleaned_data['den_ngay']))
+    return render(request, 'users/dashboard.html', context)
+